@@ -17,5 +17,11 @@ case "$1" in
             --access-logfile=- \
             --worker-class=meinheld.gmeinheld.MeinheldWorker
         ;;
+    run_async)
+        exec gunicorn percolator.api.asgi:app \
+            --bind 0.0.0.0:5000 \
+            --access-logfile=- \
+            --worker-class=uvicorn.workers.UvicornWorker
+        ;;
     *)
 esac
@@ -1,15 +1,44 @@
-from apistar import App
-
 from .routes import routes
+from .streaming import App
+from .hooks import MetricsHook, GzipHook
 from .components import (
-    ElasticSearchClientComponent, RequestStreamComponent, MultiPartParserComponent
+    ElasticSearchClientComponent,
+    DomainRegistryComponent,
+    HTTPClientComponent,
+    TagCacheComponent,
+    ExtractionCacheComponent,
+    RequestStreamComponent,
+    RequestBodyComponent,
+    MultiPartParserComponent,
 )
 from percolator.conf import settings
 
+es_client_component = ElasticSearchClientComponent(hosts=settings.ELASTICSEARCH_HOSTS)
+
 components = [
-    ElasticSearchClientComponent(hosts=settings.ELASTICSEARCH_HOSTS),
+    es_client_component,
+    DomainRegistryComponent(client=es_client_component.client, warmup=True),
+    HTTPClientComponent(
+        pool_size=settings.HTTP_POOL_SIZE,
+        connect_timeout=settings.TIKA_CONNECT_TIMEOUT,
+        read_timeout=settings.TIKA_READ_TIMEOUT,
+        retries=settings.HTTP_RETRIES,
+        backoff_factor=settings.HTTP_BACKOFF_FACTOR,
+        keep_alive=settings.HTTP_KEEP_ALIVE,
+    ),
+    TagCacheComponent(
+        max_entries=settings.TAG_CACHE_SIZE,
+        path=settings.TAG_CACHE_DIR,
+        max_bytes=settings.TAG_CACHE_DIR_MAX_BYTES,
+        generation_ttl=settings.TAG_CACHE_GENERATION_TTL,
+    ),
+    ExtractionCacheComponent(
+        path=settings.TIKA_CACHE_DIR,
+        max_bytes=settings.TIKA_CACHE_MAX_BYTES,
+    ),
     RequestStreamComponent(),
-    MultiPartParserComponent(),
+    RequestBodyComponent(max_bytes=settings.REQUEST_MAX_BYTES),
+    MultiPartParserComponent(streaming=settings.FORM_STREAMING),
 ]
 
 app = App(
@@ -17,4 +46,5 @@ app = App(
     components=components,
     static_dir=settings.STATIC_DIR,
     template_dir=settings.TEMPLATES_DIR,
+    event_hooks=[MetricsHook, GzipHook],
 )
@@ -0,0 +1,94 @@
+"""
+Asynchronous (ASGI) flavour of the API, served e.g. by uvicorn workers.
+
+ElasticSearch and Tika are called without blocking the event loop, so a single worker can
+have many slow extractions in flight.
+"""
+import io
+import logging
+
+from apistar import http
+from apistar.server.components import Component
+from elasticsearch_async import AsyncElasticsearch
+
+from .async_routes import routes
+from .streaming import ASyncApp
+from .hooks import MetricsHook, GzipHook, WarmupHook
+from .components import (
+    TagCacheComponent,
+    ExtractionCacheComponent,
+    DomainRegistryComponent,
+    RequestBody,
+    read_body,
+)
+from ..core.aio import AsyncHTTPClient
+from percolator.conf import settings
+
+log = logging.getLogger(__name__)
+
+
+class AsyncElasticSearchClientComponent(Component):
+    def __init__(self, hosts):
+        self.client = AsyncElasticsearch(hosts=hosts, timeout=20)
+        log.info('Async ElasticSearch connection created')
+        log.debug(f'Async ElasticSearch connection to {hosts}')
+
+    def resolve(self) -> AsyncElasticsearch:
+        return self.client
+
+
+class AsyncHTTPClientComponent(Component):
+    def __init__(self, **options):
+        self.client = AsyncHTTPClient(**options)
+        log.info('Async HTTP client created')
+        log.debug(f'Async HTTP client options: {options}')
+
+    def resolve(self) -> AsyncHTTPClient:
+        return self.client
+
+
+class ASGIRequestBodyComponent(Component):
+    """Provides the request body, received in full, decompressed, see `read_body()`."""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+
+    def resolve(self, headers: http.Headers, body: http.Body) -> RequestBody:
+        return RequestBody(
+            read_body(io.BytesIO(body), headers.get('Content-Encoding'), self.max_bytes)
+        )
+
+
+es_client_component = AsyncElasticSearchClientComponent(hosts=settings.ELASTICSEARCH_HOSTS)
+
+components = [
+    es_client_component,
+    DomainRegistryComponent(client=es_client_component.client),
+    AsyncHTTPClientComponent(
+        pool_size=settings.HTTP_POOL_SIZE,
+        connect_timeout=settings.TIKA_CONNECT_TIMEOUT,
+        read_timeout=settings.TIKA_READ_TIMEOUT,
+        retries=settings.HTTP_RETRIES,
+        backoff_factor=settings.HTTP_BACKOFF_FACTOR,
+        keep_alive=settings.HTTP_KEEP_ALIVE,
+    ),
+    TagCacheComponent(
+        max_entries=settings.TAG_CACHE_SIZE,
+        path=settings.TAG_CACHE_DIR,
+        max_bytes=settings.TAG_CACHE_DIR_MAX_BYTES,
+        generation_ttl=settings.TAG_CACHE_GENERATION_TTL,
+    ),
+    ExtractionCacheComponent(
+        path=settings.TIKA_CACHE_DIR,
+        max_bytes=settings.TIKA_CACHE_MAX_BYTES,
+    ),
+    ASGIRequestBodyComponent(max_bytes=settings.REQUEST_MAX_BYTES),
+]
+
+app = ASyncApp(
+    routes=routes,
+    components=components,
+    static_dir=settings.STATIC_DIR,
+    template_dir=settings.TEMPLATES_DIR,
+    event_hooks=[WarmupHook, MetricsHook, GzipHook],
+)
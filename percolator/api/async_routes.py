@@ -0,0 +1,27 @@
+from apistar import Route
+from .async_views import (
+    home,
+    list_tag_domains,
+    extract_from_text,
+    extract_from_url,
+    extract_from_form,
+    extract_batch,
+    get_taxon_details,
+    get_taxa_batch,
+    ready,
+    metrics,
+)
+
+
+routes = [
+    Route('/', method='GET', handler=home),
+    Route('/domains', method='GET', handler=list_tag_domains),
+    Route('/tag', method='POST', handler=extract_from_text),
+    Route('/tag/url', method='POST', handler=extract_from_url),
+    Route('/tag/form', method='POST', handler=extract_from_form),
+    Route('/tag/batch', method='POST', handler=extract_batch),
+    Route('/taxa', method='GET', handler=get_taxon_details),
+    Route('/taxa/batch', method='POST', handler=get_taxa_batch),
+    Route('/ready', method='GET', handler=ready),
+    Route('/metrics', method='GET', handler=metrics),
+]
@@ -0,0 +1,399 @@
+import asyncio
+import time
+
+import aiohttp
+
+from apistar import http
+from apistar.http import Response, Headers, QueryParams
+from apistar.exceptions import BadRequest, NotFound
+
+from percolator.conf import settings
+from ..search import TAG_DOMAINS, DomainRegistry, MultiTagger
+from ..search.cache import TagCache
+from ..core.aio import AsyncHTTPClient, extract_text_async, extract_text_from_url_async
+from ..core.text import ExtractionCache
+from ..core.compaction import compact_text
+from ..core.metrics import TEXT_SIZE
+from ..core.exceptions import TextExtractionError, TextExtractionTimeout, DocumentTooLarge
+from .streaming import NDJSONResponse
+from .components import RequestBody
+from .views import (
+    TextExtractionJSONParams,
+    URLExtractionJSONParams,
+    BatchExtractionJSONParams,
+    TaxaBatchParams,
+    check_stream_params,
+    stream_params,
+    page_positions,
+    page_result,
+    page_params,
+    detail_tags,
+    taxon_lookups,
+    parse_form,
+    parse_text_request,
+    extraction_error_message,
+    prepare_taxa_queries,
+    taxa_batch_results,
+    readiness_check,
+    readiness_response,
+    metrics,
+    domains_details,
+    home,
+)
+
+
+async def list_tag_domains(registry: DomainRegistry) -> dict:
+    """Lists tag domains, see `views.list_tag_domains()`."""
+    return domains_details(registry.stats.get_async())
+
+
+async def get_documents_tags(
+    domains,
+    registry,
+    texts,
+    min_score=None,
+    constant_score=True,
+    offset=None,
+    limit=None,
+    tag_cache=None,
+    mentions=False,
+    enrich=False,
+    mentions_texts=None,
+):
+    """
+    Fetches tags for several texts and domains, in a single search request.
+    See `views.get_documents_tags()`.
+    """
+    taggers = registry.get_taggers(domains)
+    params = dict(min_score=min_score, constant_score=constant_score, offset=offset, limit=limit)
+
+    generations = None
+    if tag_cache is not None:
+        generations = {
+            domain: await tag_cache.generation_async(domain, tagger)
+            for domain, tagger in taggers.items()
+        }
+
+    results = [{} for _ in texts]
+    jobs = []
+    keys = []
+    for i, text in enumerate(texts):
+        TEXT_SIZE.observe(len(text))
+        digest = tag_cache.digest(text) if tag_cache is not None else None
+        for domain in taggers:
+            key = None
+            if tag_cache is not None:
+                key = tag_cache.key(domain, generations[domain], digest, **params)
+                cached = tag_cache.get(key)
+                if cached is not None:
+                    results[i][domain] = cached
+                    continue
+            jobs.append((i, domain))
+            keys.append(key)
+
+    if jobs:
+        found = await MultiTagger(taggers).percolate_async(
+            [(domain, texts[i]) for i, domain in jobs], generations=generations, **params
+        )
+        for (i, domain), key, domain_tags in zip(jobs, keys, found):
+            if tag_cache is not None:
+                tag_cache.set(key, domain_tags)
+            results[i][domain] = domain_tags
+
+    results = [{domain: r[domain] for domain in taggers} for r in results]
+    if mentions or enrich:
+        taxa = await get_taxa(results, registry) if enrich else None
+        results = [
+            detail_tags(r, text, registry, mentions, taxa)
+            for r, text in zip(results, mentions_texts or texts)
+        ]
+    return results
+
+
+async def get_taxa(results, registry):
+    """Looks up the taxa of all the tags in `results`, see `views.get_taxa()`."""
+    lookups = list(taxon_lookups(results, registry))
+    found = await asyncio.gather(*(
+        taxon_indexer.get_taxa_async(tags) for _, taxon_indexer, tags in lookups
+    ))
+    return {domain: taxa for (domain, _, _), taxa in zip(lookups, found)}
+
+
+async def get_domains_tags(domains, registry, text, mentions_text=None, **kwargs):
+    """Fetches tags for several domains, see `get_documents_tags()`."""
+    mentions_texts = [mentions_text] if mentions_text else None
+    results = await get_documents_tags(
+        domains, registry, [text], mentions_texts=mentions_texts, **kwargs
+    )
+    return results[0]
+
+
+async def iter_tag_records(
+    domains, registry, text, min_score=None, constant_score=True, document=None
+):
+    """Async generator of all the tag records of a text, see `views.iter_tag_records()`."""
+    TEXT_SIZE.observe(len(text))
+    taggers = registry.get_taggers(domains)
+    for domain, tagger in taggers.items():
+        async for tag, score in tagger.iter_tags_async(text, min_score, constant_score):
+            record = {'domain': domain, 'tag': tag, 'score': score}
+            if document is not None:
+                record = {'document': document, **record}
+            yield record
+
+
+async def _iter_batch_records(params, registry, extracted):
+    for i, (text, _, error) in enumerate(extracted):
+        if error is not None:
+            yield {'document': i, 'error': error}
+            continue
+        records = iter_tag_records(
+            registry=registry, text=text, document=i, **stream_params(params)
+        )
+        async for record in records:
+            yield record
+
+
+def stream_tags(params, registry, text):
+    return NDJSONResponse(iter_tag_records(registry=registry, text=text, **stream_params(params)))
+
+
+async def get_tags_page(
+    domains,
+    registry,
+    text,
+    cursor=None,
+    min_score=None,
+    constant_score=True,
+    limit=None,
+    mentions=False,
+    enrich=False,
+    mentions_text=None,
+):
+    """Fetches a page of tags for several domains, see `views.get_tags_page()`."""
+    TEXT_SIZE.observe(len(text))
+    min_score = float(min_score) if min_score is not None else None  # Same digest for 1 and 1.0
+    params = dict(min_score=min_score, constant_score=constant_score, limit=limit)
+    positions = page_positions(domains, registry, text, cursor, params)
+    pages = await MultiTagger(registry.get_taggers(positions)).percolate_pages_async(
+        [(domain, text, after) for domain, after in positions.items()],
+        min_score,
+        constant_score,
+        limit,
+    )
+    tags = {domain: page_tags for domain, (page_tags, _) in zip(positions, pages)}
+    if mentions or enrich:
+        taxa = await get_taxa([tags], registry) if enrich else None
+        tags = detail_tags(tags, mentions_text or text, registry, mentions, taxa)
+    return page_result(text, positions, pages, tags, params)
+
+
+def _tags_params(params):
+    return dict(
+        domains=params.domains or TAG_DOMAINS.keys(),
+        min_score=params.min_score,
+        constant_score=bool(params.constant_score),
+        offset=params.offset,
+        limit=params.limit,
+        mentions=bool(params.mentions),
+        enrich=bool(params.enrich),
+    )
+
+
+async def extract_from_text(
+    body: RequestBody,
+    headers: Headers,
+    query_params: QueryParams,
+    registry: DomainRegistry,
+    tag_cache: TagCache,
+) -> dict:
+    """Tag extraction endpoint handler, see `views.extract_from_text()`."""
+    return await tag_text(parse_text_request(body, headers, query_params), registry, tag_cache)
+
+
+async def tag_text(params: TextExtractionJSONParams, registry, tag_cache) -> dict:
+    """Tags the text of validated `/tag` parameters."""
+    if not params.text:
+        raise BadRequest({'content': 'Required and not provided'})
+    check_stream_params(params)
+    if params.stream:
+        return stream_tags(params, registry, params.text)
+    if params.cursor is not None:
+        return await get_tags_page(registry=registry, text=params.text, **page_params(params))
+
+    return await get_domains_tags(
+        registry=registry, text=params.text, tag_cache=tag_cache, **_tags_params(params)
+    )
+
+
+async def extract_from_url(
+    params: URLExtractionJSONParams,
+    registry: DomainRegistry,
+    tag_cache: TagCache,
+    extraction_cache: ExtractionCache,
+    http_client: AsyncHTTPClient,
+) -> dict:
+    check_stream_params(params)
+    try:
+        text = await extract_text_from_url_async(
+            params.url,
+            extraction_cache,
+            http_client,
+            max_bytes=settings.URL_MAX_BYTES,
+            streaming=settings.URL_STREAMING,
+        )
+    except (TextExtractionTimeout, TextExtractionError) as exc:
+        status_code = 413 if isinstance(exc, DocumentTooLarge) else 500
+        return Response(extraction_error_message(exc), status_code=status_code)
+
+    return await tag_extracted_text(params, registry, tag_cache, text)
+
+
+async def tag_extracted_text(params, registry, tag_cache, extracted_text):
+    """Tags a text extracted by Tika, see `views.tag_extracted_text()`."""
+    text = compact_text(extracted_text)
+    if params.stream:
+        return stream_tags(params, registry, text)
+    if params.cursor is not None:
+        return await get_tags_page(
+            registry=registry, text=text, mentions_text=extracted_text, **page_params(params)
+        )
+    return await get_domains_tags(
+        registry=registry,
+        text=text,
+        tag_cache=tag_cache,
+        mentions_text=extracted_text,
+        **_tags_params(params),
+    )
+
+
+async def _extract_batch_document(document, semaphore, extraction_cache, http_client):
+    """
+    Returns:
+        A `(text, extracted_text, error)` tuple for a batch document, see
+        `views._extract_batch_document()`.
+    """
+    if document.get('text'):
+        return document['text'], document['text'], None
+    if not document.get('url'):
+        return None, None, 'Either text or url is required'
+
+    async with semaphore:
+        try:
+            text = await extract_text_from_url_async(
+                document['url'],
+                extraction_cache,
+                http_client,
+                max_bytes=settings.URL_MAX_BYTES,
+                streaming=settings.URL_STREAMING,
+            )
+        except (TextExtractionTimeout, TextExtractionError) as exc:
+            return None, None, extraction_error_message(exc)
+    return compact_text(text), text, None
+
+
+async def extract_batch(
+    params: BatchExtractionJSONParams,
+    registry: DomainRegistry,
+    tag_cache: TagCache,
+    extraction_cache: ExtractionCache,
+    http_client: AsyncHTTPClient,
+) -> list:
+    """
+    Batch tag extraction endpoint handler, accepts parameters as JSON.
+    URLs are fetched concurrently, and all the texts are then tagged with a single search request.
+
+    Returns:
+        A list with the tags of each document, in order. Documents that could not be processed
+        have an `error` instead.
+    """
+    check_stream_params(params)
+    if params.cursor is not None:
+        raise BadRequest({'cursor': 'Not supported for batches'})
+    semaphore = asyncio.Semaphore(settings.BATCH_EXTRACTION_WORKERS)
+    extracted = await asyncio.gather(*(
+        _extract_batch_document(document, semaphore, extraction_cache, http_client)
+        for document in params.documents
+    ))
+
+    if params.stream:
+        return NDJSONResponse(_iter_batch_records(params, registry, extracted))
+
+    texts = [text for text, _, error in extracted if error is None]
+    extracted_texts = [text for _, text, error in extracted if error is None]
+    tags = iter(await get_documents_tags(
+        registry=registry,
+        texts=texts,
+        tag_cache=tag_cache,
+        mentions_texts=extracted_texts,
+        **_tags_params(params),
+    ))
+    return [next(tags) if error is None else {'error': error} for _, _, error in extracted]
+
+
+async def extract_from_form(
+    form_data: http.RequestData,
+    registry: DomainRegistry,
+    tag_cache: TagCache,
+    extraction_cache: ExtractionCache,
+    http_client: AsyncHTTPClient,
+) -> dict:
+    """
+    Tag extraction endpoint handler, accepting a multi-part form.
+    """
+    source, params, file = parse_form(form_data)
+    check_stream_params(params)
+    if source == 'text':
+        return await tag_text(params, registry, tag_cache)
+    elif source == 'url':
+        return await extract_from_url(params, registry, tag_cache, extraction_cache, http_client)
+
+    try:
+        text = await extract_text_async(file.stream.read(), extraction_cache, http_client)
+    except (TextExtractionTimeout, TextExtractionError) as exc:
+        return Response(extraction_error_message(exc), status_code=500)
+
+    return await tag_extracted_text(params, registry, tag_cache, text)
+
+
+async def get_taxon_details(params: QueryParams, registry: DomainRegistry) -> dict:
+    terms = dict(params)
+    domain = terms.pop('domain')
+    indexer = registry.taxon_indexers[domain]
+    details = await indexer.first_async(**terms)
+    if details is None:
+        raise NotFound
+    return details
+
+
+async def get_taxa_batch(params: TaxaBatchParams, registry: DomainRegistry) -> dict:
+    """Batch taxon lookup endpoint handler, see `views.get_taxa_batch()`."""
+    indexer = registry.taxon_indexers[params.domain]
+    prepared = prepare_taxa_queries(indexer, params.queries)
+    taxa = await indexer.first_many_async(terms for _, terms, error in prepared if error is None)
+    return taxa_batch_results(prepared, taxa)
+
+
+async def _ping_elasticsearch(client):
+    start = time.perf_counter()
+    ok = await client.ping(request_timeout=settings.READY_ES_BUDGET)
+    return readiness_check(ok, start, settings.READY_ES_BUDGET)
+
+
+async def _ping_tika(http_client):
+    start = time.perf_counter()
+    timeout = aiohttp.ClientTimeout(total=settings.READY_TIKA_BUDGET)
+    try:
+        async with await http_client.get(f'{settings.TIKA_URL}/tika', timeout=timeout) as response:
+            ok = response.status == 200
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        ok = False
+    return readiness_check(ok, start, settings.READY_TIKA_BUDGET)
+
+
+async def ready(registry: DomainRegistry, http_client: AsyncHTTPClient) -> Response:
+    """Readiness endpoint handler, see `views.ready()`. Checks run concurrently."""
+    elasticsearch, tika = await asyncio.gather(
+        _ping_elasticsearch(registry.client), _ping_tika(http_client)
+    )
+    return readiness_response(registry, elasticsearch, tika)
@@ -1,17 +1,25 @@
 import logging
 import io
 import typing
+import zlib
 from apistar import http
+from apistar.exceptions import BadRequest, HTTPException, UnsupportedMediaType
 from apistar.server.wsgi import WSGIEnviron
 from apistar.server.components import Component
-from werkzeug.datastructures import ImmutableMultiDict
-from werkzeug.formparser import FormDataParser
+from werkzeug.datastructures import ImmutableMultiDict, MultiDict
+from werkzeug.formparser import FormDataParser, MultiPartParser
 from werkzeug.http import parse_options_header
 from werkzeug.wsgi import get_input_stream
 
 from elasticsearch import Elasticsearch
 from elasticsearch_dsl.connections import connections
 
+from ..core.http import HTTPClient
+from ..core.text import ExtractionCache
+from ..search import DomainRegistry, get_registry
+from ..search.cache import TagCache
+from ..core.metrics import STAGE_LATENCY
+
 log = logging.getLogger(__name__)
 
 
@@ -25,8 +33,107 @@ class ElasticSearchClientComponent(Component):
         return self.client
 
 
+class DomainRegistryComponent(Component):
+    """
+    Provides the long-lived indexers and taggers of the tag domains, built at startup.
+    With `warmup`, the registry starts warming up right away, see `Warmup`.
+    """
+
+    def __init__(self, client, warmup=False):
+        self.registry = get_registry(client)
+        log.info(f'Domain registry created, domains: {", ".join(self.registry.domains)}')
+        if warmup:
+            self.registry.warmup.start()
+
+    def resolve(self) -> DomainRegistry:
+        return self.registry
+
+
+class HTTPClientComponent(Component):
+    def __init__(self, **options):
+        self.client = HTTPClient(**options)
+        log.info('HTTP client created')
+        log.debug(f'HTTP client options: {options}')
+
+    def resolve(self) -> HTTPClient:
+        return self.client
+
+
+class TagCacheComponent(Component):
+    def __init__(self, max_entries, path=None, max_bytes=None, generation_ttl=10):
+        self.cache = TagCache(
+            max_entries=max_entries,
+            path=path,
+            max_bytes=max_bytes,
+            generation_ttl=generation_ttl,
+        )
+        log.info(f'Tag cache created, {max_entries} entries' + (f', on disk at {path}' if path else ''))
+
+    def resolve(self) -> TagCache:
+        return self.cache
+
+
+class ExtractionCacheComponent(Component):
+    def __init__(self, path=None, max_bytes=None):
+        self.cache = ExtractionCache(path=path, max_bytes=max_bytes)
+        if path:
+            log.info(f'Text extraction cache created at {path}')
+
+    def resolve(self) -> ExtractionCache:
+        return self.cache
+
+
 RequestStream = typing.NewType('RequestStream', io.BufferedIOBase)
-MultiPartForm = typing.NewType('MultiPartForm', ImmutableMultiDict)
+RequestBody = typing.NewType('RequestBody', bytes)
+
+BODY_CHUNK_SIZE = 64 * 1024
+GZIP_ENCODINGS = ('gzip', 'x-gzip')
+
+
+def _iter_chunks(stream, chunk_size):
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _gunzip(chunks, chunk_size):
+    """Decompresses gzip `chunks`, yielding at most `chunk_size` bytes at a time."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            while chunk:
+                yield decompressor.decompress(chunk, chunk_size)
+                chunk = decompressor.unconsumed_tail
+    except zlib.error:
+        raise BadRequest('Invalid gzip content')
+    if not decompressor.eof:
+        raise BadRequest('Truncated gzip content')
+
+
+def read_body(stream, content_encoding=None, max_bytes=None, chunk_size=BODY_CHUNK_SIZE):
+    """
+    Reads a request body from `stream`, decompressing it if its `Content-Encoding` is gzip.
+    Decompression is incremental, so that bodies are rejected as soon as they exceed `max_bytes`.
+
+    Raises:
+        UnsupportedMediaType: For other content encodings.
+        HTTPException: With a 413 status, if the (decompressed) body exceeds `max_bytes`.
+    """
+    encoding = (content_encoding or 'identity').strip().lower()
+    if encoding not in GZIP_ENCODINGS + ('identity',):
+        raise UnsupportedMediaType(f'Unsupported content encoding: {content_encoding}')
+
+    chunks = _iter_chunks(stream, chunk_size)
+    if encoding in GZIP_ENCODINGS:
+        chunks = _gunzip(chunks, chunk_size)
+    body = bytearray()
+    for chunk in chunks:
+        body += chunk
+        if max_bytes is not None and len(body) > max_bytes:
+            raise HTTPException('Request body too large', status_code=413)
+    return bytes(body)
 
 
 class RequestStreamComponent(Component):
@@ -34,7 +141,144 @@ class RequestStreamComponent(Component):
         return get_input_stream(environ)
 
 
+class RequestBodyComponent(Component):
+    """Provides the request body, decompressed, see `read_body()`."""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+
+    def resolve(self, headers: http.Headers, stream: RequestStream) -> RequestBody:
+        return RequestBody(read_body(stream, headers.get('Content-Encoding'), self.max_bytes))
+
+
+class FormFileReader:
+    """
+    Reads the content of a multi-part file part while it's received, from the events of
+    `MultiPartParser.parse_lines()`. Iterating over it yields chunks, so it can be streamed as
+    a request body.
+    """
+
+    def __init__(self, events, name, filename, chunk_size=BODY_CHUNK_SIZE):
+        self.events = events
+        self.name = name
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self.done = False
+        self._buffer = b''
+
+    def _next_chunk(self):
+        """Returns the next chunk of the part, or `b''` at its end."""
+        while not self.done:
+            event, value = next(self.events)
+            if event != 'cont':
+                self.done = True
+            elif value:
+                return value
+        return b''
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size is None or size < 0 or length < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            chunks.append(chunk)
+            length += len(chunk)
+
+        data = b''.join(chunks)
+        if size is not None and size >= 0:
+            data, self._buffer = data[:size], data[size:]
+        else:
+            self._buffer = b''
+        self.bytes_read += len(data)
+        return data
+
+    def __iter__(self):
+        while True:
+            data = self.read(self.chunk_size)
+            if not data:
+                break
+            yield data
+
+    def drain(self):
+        """Skips the rest of the part."""
+        while self._next_chunk():
+            pass
+        self._buffer = b''
+
+
+class FormStream:
+    """
+    A form whose fields and files are parsed while it's received, from the events of
+    `MultiPartParser.parse_lines()`. The fields preceding the `file` part are parsed first,
+    then the content of `file` can be read as it arrives, e.g. to stream it to Tika. The rest
+    of the form is parsed by `finish()`.
+
+    When no events are provided, the form is made of the already parsed `fields` and `files`,
+    and `file` is the uploaded file.
+    """
+
+    file_field = 'file'
+
+    def __init__(self, events=(), fields=(), files=(), file=None):
+        self.events = iter(events)
+        self.fields = MultiDict(fields)
+        self.files = MultiDict(files)
+        self.file = file
+        self._reader = None
+        self._parse()
+
+    def _parse(self):
+        """Parses parts until the `file` part is reached, or the end of the form."""
+        name, data = None, []
+        for event, value in self.events:
+            if event == 'begin_form':
+                (_, name), data = value, []
+            elif event == 'begin_file':
+                _, name, filename = value
+                reader = FormFileReader(self.events, name, filename)
+                self.files.add(name, reader)
+                if name == self.file_field and self.file is None:
+                    self.file = self._reader = reader
+                    return
+                reader.drain()
+            elif event == 'cont':
+                data.append(value)
+            elif event == 'end':
+                self.fields.add(name, b''.join(data).decode('utf-8', 'replace'))
+
+    def finish(self):
+        """
+        Skips what's left of the `file` content, and parses the rest of the form.
+
+        Returns:
+            An `ImmutableMultiDict` of all the fields and files.
+        """
+        if self._reader is not None:
+            self._reader.drain()
+            self._reader = None
+            with STAGE_LATENCY.time(stage='form_parse'):
+                self._parse()
+        return ImmutableMultiDict(list(self.fields.items()) + list(self.files.items()))
+
+
+def _checked_form_events(events):
+    try:
+        yield from events
+    except ValueError as exc:  # Raised by `MultiPartParser.fail()`
+        raise BadRequest(f'Invalid multipart form: {exc}')
+
+
 class MultiPartParserComponent(Component):
+    """
+    Parses forms. In `streaming` mode, multi-part forms are parsed while they're received,
+    see `FormStream`; otherwise uploaded files are fully read, in memory or on disk, first.
+    """
+
+    def __init__(self, streaming=False):
+        self.streaming = streaming
 
     @staticmethod
     def _get_content_length(headers: http.Headers) -> typing.Optional[int]:
@@ -50,9 +294,22 @@ class MultiPartParserComponent(Component):
     def _get_mimetype_and_options(headers: http.Headers) -> typing.Tuple[str, dict]:
         return parse_options_header(headers.get('Content-Type'))
 
-    def resolve(self, headers: http.Headers, stream: RequestStream) -> MultiPartForm:
+    def resolve(self, headers: http.Headers, stream: RequestStream) -> FormStream:
         mimetype, options = self._get_mimetype_and_options(headers)
         content_length = self._get_content_length(headers)
+        if self.streaming and mimetype == 'multipart/form-data':
+            parser = MultiPartParser(buffer_size=BODY_CHUNK_SIZE)
+            boundary = options.get('boundary', '')
+            try:
+                parser.validate_boundary(boundary)  # Matched as a str by Werkzeug
+            except ValueError as exc:
+                raise BadRequest(f'Invalid multipart form: {exc}')
+            events = parser.parse_lines(stream, boundary.encode('ascii'), content_length)
+            with STAGE_LATENCY.time(stage='form_parse'):
+                return FormStream(_checked_form_events(events))
+
         parser = FormDataParser()
-        stream, form, files = parser.parse(stream, mimetype, content_length, options)
-        return ImmutableMultiDict(list(form.items()) + list(files.items()))
+        with STAGE_LATENCY.time(stage='form_parse'):
+            stream, form, files = parser.parse(stream, mimetype, content_length, options)
+        file = files.get(FormStream.file_field)
+        return FormStream(fields=form, files=files, file=file.stream if file is not None else None)
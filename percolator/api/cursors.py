@@ -0,0 +1,69 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from ..core.exceptions import InvalidCursor
+
+CURSOR_VERSION = 2
+
+
+def text_digest(text):
+    """A short digest of the text, binding cursors to the text they page through."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def params_digest(params):
+    """A short digest of the scoring and paging parameters, which the sort values depend on."""
+    data = json.dumps(params, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def encode_cursor(text, positions, params):
+    """
+    Encodes the paging state as an opaque, URL-safe token.
+
+    Args:
+        text: The text being paged through.
+        positions: A dict mapping the domains with more pages to their `after` sort values.
+        params: A dict of the scoring and paging parameters of the pages.
+    """
+    state = {
+        'v': CURSOR_VERSION,
+        'd': text_digest(text),
+        'q': params_digest(params),
+        'p': positions,
+    }
+    data = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, text, params):
+    """
+    Returns:
+        The dict of positions encoded in the cursor, see `encode_cursor()`. Their values are
+        unchecked.
+
+    Raises `InvalidCursor` if the token is malformed, or was made for another text or other
+    parameters.
+    """
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        state = json.loads(data.decode('utf-8'))
+        version = state['v']
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError):
+        raise InvalidCursor('Malformed cursor')
+    if version != CURSOR_VERSION:
+        raise InvalidCursor('Unsupported cursor')
+
+    try:
+        digest, positions_params, positions = state['d'], state['q'], state['p']
+    except KeyError:
+        raise InvalidCursor('Malformed cursor')
+    if not isinstance(positions, dict):
+        raise InvalidCursor('Malformed cursor')
+    if digest != text_digest(text):
+        raise InvalidCursor('The cursor was made for another text')
+    if positions_params != params_digest(params):
+        raise InvalidCursor('The cursor was made for other scoring or paging parameters')
+    return positions
@@ -0,0 +1,80 @@
+import gzip
+import time
+
+from apistar import http
+from apistar.server.core import Route
+
+from percolator.conf import settings
+from .streaming import StreamingResponse
+from ..search import DomainRegistry
+from ..core.metrics import REQUESTS, REQUEST_LATENCY, STAGE_LATENCY
+
+
+class MetricsHook:
+    """Counts requests and records their latency, by route. Instantiated for each request."""
+
+    def on_request(self):
+        self.start = time.perf_counter()
+
+    def on_response(self, response: http.Response, route: Route) -> http.Response:
+        route_name = route.name if route is not None else 'unmatched'
+        # Exceptions raised before `on_request()` (e.g. unknown routes) skip it
+        start = getattr(self, 'start', None)
+        if start is not None:
+            REQUEST_LATENCY.observe(time.perf_counter() - start, route=route_name)
+        REQUESTS.inc(route=route_name, status=response.status_code)
+        return response
+
+
+class WarmupHook:
+    """
+    Starts warming up ASGI workers on their first request, as there's no event loop running
+    before. WSGI workers start at startup instead, see `DomainRegistryComponent`.
+    """
+
+    def on_request(self, registry: DomainRegistry):
+        registry.warmup.start_async()
+
+
+def accepts_gzip(accept_encoding):
+    """Returns whether an `Accept-Encoding` header value accepts gzip, with a non-zero quality."""
+    qualities = {}
+    for item in (accept_encoding or '').split(','):
+        coding, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get('gzip', qualities.get('x-gzip', qualities.get('*', 0.0))) > 0
+
+
+class GzipHook:
+    """
+    Compresses responses with gzip, for clients accepting it. Responses smaller than
+    `GZIP_MIN_BYTES`, already encoded, or streamed are sent as is.
+    """
+
+    compress_level = 6
+
+    def on_response(self, response: http.Response, headers: http.Headers) -> http.Response:
+        if (
+            isinstance(response, StreamingResponse)
+            or not isinstance(response.content, bytes)
+            or len(response.content) < settings.GZIP_MIN_BYTES
+            or 'Content-Encoding' in response.headers
+        ):
+            return response
+
+        response.headers['Vary'] = 'Accept-Encoding'
+        if not accepts_gzip(headers.get('Accept-Encoding')):
+            return response
+        with STAGE_LATENCY.time(stage='compression'):
+            response.content = gzip.compress(response.content, self.compress_level)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Content-Length'] = str(len(response.content))
+        return response
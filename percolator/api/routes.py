@@ -8,5 +8,9 @@ routes = [
     Route('/tag', method='POST', handler=extract_from_text),
     Route('/tag/url', method='POST', handler=extract_from_url),
     Route('/tag/form', method='POST', handler=extract_from_form),
+    Route('/tag/batch', method='POST', handler=extract_batch),
     Route('/taxa', method='GET', handler=get_taxon_details),
+    Route('/taxa/batch', method='POST', handler=get_taxa_batch),
+    Route('/ready', method='GET', handler=ready),
+    Route('/metrics', method='GET', handler=metrics),
 ]
@@ -0,0 +1,87 @@
+import json
+
+import apistar
+from apistar.http import Response
+from apistar.server.asgi import ASGIScope, ASGISend
+from apistar.server.components import ReturnValue
+from apistar.server.wsgi import WSGIStartResponse, RESPONSE_STATUS_TEXT
+
+from ..core.metrics import STAGE_LATENCY
+
+
+class StreamingResponse(Response):
+    """
+    Response whose content is an iterable (or async iterable) of bytes, sent as it's produced.
+    It has no `Content-Length`, so it's sent with chunked transfer encoding.
+    """
+
+    def render(self, content):
+        return content
+
+    def set_default_headers(self):
+        if 'Content-Type' not in self.headers and self.media_type is not None:
+            self.headers['Content-Type'] = self.media_type
+
+
+class NDJSONResponse(StreamingResponse):
+    """Streams an iterable (or async iterable) of records as newline delimited JSON."""
+
+    media_type = 'application/x-ndjson'
+    charset = None
+
+    @staticmethod
+    def _dumps(record):
+        return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+    def render(self, records):
+        if hasattr(records, '__aiter__'):
+            return self._render_async(records)
+        return (self._dumps(record) for record in records)
+
+    async def _render_async(self, records):
+        async for record in records:
+            yield self._dumps(record)
+
+
+class App(apistar.App):
+    """WSGI app, also sending `StreamingResponse`s. Response rendering is timed."""
+
+    def render_response(self, return_value: ReturnValue) -> Response:
+        with STAGE_LATENCY.time(stage='serialization'):
+            return super().render_response(return_value)
+
+    def finalize_wsgi(self, response: Response, start_response: WSGIStartResponse):
+        if not isinstance(response, StreamingResponse):
+            return super().finalize_wsgi(response, start_response)
+
+        start_response(
+            RESPONSE_STATUS_TEXT[response.status_code],
+            list(response.headers),
+            response.exc_info
+        )
+        return response.content
+
+
+class ASyncApp(apistar.ASyncApp):
+    """ASGI app, also sending `StreamingResponse`s. Response rendering is timed."""
+
+    def render_response(self, return_value: ReturnValue) -> Response:
+        with STAGE_LATENCY.time(stage='serialization'):
+            return super().render_response(return_value)
+
+    async def finalize_asgi(self, response: Response, send: ASGISend, scope: ASGIScope):
+        if not isinstance(response, StreamingResponse):
+            return await super().finalize_asgi(response, send, scope)
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [[key.encode(), value.encode()] for key, value in response.headers],
+        })
+        if hasattr(response.content, '__aiter__'):
+            async for chunk in response.content:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        else:
+            for chunk in response.content:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
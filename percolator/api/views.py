@@ -1,32 +1,76 @@
-from apistar import App, validators
-from apistar.http import Response, QueryParam, QueryParams
-from apistar.exceptions import BadRequest, NotFound
-from elasticsearch import Elasticsearch
-
-from ..search import TAG_DOMAINS
-from .components import MultiPartForm
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from urllib.parse import urlencode
+
+from apistar import App, codecs, validators
+from apistar.conneg import negotiate_content_type
+from apistar.http import Response, JSONResponse, Headers, QueryParam, QueryParams
+from apistar.exceptions import (
+    BadRequest,
+    NotFound,
+    UnsupportedMediaType,
+    NoCodecAvailable,
+    ParseError,
+)
+from requests import RequestException
+from werkzeug.http import parse_options_header
+
+from percolator.conf import settings
+from ..search import TAG_DOMAINS, DomainRegistry, MultiTagger, tags_with_mentions
+from ..search.cache import TagCache
+from .components import FormStream, RequestBody
+from .streaming import NDJSONResponse
+from .cursors import encode_cursor, decode_cursor
 from ..core.types import CoercingType
-from ..core.text import extract_text, extract_text_from_url
-from ..core.exceptions import TextExtractionError, TextExtractionTimeout
+from ..core.http import HTTPClient
+from ..core.text import extract_text, extract_text_from_url, ExtractionCache
+from ..core.compaction import compact_text
+from ..core.metrics import REGISTRY, TEXT_SIZE, render_cache_stats
+from ..core.exceptions import (
+    TextExtractionError,
+    TextExtractionTimeout,
+    DocumentTooLarge,
+    DocumentFetchError,
+    InvalidCursor,
+)
 
 
-def list_tag_domains(es_client: Elasticsearch) -> dict:
-    """
-    Lists tag domains.
+def _isoformat(dt):
+    return dt.isoformat(timespec='seconds') + 'Z' if dt is not None else None
+
 
+def domains_details(stats):
+    """
     Returns:
-        dict mapping domain names to their descriptions.
+        A dict mapping domain names to their description and query index statistics, see
+        `IndexStatsCache.get()`. Statistics are `null` until first fetched.
     """
-    domains = TAG_DOMAINS.values()
     return {
         d.name: {
             'description': d.description,
-            'tags_count': d.query_indexer(client=es_client).count()
+            'tags_count': stats[d.name].get('tags_count'),
+            'generation': stats[d.name].get('generation'),
+            'built_at': _isoformat(stats[d.name].get('built_at')),
+            'size_bytes': stats[d.name].get('size_bytes'),
+            'updated_at': _isoformat(stats[d.name]['updated_at']),
+            'stale': stats[d.name]['stale'],
         }
-        for d in domains
+        for d in TAG_DOMAINS.values()
     }
 
 
+def list_tag_domains(registry: DomainRegistry) -> dict:
+    """
+    Lists tag domains, with the statistics of their query index. Statistics are cached, and
+    refreshed in the background, so this never waits for ElasticSearch.
+
+    Returns:
+        dict mapping domain names to their descriptions.
+    """
+    return domains_details(registry.stats.get())
+
+
 class DomainValidator(validators.String):
     """Custom string validator for domains"""
     errors = {'exact': 'Unknown domain', 'enum': f'Unknown domain'}
@@ -61,6 +105,35 @@ class BaseExtractionJSONParams(CoercingType):
         allow_null=False,
         description='Disables relevance scoring when `True`. All results will have score `1`.',
     )
+    mentions = validators.Boolean(
+        default=False,
+        allow_null=True,
+        description='Also returns the number of mentions of each tag and their character offsets. '
+        'Tags are then mapped to objects with `score`, `count` and `offsets` keys, the latter '
+        '`null` if the mentions of a tag can\'t be located.',
+    )
+    enrich = validators.Boolean(
+        default=False,
+        allow_null=True,
+        description='Also returns the taxon of each tag, for domains with a taxonomy. '
+        'Tags are then mapped to objects with `score` and `taxon` keys.',
+    )
+    cursor = validators.String(
+        max_length=4096,
+        allow_null=True,
+        description='Pages with a cursor instead of `offset`, without bound on the page depth: '
+        'an empty string requests the first page, then pass the `cursor` of the previous '
+        'response. The response is then an object with the `tags` of the domains that have '
+        'more results, and the next `cursor` (`null` after the last page). The text, '
+        '`min_score`, `constant_score` and `limit` must stay the same across pages.',
+    )
+    stream = validators.Boolean(
+        default=False,
+        allow_null=True,
+        description='Streams the tags as newline delimited JSON records, with `domain`, `tag` '
+        'and `score` keys, and `document` for batches. All the tags are streamed, `offset` and '
+        '`limit` are ignored. Can\'t be combined with `mentions` or `enrich`.',
+    )
 
 
 class TextExtractionJSONParams(BaseExtractionJSONParams):
@@ -82,90 +155,521 @@ class URLExtractionJSONParams(BaseExtractionJSONParams):
     )
 
 
-def get_domain_tags(
-    domain,
-    es_client,
-    text,
+class BatchExtractionJSONParams(BaseExtractionJSONParams):
+    """Validator for batch extraction parameters, shared by all the documents."""
+    documents = validators.Array(
+        items=validators.Object(
+            properties={
+                'text': validators.String(max_length=1024 * 1024 * 10, allow_null=True),
+                'url': validators.String(max_length=400, allow_null=True),
+            },
+            additional_properties=False,
+        ),
+        min_items=1,
+        max_items=100,
+        description='Documents to be analyzed, each with either a `text` or an `url` to fetch',
+    )
+
+
+class TaxaBatchParams(CoercingType):
+    """Validator for batch taxon lookup parameters."""
+    domain = DomainValidator(
+        enum=[name for name, d in TAG_DOMAINS.items() if d.taxon_indexer is not None],
+        description='The domain of the taxa',
+    )
+    queries = validators.Array(
+        items=validators.Union(items=[
+            validators.String(min_length=1, max_length=400),
+            validators.Object(
+                additional_properties=validators.String(max_length=400), min_properties=1
+            ),
+        ]),
+        min_items=1,
+        max_items=1000,
+        description='Scientific names, or objects mapping field names to terms as for `/taxa`',
+    )
+
+
+def get_documents_tags(
+    domains,
+    registry,
+    texts,
     min_score=None,
     constant_score=True,
     offset=None,
     limit=None,
+    tag_cache=None,
+    mentions=False,
+    enrich=False,
+    mentions_texts=None,
 ):
-    """Fetches tags for a domain"""
-    tag_domain = TAG_DOMAINS[domain]
-    indexer = tag_domain.query_indexer(client=es_client)
-    tagger = tag_domain.tagger(indexer=indexer)
-    return tagger.get_tags(
-        text=text,
-        min_score=min_score,
-        constant_score=constant_score,
-        offset=offset,
-        limit=limit,
+    """
+    Fetches tags for several texts and domains, in a single search request.
+    Results found in `tag_cache` are not searched for. With `mentions` or `enrich`, details
+    are added to the tags, see `detail_tags()`.
+
+    Args:
+        mentions_texts: The texts mentions are found in, defaults to `texts`. These are the
+            extracted texts, when `texts` are compacted (see `compact_text()`).
+
+    Returns:
+        A list of dicts mapping domain names to tags, one for each text.
+    """
+    taggers = registry.get_taggers(domains)
+    params = dict(min_score=min_score, constant_score=constant_score, offset=offset, limit=limit)
+
+    # Tags are cached for the generation they're searched in
+    generations = None
+    if tag_cache is not None:
+        generations = {
+            domain: tag_cache.generation(domain, tagger) for domain, tagger in taggers.items()
+        }
+
+    results = [{} for _ in texts]
+    jobs = []
+    keys = []
+    for i, text in enumerate(texts):
+        TEXT_SIZE.observe(len(text))
+        digest = tag_cache.digest(text) if tag_cache is not None else None
+        for domain in taggers:
+            key = None
+            if tag_cache is not None:
+                key = tag_cache.key(domain, generations[domain], digest, **params)
+                cached = tag_cache.get(key)
+                if cached is not None:
+                    results[i][domain] = cached
+                    continue
+            jobs.append((i, domain))
+            keys.append(key)
+
+    if jobs:
+        found = MultiTagger(taggers).percolate(
+            [(domain, texts[i]) for i, domain in jobs], generations=generations, **params
+        )
+        for (i, domain), key, domain_tags in zip(jobs, keys, found):
+            if tag_cache is not None:
+                tag_cache.set(key, domain_tags)
+            results[i][domain] = domain_tags
+
+    results = [{domain: r[domain] for domain in taggers} for r in results]
+    if mentions or enrich:
+        taxa = get_taxa(results, registry) if enrich else None
+        results = [
+            detail_tags(r, text, registry, mentions, taxa)
+            for r, text in zip(results, mentions_texts or texts)
+        ]
+    return results
+
+
+def taxon_lookups(results, registry):
+    """Returns the taxon indexers of the domains in `results`, with the tags to look up."""
+    for domain in results[0] if results else ():
+        taxon_indexer = registry.get_taxon_indexer(domain)
+        if taxon_indexer is not None:
+            tags = {tag for r in results for tag in r[domain]}
+            yield domain, taxon_indexer, tags
+
+
+def get_taxa(results, registry):
+    """
+    Looks up the taxa of all the tags in `results`, with at most one search request per domain.
+
+    Returns:
+        A dict mapping domain names to dicts of tags and their taxon.
+    """
+    return {
+        domain: taxon_indexer.get_taxa(tags)
+        for domain, taxon_indexer, tags in taxon_lookups(results, registry)
+    }
+
+
+def detail_tags(domains_tags, text, registry, mentions=False, taxa=None):
+    """
+    Maps tags to objects with their `score` and, with `mentions`, the `count` and character
+    `offsets` of their mentions, found by rescanning the text once per domain. Tags of domains
+    in `taxa` (see `get_taxa()`) get their `taxon` too.
+
+    Returns:
+        A dict mapping domain names to dicts of tags and their details.
+    """
+    detailed = {}
+    for domain, tags in domains_tags.items():
+        mention_tagger = registry.mention_taggers[domain] if mentions else None
+        if mention_tagger is not None:
+            details = tags_with_mentions(tags, mention_tagger.get_mentions(text, tags))
+        else:
+            details = {tag: {'score': score} for tag, score in tags.items()}
+
+        if taxa is not None and domain in taxa:
+            for tag, tag_details in details.items():
+                tag_details['taxon'] = taxa[domain].get(tag)
+        detailed[domain] = details
+    return detailed
+
+
+def iter_tag_records(domains, registry, text, min_score=None, constant_score=True, document=None):
+    """
+    Generator of all the tag records of a text, for several domains, produced while the search
+    hits are consumed (see `BaseTagger.iter_tags()`). Records get the `document` index if provided.
+    """
+    TEXT_SIZE.observe(len(text))
+    taggers = registry.get_taggers(domains)
+    for domain, tagger in taggers.items():
+        for tag, score in tagger.iter_tags(text, min_score, constant_score):
+            record = {'domain': domain, 'tag': tag, 'score': score}
+            if document is not None:
+                record = {'document': document, **record}
+            yield record
+
+
+def check_stream_params(params):
+    if params.stream and (params.mentions or params.enrich or params.cursor is not None):
+        raise BadRequest({'stream': 'Can\'t be combined with mentions, enrich or cursor'})
+
+
+def stream_params(params):
+    return dict(
+        domains=params.domains or TAG_DOMAINS.keys(),
+        min_score=params.min_score,
+        constant_score=bool(params.constant_score),
     )
 
 
-def _get_taxon_details(domain, es_client, **terms):
-    tag_domain = TAG_DOMAINS[domain]
-    indexer = tag_domain.taxon_indexer(client=es_client)
-    return indexer.first(**terms)
+def stream_tags(params, registry, text):
+    """Returns a streaming response of the tag records of a text, see `iter_tag_records()`."""
+    return NDJSONResponse(iter_tag_records(registry=registry, text=text, **stream_params(params)))
+
+
+def stream_batch_tags(params, registry, extracted):
+    """
+    Returns a streaming response of the tag records of batch documents, given as
+    `(text, extracted_text, error)` tuples (see `_extract_batch_document()`). Documents that
+    could not be processed have a single record with an `error`.
+    """
+    return NDJSONResponse(chain.from_iterable(
+        iter_tag_records(registry=registry, text=text, document=i, **stream_params(params))
+        if error is None else [{'document': i, 'error': error}]
+        for i, (text, _, error) in enumerate(extracted)
+    ))
+
+
+def page_positions(domains, registry, text, cursor, params):
+    """
+    Args:
+        params: The scoring and paging parameters, see `get_tags_page()`. They must be those
+            the cursor was made with.
+
+    Returns:
+        A dict mapping each domain to the `after` sort values of its next page, from the
+        `cursor` if provided, or `None` for the first page.
+    """
+    if not cursor:
+        return {domain: None for domain in domains}
+    try:
+        positions = decode_cursor(cursor, text, params)
+    except InvalidCursor as exc:
+        raise BadRequest({'cursor': str(exc)})
+    if not positions or set(positions) - set(TAG_DOMAINS):
+        raise BadRequest({'cursor': 'Malformed cursor'})
+    for domain, after in positions.items():
+        if not registry.taggers[domain].is_valid_after(after, params['constant_score']):
+            raise BadRequest({'cursor': 'Malformed cursor'})
+    return positions
+
+
+def page_result(text, positions, pages, tags, params):
+    """Returns the `tags` of a page, and the cursor of the next one."""
+    next_positions = {
+        domain: after for domain, (_, after) in zip(positions, pages) if after is not None
+    }
+    return {
+        'tags': tags,
+        'cursor': encode_cursor(text, next_positions, params) if next_positions else None,
+    }
+
+
+def get_tags_page(
+    domains,
+    registry,
+    text,
+    cursor=None,
+    min_score=None,
+    constant_score=True,
+    limit=None,
+    mentions=False,
+    enrich=False,
+    mentions_text=None,
+):
+    """
+    Fetches a page of tags for several domains, in a single search request. Domains are paged
+    with `search_after`, from the positions in the `cursor`, see `BaseTagger.get_tags_page()`.
+
+    Returns:
+        A dict with the `tags` of each domain, and the `cursor` of the next page.
+    """
+    TEXT_SIZE.observe(len(text))
+    min_score = float(min_score) if min_score is not None else None  # Same digest for 1 and 1.0
+    params = dict(min_score=min_score, constant_score=constant_score, limit=limit)
+    positions = page_positions(domains, registry, text, cursor, params)
+    pages = MultiTagger(registry.get_taggers(positions)).percolate_pages(
+        [(domain, text, after) for domain, after in positions.items()],
+        min_score,
+        constant_score,
+        limit,
+    )
+    tags = {domain: page_tags for domain, (page_tags, _) in zip(positions, pages)}
+    if mentions or enrich:
+        taxa = get_taxa([tags], registry) if enrich else None
+        tags = detail_tags(tags, mentions_text or text, registry, mentions, taxa)
+    return page_result(text, positions, pages, tags, params)
+
+
+def page_params(params):
+    return dict(
+        domains=params.domains or TAG_DOMAINS.keys(),
+        cursor=params.cursor,
+        min_score=params.min_score,
+        constant_score=bool(params.constant_score),
+        limit=params.limit,
+        mentions=bool(params.mentions),
+        enrich=bool(params.enrich),
+    )
+
+
+def get_domains_tags(domains, registry, text, mentions_text=None, **kwargs):
+    """Fetches tags for several domains, see `get_documents_tags()`."""
+    mentions_texts = [mentions_text] if mentions_text else None
+    results = get_documents_tags(domains, registry, [text], mentions_texts=mentions_texts, **kwargs)
+    return results[0]
+
+
+def _get_taxon_details(domain, registry, **terms):
+    return registry.taxon_indexers[domain].first(**terms)
+
+
+REQUEST_CODECS = [codecs.JSONCodec(), codecs.URLEncodedCodec(), codecs.MultiPartCodec()]
+
+
+def _split_domains(params):
+    """Splits the comma-separated `domains` of form or query string parameters."""
+    domains = params.get('domains')
+    params['domains'] = [d.strip() for d in domains.split(',')] if domains else []
+    return params
 
 
-def extract_from_text(params: TextExtractionJSONParams, es_client: Elasticsearch) -> dict:
-    """Tag extraction endpoint handler, accepts parameters as JSON."""
+def parse_text_request(body, headers, query_params):
+    """
+    Validates the parameters of a `/tag` request. The text is either in a JSON object with the
+    other parameters, or is the whole `text/plain` body, the other parameters being in the
+    query string: it's then neither escaped by the client nor parsed as JSON.
+
+    Returns:
+        A `TextExtractionJSONParams` instance.
+    """
+    mimetype, options = parse_options_header(headers.get('Content-Type'))
+    if mimetype == 'text/plain':
+        charset = options.get('charset', 'utf-8')
+        try:
+            text = body.decode(charset)
+        except (LookupError, UnicodeDecodeError):
+            raise BadRequest({'content': f'Not valid {charset} text'})
+        data = dict(_split_domains(dict(query_params)), text=text)
+    elif body:
+        # Decoded like ApiStar does for handlers taking parameters as a `Type`
+        try:
+            codec = negotiate_content_type(REQUEST_CODECS, headers.get('Content-Type'))
+            data = codec.decode(body, headers=headers)
+        except NoCodecAvailable:
+            raise UnsupportedMediaType()
+        except ParseError as exc:
+            raise BadRequest(str(exc))
+    else:
+        data = None
+
+    try:
+        return TextExtractionJSONParams(data)
+    except validators.ValidationError as exc:
+        raise BadRequest(exc.detail)
+
+
+def extract_from_text(
+    body: RequestBody,
+    headers: Headers,
+    query_params: QueryParams,
+    registry: DomainRegistry,
+    tag_cache: TagCache,
+) -> dict:
+    """
+    Tag extraction endpoint handler, accepts parameters as JSON, or the text as a `text/plain`
+    body with the other parameters in the query string, see `parse_text_request()`. Bodies
+    can be gzip-encoded.
+    """
+    return tag_text(parse_text_request(body, headers, query_params), registry, tag_cache)
+
+
+def tag_text(params: TextExtractionJSONParams, registry, tag_cache) -> dict:
+    """Tags the text of validated `/tag` parameters."""
     if not params.text:
         raise BadRequest({'content': 'Required and not provided'})
+    check_stream_params(params)
+    if params.stream:
+        return stream_tags(params, registry, params.text)
+    if params.cursor is not None:
+        return get_tags_page(registry=registry, text=params.text, **page_params(params))
+
+    return get_domains_tags(
+        domains=params.domains or TAG_DOMAINS.keys(),
+        registry=registry,
+        text=params.text,
+        min_score=params.min_score,
+        constant_score=bool(params.constant_score),
+        offset=params.offset,
+        limit=params.limit,
+        tag_cache=tag_cache,
+        mentions=bool(params.mentions),
+        enrich=bool(params.enrich),
+    )
+
 
-    domains = params.domains or TAG_DOMAINS.keys()
-    response = {}
-    for domain in domains:
-        response[domain] = get_domain_tags(
-            domain=domain,
-            es_client=es_client,
-            text=params.text,
-            min_score=params.min_score,
-            constant_score=bool(params.constant_score),
-            offset=params.offset,
-            limit=params.limit,
+def extract_from_url(
+    params: URLExtractionJSONParams,
+    registry: DomainRegistry,
+    tag_cache: TagCache,
+    extraction_cache: ExtractionCache,
+    http_client: HTTPClient,
+) -> dict:
+    check_stream_params(params)
+    try:
+        text = extract_text_from_url(
+            params.url,
+            extraction_cache,
+            http_client,
+            max_bytes=settings.URL_MAX_BYTES,
+            streaming=settings.URL_STREAMING,
         )
-    return response
+    except (TextExtractionTimeout, TextExtractionError) as exc:
+        status_code = 413 if isinstance(exc, DocumentTooLarge) else 500
+        return Response(extraction_error_message(exc), status_code=status_code)
 
+    return tag_extracted_text(params, registry, tag_cache, text)
 
-def extract_from_url(params: URLExtractionJSONParams, es_client: Elasticsearch) -> dict:
-    try:
-        text = extract_text_from_url(params.url)
-    except TextExtractionTimeout:
-        return Response('Text extraction timed out', status_code=500)
-
-    except TextExtractionError:
-        return Response('Text extraction could not be performed', status_code=500)
-
-    domains = params.domains or TAG_DOMAINS.keys()
-    response = {}
-    for domain in domains:
-        response[domain] = get_domain_tags(
-            domain=domain,
-            es_client=es_client,
-            text=text,
-            min_score=params.min_score,
-            constant_score=bool(params.constant_score),
-            offset=params.offset,
-            limit=params.limit,
+
+def tag_extracted_text(params, registry, tag_cache, extracted_text):
+    """
+    Tags a text extracted by Tika, compacted first (see `compact_text()`). Mentions are found
+    in the extracted text, so that their offsets refer to the document.
+    """
+    text = compact_text(extracted_text)
+    if params.stream:
+        return stream_tags(params, registry, text)
+    if params.cursor is not None:
+        return get_tags_page(
+            registry=registry, text=text, mentions_text=extracted_text, **page_params(params)
         )
-    return response
+    return get_domains_tags(
+        domains=params.domains or TAG_DOMAINS.keys(),
+        registry=registry,
+        text=text,
+        min_score=params.min_score,
+        constant_score=bool(params.constant_score),
+        offset=params.offset,
+        limit=params.limit,
+        tag_cache=tag_cache,
+        mentions=bool(params.mentions),
+        enrich=bool(params.enrich),
+        mentions_text=extracted_text,
+    )
+
+
+def extraction_error_message(exc):
+    """Returns the message reported to clients for a text extraction exception."""
+    if isinstance(exc, TextExtractionTimeout):
+        return 'Text extraction timed out'
+    if isinstance(exc, DocumentTooLarge):
+        return 'Document too large'
+    if isinstance(exc, DocumentFetchError):
+        return 'Document could not be fetched'
+    return 'Text extraction could not be performed'
 
 
-def extract_from_form(form_data: MultiPartForm, es_client: Elasticsearch) -> dict:
+def _extract_batch_document(document, extraction_cache, http_client):
     """
-    Tag extraction endpoint handler, accepting a multi-part form.
+    Returns:
+        A `(text, extracted_text, error)` tuple for a batch document: texts extracted from URLs
+        are compacted, see `compact_text()`.
     """
-    params = dict(form_data)  # Convert from ImmutableDict
-    params = {k: v[0] for k, v in params.items()}  # Strip array wrappers from fields
+    if document.get('text'):
+        return document['text'], document['text'], None
+    if not document.get('url'):
+        return None, None, 'Either text or url is required'
 
-    domains = params.get('domains')
-    if domains:
-        params['domains'] = [d.strip() for d in domains.split(',')]
-    else:
-        params['domains'] = []
+    try:
+        text = extract_text_from_url(
+            document['url'],
+            extraction_cache,
+            http_client,
+            max_bytes=settings.URL_MAX_BYTES,
+            streaming=settings.URL_STREAMING,
+        )
+    except (TextExtractionTimeout, TextExtractionError) as exc:
+        return None, None, extraction_error_message(exc)
+    return compact_text(text), text, None
+
+
+def extract_batch(
+    params: BatchExtractionJSONParams,
+    registry: DomainRegistry,
+    tag_cache: TagCache,
+    extraction_cache: ExtractionCache,
+    http_client: HTTPClient,
+) -> list:
+    """
+    Batch tag extraction endpoint handler, accepts parameters as JSON.
+    URLs are fetched concurrently, and all the texts are then tagged with a single search request.
+
+    Returns:
+        A list with the tags of each document, in order. Documents that could not be processed
+        have an `error` instead.
+    """
+    check_stream_params(params)
+    if params.cursor is not None:
+        raise BadRequest({'cursor': 'Not supported for batches'})
+    with ThreadPoolExecutor(max_workers=settings.BATCH_EXTRACTION_WORKERS) as executor:
+        extracted = list(executor.map(
+            lambda document: _extract_batch_document(document, extraction_cache, http_client),
+            params.documents,
+        ))
+
+    if params.stream:
+        return stream_batch_tags(params, registry, extracted)
+
+    texts = [text for text, _, error in extracted if error is None]
+    extracted_texts = [text for _, text, error in extracted if error is None]
+    tags = iter(get_documents_tags(
+        domains=params.domains or TAG_DOMAINS.keys(),
+        registry=registry,
+        texts=texts,
+        min_score=params.min_score,
+        constant_score=bool(params.constant_score),
+        offset=params.offset,
+        limit=params.limit,
+        tag_cache=tag_cache,
+        mentions=bool(params.mentions),
+        enrich=bool(params.enrich),
+        mentions_texts=extracted_texts,
+    ))
+    return [next(tags) if error is None else {'error': error} for _, _, error in extracted]
+
+
+def parse_form(form_data):
+    """
+    Validates the fields of a tag extraction form.
+
+    Returns:
+        A `(source, params, file)` tuple, `file` being only set for the `file` source.
+    """
+    params = form_data.to_dict()  # The first value of each field
+    _split_domains(params)
 
     try:
         source = params.pop('source')
@@ -175,60 +679,162 @@ def extract_from_form(form_data: MultiPartForm, es_client: Elasticsearch) -> dic
     params['constant_score'] = False
     params['limit'] = 10000
 
+    file = None
     if source == 'text':
-        try:
-            params = TextExtractionJSONParams.validate(params, allow_coerce=True)
-        except validators.ValidationError as exc:
-            raise BadRequest(exc.detail)
-        return extract_from_text(params, es_client)
+        params_type = TextExtractionJSONParams
     elif source == 'url':
+        params_type = URLExtractionJSONParams
+    else:
+        params_type = BaseExtractionJSONParams
         try:
-            params = URLExtractionJSONParams.validate(params, allow_coerce=True)
-        except validators.ValidationError as exc:
-            raise BadRequest(exc.detail)
-        return extract_from_url(params, es_client)
-
-    try:
-        file = params.pop('file')
-    except KeyError:
-        raise BadRequest({'file': 'Required and not provided'})
+            file = params.pop('file')
+        except KeyError:
+            raise BadRequest({'file': 'Required and not provided'})
 
     try:
-        params = BaseExtractionJSONParams.validate(params, allow_coerce=True)
+        params = params_type.validate(params, allow_coerce=True)
     except validators.ValidationError as exc:
         raise BadRequest(exc.detail)
 
-    try:
-        text = extract_text(file.stream)
-    except TextExtractionTimeout:
-        return Response('Text extraction timed out', status_code=500)
-
-    except TextExtractionError:
-        return Response('Text extraction could not be performed', status_code=500)
-
-    domains = params.domains or TAG_DOMAINS.keys()
-    response = {}
-    for domain in domains:
-        response[domain] = get_domain_tags(
-            domain=domain,
-            es_client=es_client,
-            text=text,
-            min_score=params.min_score,
-            constant_score=params.constant_score,
-            offset=params.offset,
-            limit=params.limit,
-        )
-    return response
+    return source, params, file
+
+
+def extract_from_form(
+    form: FormStream,
+    registry: DomainRegistry,
+    tag_cache: TagCache,
+    extraction_cache: ExtractionCache,
+    http_client: HTTPClient,
+) -> dict:
+    """
+    Tag extraction endpoint handler, accepting a multi-part form.
+
+    The uploaded file is sent to Tika as soon as it's reached, while it's received when forms
+    are streamed (see `FormStream`), unless a preceding `source` field selects another source.
+    The form is validated once fully parsed.
+    """
+    text, error = None, None
+    if form.file is not None and form.fields.get('source') not in ('text', 'url'):
+        try:
+            text = extract_text(form.file, extraction_cache, http_client)
+        except (TextExtractionTimeout, TextExtractionError) as exc:
+            error = exc
+
+    source, params, _ = parse_form(form.finish())
+    check_stream_params(params)
+    if source == 'text':
+        return tag_text(params, registry, tag_cache)
+    elif source == 'url':
+        return extract_from_url(params, registry, tag_cache, extraction_cache, http_client)
+
+    if error is not None:
+        return Response(extraction_error_message(error), status_code=500)
 
+    return tag_extracted_text(params, registry, tag_cache, text)
 
-def get_taxon_details(params: QueryParams, es_client: Elasticsearch) -> dict:
+
+def get_taxon_details(params: QueryParams, registry: DomainRegistry) -> dict:
     terms = dict(params)
     domain = terms.pop('domain')
-    details = _get_taxon_details(domain, es_client, **terms)
+    details = _get_taxon_details(domain, registry, **terms)
     if details is None:
         raise NotFound
     return details
 
 
+def prepare_taxa_queries(indexer, queries):
+    """
+    Returns:
+        A list of `(key, terms, error)` tuples, one for each query of a batch. Names are keyed
+        as is, term dicts by their query string.
+    """
+    prepared = []
+    for query in queries:
+        if isinstance(query, str):
+            key, terms = query, {indexer.tag_field_name: query}
+        else:
+            key, terms = urlencode(sorted(query.items())), dict(query)
+        unknown = sorted(set(terms) - set(indexer.field_names))
+        error = f'Unknown fields: {", ".join(unknown)}' if unknown else None
+        prepared.append((key, terms, error))
+    return prepared
+
+
+def taxa_batch_results(prepared, taxa):
+    """Keys the taxa found for the valid queries of a batch, see `prepare_taxa_queries()`."""
+    taxa = iter(taxa)
+    results = {}
+    for key, _, error in prepared:
+        if error is None:
+            taxon = next(taxa)
+            results[key] = taxon if taxon is not None else {'error': 'Not found'}
+        else:
+            results[key] = {'error': error}
+    return results
+
+
+def get_taxa_batch(params: TaxaBatchParams, registry: DomainRegistry) -> dict:
+    """
+    Batch taxon lookup endpoint handler, accepts parameters as JSON.
+    All the queries are answered with a single search request, or in memory.
+
+    Returns:
+        A dict mapping each query to its taxon. Queries with no match have an `error` instead.
+    """
+    indexer = registry.taxon_indexers[params.domain]
+    prepared = prepare_taxa_queries(indexer, params.queries)
+    taxa = indexer.first_many(terms for _, terms, error in prepared if error is None)
+    return taxa_batch_results(prepared, taxa)
+
+
+def metrics(tag_cache: TagCache, extraction_cache: ExtractionCache) -> Response:
+    """
+    Metrics endpoint handler, in the Prometheus text format. Metrics are those of the worker
+    process serving the request.
+    """
+    content = REGISTRY.render() + render_cache_stats(
+        {'tags': tag_cache, 'extraction': extraction_cache}
+    )
+    return Response(content, headers={'Content-Type': 'text/plain; version=0.0.4'})
+
+
+def readiness_check(ok, start, budget):
+    """Returns the result of a `/ready` check started at `start`, failed if over `budget`."""
+    latency = time.perf_counter() - start
+    return {'ok': bool(ok) and latency <= budget, 'latency': round(latency, 4)}
+
+
+def readiness_response(registry, elasticsearch, tika):
+    ready = registry.warmup.done and elasticsearch['ok'] and tika['ok']
+    content = {
+        'ready': ready,
+        'warmup': registry.warmup.status(),
+        'elasticsearch': elasticsearch,
+        'tika': tika,
+    }
+    return JSONResponse(content, status_code=200 if ready else 503)
+
+
+def ready(registry: DomainRegistry, http_client: HTTPClient) -> Response:
+    """
+    Readiness endpoint handler, for load balancer health checks: responds with status 200 once
+    the worker is warmed up, and ElasticSearch and Tika answered within `READY_ES_BUDGET` and
+    `READY_TIKA_BUDGET`, 503 otherwise. The response details each check. A failed warmup is
+    started again.
+    """
+    registry.warmup.start()
+    start = time.perf_counter()
+    ok = registry.client.ping(request_timeout=settings.READY_ES_BUDGET)
+    elasticsearch = readiness_check(ok, start, settings.READY_ES_BUDGET)
+
+    start = time.perf_counter()
+    try:
+        ok = http_client.get(f'{settings.TIKA_URL}/tika', timeout=settings.READY_TIKA_BUDGET).ok
+    except RequestException:
+        ok = False
+    tika = readiness_check(ok, start, settings.READY_TIKA_BUDGET)
+    return readiness_response(registry, elasticsearch, tika)
+
+
 def home(app: App):
     return app.render_template('home.html')
@@ -0,0 +1,228 @@
+import asyncio
+import errno
+import hashlib
+import json
+import logging
+
+import aiohttp
+
+from percolator.conf import settings
+
+from .text import (
+    CHUNK_SIZE,
+    tika_headers,
+    parse_tika_response,
+    check_content_length,
+    fetch_errors,
+)
+from .exceptions import TextExtractionTimeout, TextExtractionConnectionError, DocumentTooLarge
+from .metrics import STAGE_LATENCY, DOCUMENT_SIZE
+
+log = logging.getLogger(__name__)
+
+# Failures to fetch a document, see `fetch_errors()`
+FETCH_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+
+def is_retryable_error(exc):
+    """
+    Whether a request failed while connecting, or was reset or disconnected by the server,
+    unlike read timeouts, see `AsyncHTTPClient`.
+    """
+    if isinstance(exc, (aiohttp.ClientConnectorError, aiohttp.ServerDisconnectedError)):
+        return True
+    if isinstance(exc, aiohttp.ClientOSError) and exc.errno == errno.ECONNRESET:
+        return True
+    # Connection timeouts are raised from the `asyncio.TimeoutError` of the connector, unlike
+    # read timeouts
+    return isinstance(exc, aiohttp.ServerTimeoutError) and isinstance(
+        exc.__cause__, asyncio.TimeoutError
+    )
+
+
+class AsyncHTTPClient:
+    """
+    Pooled, keep-alive asynchronous HTTP client, the `asyncio` counterpart of `HTTPClient`.
+
+    Retries with exponential backoff on connection errors, connection resets and `503 Service
+    Unavailable` responses, but not on read timeouts. Streamed request bodies (async iterables)
+    are never retried.
+    The session is created on first use, so it's bound to the running event loop.
+
+    Args:
+        pool_size (int): The maximum number of connections kept open per host.
+        connect_timeout (float): The connection timeout, in seconds.
+        read_timeout (float): The read timeout, in seconds.
+        retries (int): The maximum number of retries.
+        backoff_factor (float): Retries are delayed by `backoff_factor * 2 ** (retry - 1)` seconds.
+        keep_alive (bool): Keep connections open between requests.
+    """
+
+    retry_statuses = (503,)
+
+    def __init__(
+        self,
+        pool_size=10,
+        connect_timeout=3.05,
+        read_timeout=10,
+        retries=2,
+        backoff_factor=0.2,
+        keep_alive=True,
+    ):
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.keep_alive = keep_alive
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.pool_size, force_close=not self.keep_alive
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def request(self, method, url, data=None, **kwargs):
+        """
+        Returns:
+            An `aiohttp.ClientResponse`, to be released by the caller, e.g. using it as
+            an async context manager.
+        """
+        retries = self.retries if data is None or isinstance(data, (bytes, str)) else 0
+        for retry in range(retries + 1):
+            if retry:
+                await asyncio.sleep(self.backoff_factor * 2 ** (retry - 1))
+            try:
+                response = await self.session.request(method, url, data=data, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+                if retry == retries or not is_retryable_error(exc):
+                    raise
+                continue
+            if response.status not in self.retry_statuses or retry == retries:
+                return response
+            response.release()
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def put(self, url, data=None, **kwargs):
+        return await self.request('PUT', url, data=data, **kwargs)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class AsyncHashingReader:
+    """Wraps an async iterable of bytes, computing the SHA-256 digest of the chunks as they go."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.hash = hashlib.sha256()
+
+    async def __aiter__(self):
+        async for data in self.chunks:
+            self.hash.update(data)
+            yield data
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+async def limit_chunks(chunks, max_bytes):
+    """Passes an async iterable of bytes through, raising `DocumentTooLarge` past `max_bytes`."""
+    bytes_read = 0
+    async for data in chunks:
+        bytes_read += len(data)
+        if max_bytes is not None and bytes_read > max_bytes:
+            raise DocumentTooLarge
+        yield data
+
+
+async def extract_text_async(data, cache=None, http_client=None):
+    """
+    Sends a document to Tika for text extraction, the `asyncio` counterpart of `extract_text()`.
+
+    Args:
+        data: The document, either as bytes or as an async iterable of bytes, which is streamed.
+        cache: An `ExtractionCache`. Its lookups are only done for bytes, as for seekable files.
+        http_client: An `AsyncHTTPClient`.
+    """
+    hashing_reader = None
+    if cache is not None and cache.enabled:
+        if isinstance(data, bytes):
+            digest = hashlib.sha256(data).hexdigest()
+            content = cache.get(digest)
+            if content is not None:
+                return content
+        else:
+            data = hashing_reader = AsyncHashingReader(data)
+
+    if isinstance(data, bytes):
+        DOCUMENT_SIZE.observe(len(data))
+    try:
+        with STAGE_LATENCY.time(stage='tika'):
+            async with await http_client.put(
+                f'{settings.TIKA_URL}/rmeta/text', data=data, headers=tika_headers(), ssl=False
+            ) as tika_response:
+                body = await tika_response.text()
+    except asyncio.TimeoutError:
+        raise TextExtractionTimeout
+    except aiohttp.ClientConnectionError:
+        raise TextExtractionConnectionError
+
+    try:
+        content = parse_tika_response(body)
+    except json.decoder.JSONDecodeError:  # Tika's response was not valid JSON
+        return ''
+
+    if cache is not None and cache.enabled:
+        if hashing_reader is not None:
+            digest = hashing_reader.hexdigest()
+        cache.set(digest, content)
+
+    return content
+
+
+async def _read_limited(response, max_bytes):
+    chunks = []
+    async for data in limit_chunks(response.content.iter_chunked(CHUNK_SIZE), max_bytes):
+        chunks.append(data)
+    return b''.join(chunks)
+
+
+async def extract_text_from_url_async(
+    url, cache=None, http_client=None, max_bytes=None, streaming=True
+):
+    """
+    Fetches the content from an URL and sends it to Tika for text extraction, the `asyncio`
+    counterpart of `extract_text_from_url()`.
+
+    In `streaming` mode the content is piped to Tika while it is downloaded. If the connection
+    to Tika fails, or when not streaming, the content is fetched again and read in memory first
+    (at most `max_bytes`), so the upload can be retried.
+    """
+    with fetch_errors(url, FETCH_ERRORS):
+        if streaming:
+            # Streamed content is downloaded while Tika reads it, so only the response headers
+            # count as download time
+            with STAGE_LATENCY.time(stage='download'):
+                r = await http_client.get(url)
+            async with r:
+                check_content_length(r.headers.get('Content-Length'), max_bytes)
+                chunks = limit_chunks(r.content.iter_chunked(CHUNK_SIZE), max_bytes)
+                try:
+                    return await extract_text_async(chunks, cache, http_client)
+                except TextExtractionConnectionError:
+                    log.warning(
+                        f'Streamed extraction failed for {url}, retrying with a buffered copy'
+                    )
+
+        with STAGE_LATENCY.time(stage='download'):
+            async with await http_client.get(url) as r:
+                check_content_length(r.headers.get('Content-Length'), max_bytes)
+                data = await _read_limited(r, max_bytes)
+        return await extract_text_async(data, cache, http_client)
@@ -0,0 +1,202 @@
+import logging
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+
+class MemoryCache:
+    """
+    Thread-safe, bounded LRU cache.
+
+    Args:
+        max_entries (int): The maximum number of entries kept. Nothing is cached when `0`.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class DiskCache:
+    """
+    Size-capped cache of zlib-compressed byte strings, one file per entry.
+
+    Least recently used entries (by file modification time, updated on reads) are evicted
+    once the total size exceeds `max_bytes`. Writes are atomic, so the directory can be
+    shared by several worker processes.
+
+    Args:
+        path: The cache directory, created if missing.
+        max_bytes (int): The maximum total (compressed) size of the entries.
+        compress_level (int): The zlib compression level.
+    """
+
+    def __init__(self, path, max_bytes, compress_level=6):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        self._size = sum(f.stat().st_size for f in self._files())
+        self.hits = 0
+        self.misses = 0
+
+    def _files(self):
+        return (f for f in self.path.glob('*/*') if f.is_file() and not f.name.startswith('.'))
+
+    def _entry_path(self, key):
+        return self.path / key[:2] / key
+
+    def get(self, key, default=None):
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = zlib.decompress(f.read())
+            os.utime(path)
+        except (OSError, zlib.error):
+            self.misses += 1
+            return default
+        self.hits += 1
+        return data
+
+    def set(self, key, value):
+        data = zlib.compress(value, self.compress_level)
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._entry_path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            log.exception(f'Could not write cache entry {path}')
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Deletes the least recently used entries, down to 90% of `max_bytes`."""
+        entries = []
+        for f in self._files():
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+        entries.sort()
+
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, f in entries:
+            if self._size <= target:
+                break
+            try:
+                f.unlink()
+            except OSError:
+                continue
+            self._size -= size
+
+    def stats(self):
+        return {
+            'bytes': self._size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class TieredCache:
+    """
+    An in-memory LRU cache, backed by an optional on-disk cache.
+    Disk hits are promoted to memory.
+
+    Args:
+        memory: A `MemoryCache` instance.
+        disk: A `DiskCache` instance, or `None`.
+        dumps: Serializes values to bytes, for storage on disk.
+        loads: Deserializes values from bytes.
+    """
+
+    def __init__(self, memory, disk=None, dumps=None, loads=None):
+        self.memory = memory
+        self.disk = disk
+        self.dumps = dumps
+        self.loads = loads
+
+    def get(self, key, default=None):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if self.disk is not None:
+            data = self.disk.get(key)
+            if data is not None:
+                value = self.loads(data)
+                self.memory.set(key, value)
+                return value
+
+        return default
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, self.dumps(value))
+
+    def stats(self):
+        stats = {'memory': self.memory.stats()}
+        if self.disk is not None:
+            stats['disk'] = self.disk.stats()
+        return stats
@@ -0,0 +1,176 @@
+"""
+Compaction of the texts extracted by Tika, before they're tagged.
+
+Extracted texts, PDFs' in particular, are padded with running headers and footers, page
+numbers, line break hyphenation and whitespace runs, all sent to ElasticSearch and analyzed by
+the percolate query of every domain. The tag analyzers only tokenize runs of letters, so
+dropping characters that aren't letters doesn't change the tokens, while rejoining hyphenated
+words and dropping repeated lines fix phrases broken across lines and pages.
+
+Steps are applied in the order of `STEPS`. Mentions are still found in the text as extracted,
+so that their counts and offsets refer to the document.
+"""
+import re
+from collections import Counter
+
+from percolator.conf import settings
+from .exceptions import ConfigurationError
+from .metrics import STAGE_LATENCY, COMPACTION_REMOVED
+
+# A hyphen at the end of a line, between letters
+_HYPHENATED_RE = re.compile(r'(?<=[^\W\d_])[-\u00ad\u2010][ \t]*\r?\n[ \t]*(?=[^\W\d_])')
+# A whitespace-separated run of characters that aren't letters
+_NON_LINGUISTIC_RE = re.compile(r'(?<!\S)(?:[^\w\s]|[\d_])+(?!\S)')
+_SPACES_RE = re.compile(r'[^\S\n]+')
+_NEWLINES_RE = re.compile(r' ?\n\s*')
+_DIGITS_RE = re.compile(r'\d+')
+
+# Lines at the start and at the end of pages, where running headers and footers are looked for
+PAGE_EDGE_LINES = 3
+# Number of non-blank lines of a page, for texts without form feeds between pages
+PAGE_LINES = 40
+
+
+def rejoin_hyphenated(text):
+    """Rejoins the words hyphenated at the end of a line, e.g. `conser-\\nvation`."""
+    return _HYPHENATED_RE.sub(lambda m: '' if text[m.end()].islower() else m.group(), text)
+
+
+def _line_key(line, max_length):
+    """Returns the key of a line for `drop_repeated_lines()`, or `None` if it's never dropped."""
+    line = line.strip()
+    if not line or len(line) > max_length:
+        return None
+    key = ' '.join(_DIGITS_RE.sub('', line).lower().split())
+    return key if any(c.isalpha() for c in key) else None
+
+
+def _edge_indexes(lines, edge_lines):
+    """Returns the indexes of the first and last `edge_lines` non-blank `lines` of a page."""
+    indexes = [i for i, line in enumerate(lines) if line.strip()]
+    return set(indexes[:edge_lines] + indexes[-edge_lines:])
+
+
+def _drop_page_edge_lines(pages, min_repeats, max_length, min_page_ratio):
+    """Drops the repeated lines of pages separated by form feeds, see `drop_repeated_lines()`."""
+    pages = [page.split('\n') for page in pages]
+    keys = [[_line_key(line, max_length) for line in lines] for lines in pages]
+    edges = [_edge_indexes(lines, PAGE_EDGE_LINES) for lines in pages]
+    counts = Counter(
+        key
+        for page_keys, page_edges in zip(keys, edges)
+        for key in {page_keys[i] for i in page_edges}
+        if key is not None
+    )
+    min_pages = max(min_repeats, min_page_ratio * len(pages))
+    repeated = {key for key, count in counts.items() if count >= min_pages}
+    if not repeated:
+        return pages
+
+    seen = set()
+    kept_pages = []
+    for lines, page_keys, page_edges in zip(pages, keys, edges):
+        kept = []
+        for i, (line, key) in enumerate(zip(lines, page_keys)):
+            if i in page_edges and key in repeated:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(line)
+        kept_pages.append(kept)
+    return kept_pages
+
+
+def _drop_spread_lines(lines, min_repeats, max_length, min_page_ratio):
+    """Drops the repeated lines of a text without form feeds, see `drop_repeated_lines()`."""
+    keys = [_line_key(line, max_length) for line in lines]
+    positions = {}
+    for position, key in enumerate(key for line, key in zip(lines, keys) if line.strip()):
+        if key is not None:
+            positions.setdefault(key, []).append(position)
+    pages = sum(1 for line in lines if line.strip()) / PAGE_LINES
+    min_count = max(min_repeats, min_page_ratio * pages)
+    min_gap = PAGE_LINES // 4
+    repeated = {
+        key
+        for key, key_positions in positions.items()
+        if len(key_positions) >= min_count
+        and all(b - a >= min_gap for a, b in zip(key_positions, key_positions[1:]))
+    }
+    if not repeated:
+        return lines
+
+    seen = set()
+    kept = []
+    for line, key in zip(lines, keys):
+        if key in repeated:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line)
+    return kept
+
+
+def drop_repeated_lines(text, min_repeats=3, max_length=120, min_page_ratio=0.5):
+    """
+    Keeps only the first occurrence of running headers and footers: short lines repeated at
+    page boundaries on at least `min_repeats` pages, and `min_page_ratio` of all the pages.
+    Lines differing only in their digits (such as `Page 2 of 10`) are considered the same.
+
+    In texts with form feeds, these are lines among the first or last `PAGE_EDGE_LINES` of
+    the pages, and their occurrences in the body of pages are kept. In texts without, pages
+    are assumed to be `PAGE_LINES` long, and the occurrences of a line must all be at least a
+    quarter page apart, unlike the repeated cells of a table.
+    """
+    if '\f' in text:
+        pages = _drop_page_edge_lines(text.split('\f'), min_repeats, max_length, min_page_ratio)
+        return '\f'.join('\n'.join(lines) for lines in pages)
+    return '\n'.join(
+        _drop_spread_lines(text.split('\n'), min_repeats, max_length, min_page_ratio)
+    )
+
+
+def strip_non_linguistic(text):
+    """Drops the whitespace-separated runs without letters, e.g. numbers and punctuation."""
+    return _NON_LINGUISTIC_RE.sub('', text)
+
+
+def collapse_whitespace(text):
+    """Collapses whitespace runs into a single space, or a single line break if they have one."""
+    return _NEWLINES_RE.sub('\n', _SPACES_RE.sub(' ', text)).strip()
+
+
+STEPS = {
+    'hyphenation': rejoin_hyphenated,
+    'repeated_lines': drop_repeated_lines,
+    'non_linguistic': strip_non_linguistic,
+    'whitespace': collapse_whitespace,
+}
+
+
+def get_steps(names):
+    """Returns the `(name, function)` pairs of the named steps, in their `STEPS` order."""
+    unknown = set(names) - set(STEPS)
+    if unknown:
+        raise ConfigurationError(f'Unknown text compaction steps: {", ".join(sorted(unknown))}')
+    return [(name, step) for name, step in STEPS.items() if name in names]
+
+
+def compact_text(text, steps=None):
+    """
+    Compacts an extracted text, counting the characters removed by each step.
+
+    Args:
+        steps: The names of the steps to apply, defaults to the `TEXT_COMPACTION` setting.
+    """
+    steps = get_steps(settings.TEXT_COMPACTION if steps is None else steps)
+    if not steps or not text:
+        return text
+
+    length = len(text)
+    with STAGE_LATENCY.time(stage='compaction'):
+        for name, step in steps:
+            text = step(text)
+            COMPACTION_REMOVED.inc(length - len(text), step=name)
+            length = len(text)
+    return text
@@ -10,3 +10,23 @@ class TextExtractionError(Exception):
 
 class TextExtractionTimeout(Exception):
     pass
+
+
+class TextExtractionConnectionError(TextExtractionError):
+    pass
+
+
+class DocumentTooLarge(TextExtractionError):
+    pass
+
+
+class DocumentFetchError(TextExtractionError):
+    pass
+
+
+class IndexBuildError(Exception):
+    pass
+
+
+class InvalidCursor(Exception):
+    pass
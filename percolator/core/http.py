@@ -0,0 +1,100 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+
+
+def is_seekable(file):
+    try:
+        return file.seekable()
+    except AttributeError:
+        return False
+
+
+def is_replayable(data):
+    """Whether a request body can be sent again when retrying."""
+    return data is None or isinstance(data, (bytes, str, dict)) or is_seekable(data)
+
+
+class ResetRetry(Retry):
+    """
+    `Retry` of read errors such as connection resets, but not of read timeouts: the server may
+    still be processing the request (e.g. a long Tika extraction), and retrying would only
+    multiply the wait and the server's load.
+    """
+
+    def increment(
+        self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None
+    ):
+        if isinstance(error, ReadTimeoutError):
+            raise error.with_traceback(_stacktrace)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+class HTTPClient:
+    """
+    Pooled, keep-alive HTTP client, retrying with exponential backoff on connection errors,
+    connection resets and `503 Service Unavailable` responses, but not on read timeouts (see
+    `ResetRetry`).
+
+    Request bodies that can't be replayed (i.e. non-seekable streams) are never retried.
+
+    Args:
+        pool_size (int): The maximum number of connections kept open per host.
+        connect_timeout (float): The connection timeout, in seconds.
+        read_timeout (float): The read timeout, in seconds.
+        retries (int): The maximum number of retries.
+        backoff_factor (float): Retries are delayed by `backoff_factor * 2 ** (retry - 1)` seconds.
+        keep_alive (bool): Keep connections open between requests.
+    """
+
+    retry_statuses = (503,)
+
+    def __init__(
+        self,
+        pool_size=10,
+        connect_timeout=3.05,
+        read_timeout=10,
+        retries=2,
+        backoff_factor=0.2,
+        keep_alive=True,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        retry = ResetRetry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.retry_statuses,
+            raise_on_status=False,
+        )
+        self.session = self._mk_session(pool_size, retry, keep_alive)
+        self.unretried_session = self._mk_session(pool_size, 0, keep_alive)
+
+    @staticmethod
+    def _mk_session(pool_size, max_retries, keep_alive):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def request(self, method, url, data=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        session = self.session if is_replayable(data) else self.unretried_session
+        return session.request(method, url, data=data, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request('PUT', url, data=data, **kwargs)
+
+    def close(self):
+        self.session.close()
+        self.unretried_session.close()
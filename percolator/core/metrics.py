@@ -0,0 +1,203 @@
+"""
+In-process metrics, exposed in the Prometheus text format by the `/metrics` endpoint.
+
+Metrics are kept per process: with several workers, each one reports its own, so they should
+be scraped per worker or summed by the monitoring system.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latencies, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Sizes, in bytes or characters
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # 1KiB to 1GiB
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base metric, with a value per combination of labels.
+
+    Args:
+        name: The metric name.
+        description: The help text.
+        labelnames: The names of the labels, passed as keyword arguments when recording.
+    """
+
+    type = None
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def samples(self):
+        """Generator of `(name suffix, label values, extra labels, value)` tuples."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            samples = list(self.samples())
+        for suffix, values, extra, value in samples:
+            labels = _format_labels(self.labelnames, values, extra)
+            lines.append(f'{self.name}{suffix}{labels} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield '', key, (), value
+
+
+class Histogram(Metric):
+    """
+    Histogram of observed values, counted in cumulative `buckets` of upper bounds.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, description, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, then +Inf, then the sum of the values
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[i] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager observing the time spent in its block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        bounds = self.buckets + (float('inf'),)
+        for key, counts in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield '_bucket', key, (('le', _format_value(bound)),), cumulative
+            yield '_count', key, (), cumulative
+            yield '_sum', key, (), counts[-1]
+
+
+class Registry:
+    """A set of metrics, rendered together."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter(
+    'percolator_requests_total', 'HTTP requests, by route and status.', ('route', 'status')
+)
+REQUEST_LATENCY = REGISTRY.histogram(
+    'percolator_request_duration_seconds', 'HTTP request latency, by route.', ('route',)
+)
+STAGE_LATENCY = REGISTRY.histogram(
+    'percolator_stage_duration_seconds',
+    'Latency of the request processing stages: form_parse, download, tika, percolate, '
+    'local_tagging, compaction, serialization and compression. local_tagging is labelled by '
+    'domain, and so is percolate when a single domain is searched.',
+    ('stage', 'domain'),
+)
+ES_TOOK = REGISTRY.histogram(
+    'percolator_elasticsearch_took_seconds',
+    'Time ElasticSearch reports spending on percolate searches, by index.',
+    ('index',),
+)
+PREFILTER = REGISTRY.counter(
+    'percolator_prefilter_total',
+    'Percolations prefiltered with the first tokens of the queries, by index and outcome: '
+    'skipped, narrowed or full.',
+    ('index', 'outcome'),
+)
+COMPACTION_REMOVED = REGISTRY.counter(
+    'percolator_compaction_removed_characters_total',
+    'Characters removed from the extracted texts before tagging, by compaction step.',
+    ('step',),
+)
+DOCUMENT_SIZE = REGISTRY.histogram(
+    'percolator_document_bytes', 'Size of the documents sent to Tika.', buckets=SIZE_BUCKETS
+)
+TEXT_SIZE = REGISTRY.histogram(
+    'percolator_text_characters', 'Length of the texts tagged.', buckets=SIZE_BUCKETS
+)
+
+
+def render_cache_stats(caches):
+    """
+    Renders the hit and miss counters of caches, as reported by their `stats()` method.
+
+    Args:
+        caches: A dict mapping cache names to caches.
+    """
+    counters = {
+        'hits': Counter('percolator_cache_hits_total', 'Cache hits.', ('cache', 'tier')),
+        'misses': Counter('percolator_cache_misses_total', 'Cache misses.', ('cache', 'tier')),
+    }
+    for cache_name, cache in caches.items():
+        stats = cache.stats()
+        tiers = stats.items() if all(isinstance(s, dict) for s in stats.values()) else [('', stats)]
+        for tier, tier_stats in tiers:
+            for stat, counter in counters.items():
+                if stat in tier_stats:
+                    counter.inc(tier_stats[stat], cache=cache_name, tier=tier)
+    return '\n'.join(counter.render() for counter in counters.values()) + '\n'
@@ -1,52 +1,294 @@
+from contextlib import contextmanager
 from uuid import uuid4
+import logging
+import hashlib
 import tempfile
 import shutil
 import json
 import requests
+from urllib3.exceptions import HTTPError as URLLib3Error
 
 from percolator.conf import settings
 
 
-from .exceptions import TextExtractionError, TextExtractionTimeout
+from .cache import DiskCache
+from .http import HTTPClient, is_seekable
+from .metrics import STAGE_LATENCY, DOCUMENT_SIZE
+from .exceptions import (
+    TextExtractionError,
+    TextExtractionTimeout,
+    TextExtractionConnectionError,
+    DocumentTooLarge,
+    DocumentFetchError,
+)
 
+log = logging.getLogger(__name__)
 
-def extract_text(file):
-    headers = {
-        'Accept': 'application/json',
-        'Content-Disposition': f'attachment; filename={uuid4()}',
-    }
+CHUNK_SIZE = 64 * 1024
 
-    try:
-        tika_response = requests.put(
-            f'{settings.TIKA_URL}/rmeta/text',
-            data=file,
-            headers=headers,
-            verify=False,
-            timeout=settings.TIKA_TIMEOUT,
+
+class HashingReader:
+    """
+    Wraps a file-like object, computing the SHA-256 digest of the bytes as they are read.
+    Iterating over it yields chunks, so it can be streamed as a request body.
+    """
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.hash.update(data)
+        return data
+
+    def __iter__(self):
+        while True:
+            data = self.read(self.chunk_size)
+            if not data:
+                break
+            yield data
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+class LimitedReader:
+    """
+    Wraps a file-like object, raising `DocumentTooLarge` once more than `max_bytes` are read.
+    Iterating over it yields chunks, so it can be streamed as a request body.
+    """
+
+    def __init__(self, file, max_bytes, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.bytes_read += len(data)
+        if self.max_bytes is not None and self.bytes_read > self.max_bytes:
+            raise DocumentTooLarge
+        return data
+
+    def __iter__(self):
+        while True:
+            data = self.read(self.chunk_size)
+            if not data:
+                break
+            yield data
+
+
+def file_digest(file, chunk_size=CHUNK_SIZE):
+    """Returns the SHA-256 digest of a seekable file's content, and rewinds it."""
+    position = file.tell()
+    h = hashlib.sha256()
+    for data in iter(lambda: file.read(chunk_size), b''):
+        h.update(data)
+    file.seek(position)
+    return h.hexdigest()
+
+
+def _remaining_size(file):
+    """Returns the number of bytes left to read from a seekable file."""
+    position = file.tell()
+    size = file.seek(0, 2) - position
+    file.seek(position)
+    return size
+
+
+class ExtractionCache:
+    """
+    Persistent cache of the text extracted by Tika, keyed on the SHA-256 digest of the documents.
+    Disabled when no `path` is provided.
+
+    Args:
+        path: The cache directory.
+        max_bytes (int): The maximum size of the (compressed) cached texts.
+    """
+
+    def __init__(self, path=None, max_bytes=None):
+        self.disk = DiskCache(path, max_bytes) if path else None
+
+    @property
+    def enabled(self):
+        return self.disk is not None
+
+    def get(self, digest):
+        if self.disk is None:
+            return None
+        data = self.disk.get(digest)
+        return data.decode('utf-8') if data is not None else None
+
+    def set(self, digest, text):
+        if self.disk is not None:
+            self.disk.set(digest, text.encode('utf-8'))
+
+    def stats(self):
+        return self.disk.stats() if self.disk is not None else {}
+
+
+_default_http_client = None
+
+
+def get_default_http_client():
+    """Returns a process-wide `HTTPClient`, configured from the settings."""
+    global _default_http_client
+    if _default_http_client is None:
+        _default_http_client = HTTPClient(
+            pool_size=settings.HTTP_POOL_SIZE,
+            connect_timeout=settings.TIKA_CONNECT_TIMEOUT,
+            read_timeout=settings.TIKA_READ_TIMEOUT,
+            retries=settings.HTTP_RETRIES,
+            backoff_factor=settings.HTTP_BACKOFF_FACTOR,
+            keep_alive=settings.HTTP_KEEP_ALIVE,
         )
+    return _default_http_client
+
+
+TIKA_HEADERS = {'Accept': 'application/json'}
+
+
+def tika_headers():
+    return dict(TIKA_HEADERS, **{'Content-Disposition': f'attachment; filename={uuid4()}'})
+
+
+def parse_tika_response(body):
+    """
+    Returns the text content from the body of a Tika `/rmeta/text` response.
+
+    Raises `json.decoder.JSONDecodeError` if the body is not valid JSON.
+    """
+    tika_data = json.loads(body)
+    try:
+        return tika_data[0]['X-TIKA:content'].strip()
+    except (IndexError, AttributeError, TypeError):  # Tika could not extract any text
+        raise TextExtractionError
+    except KeyError:  # Tika could not detect any text content
+        return ''
+
+
+def extract_text(file, cache=None, http_client=None):
+    """
+    Sends the file to Tika for text extraction, through `http_client` (an `HTTPClient`) or,
+    if missing, the default client.
+
+    When a `cache` is provided, the text previously extracted from an identical document is
+    returned without calling Tika. The digest of seekable files is computed before extraction,
+    otherwise it is computed while the file is streamed to Tika, and only used for storing.
+    """
+    size = _remaining_size(file) if is_seekable(file) else None
+    source = file
+    hashing_reader = None
+    if cache is not None and cache.enabled:
+        if is_seekable(file):
+            digest = file_digest(file)
+            content = cache.get(digest)
+            if content is not None:
+                return content
+        else:
+            file = hashing_reader = HashingReader(file)
+
+    headers = tika_headers()
+
+    http_client = http_client or get_default_http_client()
+    try:
+        with STAGE_LATENCY.time(stage='tika'):
+            tika_response = http_client.put(
+                f'{settings.TIKA_URL}/rmeta/text',
+                data=file,
+                headers=headers,
+                verify=False,
+            )
     except requests.exceptions.Timeout:
         raise TextExtractionTimeout
+    except requests.exceptions.ConnectionError:
+        raise TextExtractionConnectionError
+
+    if size is None:
+        size = getattr(source, 'bytes_read', None)  # e.g. a `LimitedReader`
+    if size is not None:
+        DOCUMENT_SIZE.observe(size)
 
     try:
-        tika_data = tika_response.json()
-        content = tika_data[0]['X-TIKA:content'].strip()
-    except (IndexError, AttributeError):  # Tika could not extract any text
-        raise TextExtractionError
+        content = parse_tika_response(tika_response.text)
     except json.decoder.JSONDecodeError:  # Tika's response was not valid JSON
         return ''
-    except KeyError:  # Tika could not detect any text content
-        return ''
+
+    if cache is not None and cache.enabled:
+        if hashing_reader is not None:
+            digest = hashing_reader.hexdigest()
+        cache.set(digest, content)
 
     return content
 
 
-def extract_text_from_url(url):
+def _check_content_length(response, max_bytes):
+    check_content_length(response.headers.get('Content-Length'), max_bytes)
+
+
+def check_content_length(content_length, max_bytes):
+    """Raises `DocumentTooLarge` if a `Content-Length` header value exceeds `max_bytes`."""
+    try:
+        too_large = max_bytes is not None and int(content_length) > max_bytes
+    except (TypeError, ValueError):
+        return
+    if too_large:
+        raise DocumentTooLarge
+
+
+@contextmanager
+def fetch_errors(url, errors=(requests.RequestException, URLLib3Error, ValueError)):
+    """Raises `DocumentFetchError` for the `errors` of fetching an URL, e.g. an unreachable host."""
+    try:
+        yield
+    except errors as exc:
+        raise DocumentFetchError(f'Could not fetch {url}: {exc}') from exc
+
+
+def _spool_text_from_url(url, cache, http_client, max_bytes):
     """
     Streams the content from an URL into a temporary file, and sends it to Tika
     for text extraction.
     """
     with tempfile.TemporaryFile() as f:
-        with requests.get(url, stream=True) as r:
-            shutil.copyfileobj(r.raw, f)
+        with STAGE_LATENCY.time(stage='download'):
+            with http_client.get(url, stream=True) as r:
+                _check_content_length(r, max_bytes)
+                r.raw.decode_content = True
+                shutil.copyfileobj(LimitedReader(r.raw, max_bytes), f, CHUNK_SIZE)
         f.seek(0)
-        return extract_text(f)
+        return extract_text(f, cache, http_client)
+
+
+def extract_text_from_url(url, cache=None, http_client=None, max_bytes=None, streaming=True):
+    """
+    Fetches the content from an URL and sends it to Tika for text extraction.
+
+    In `streaming` mode the content is piped to Tika while it is downloaded, with a chunked
+    upload. A streamed upload can't be replayed, so if the connection to Tika fails the content
+    is fetched again and spooled into a temporary file first, which the HTTP client is able to retry with.
+
+    Raises `DocumentTooLarge` if the content exceeds `max_bytes`, and `DocumentFetchError` if it
+    can't be fetched.
+    """
+    http_client = http_client or get_default_http_client()
+    with fetch_errors(url):
+        if not streaming:
+            return _spool_text_from_url(url, cache, http_client, max_bytes)
+
+        # Streamed content is downloaded while Tika reads it, so only the response headers
+        # count as download time
+        with STAGE_LATENCY.time(stage='download'):
+            r = http_client.get(url, stream=True)
+        with r:
+            _check_content_length(r, max_bytes)
+            r.raw.decode_content = True
+            try:
+                return extract_text(LimitedReader(r.raw, max_bytes), cache, http_client)
+            except TextExtractionConnectionError:
+                log.warning(f'Streamed extraction failed for {url}, retrying with a spooled copy')
+
+        return _spool_text_from_url(url, cache, http_client, max_bytes)
@@ -1,7 +1,13 @@
 import attr
-from .base import BaseTagger, BaseQueryIndexer, BaseTaxonIndexer
-from .species import SpeciesQueryIndexer, SpeciesTagger, SpeciesTaxonIndexer
-from .countries import CountryTagger, CountryQueryIndexer
+from percolator.conf import settings
+from .base import BaseTagger, BaseQueryIndexer, BaseTaxonIndexer, MultiTagger
+from .local import BaseLocalTagger, tags_with_mentions
+from .species import SpeciesQueryIndexer, SpeciesTagger, SpeciesLocalTagger, SpeciesTaxonIndexer
+from .countries import CountryTagger, CountryLocalTagger, CountryQueryIndexer
+from .registry import DomainRegistry
+
+ENGINE_ELASTICSEARCH = 'elasticsearch'
+ENGINE_LOCAL = 'local'
 
 
 def _validate_ancestor(attribute, value, ancestor_cls):
@@ -21,6 +27,10 @@ def is_tagger(instance, attribute, value):
     _validate_ancestor(attribute, value, BaseTagger)
 
 
+def is_local_tagger(instance, attribute, value):
+    _validate_ancestor(attribute, value, BaseLocalTagger)
+
+
 @attr.s
 class Domain:
     name = attr.ib(validator=attr.validators.instance_of(str))
@@ -28,6 +38,27 @@ class Domain:
     taxon_indexer = attr.ib(validator=attr.validators.optional(validator=is_taxon_indexer))
     tagger = attr.ib(validator=is_tagger)
     description = attr.ib(validator=attr.validators.instance_of(str))
+    local_tagger = attr.ib(default=None, validator=attr.validators.optional(validator=is_local_tagger))
+    engine = attr.ib(
+        default=ENGINE_ELASTICSEARCH,
+        validator=attr.validators.in_([ENGINE_ELASTICSEARCH, ENGINE_LOCAL]),
+    )
+
+    def __attrs_post_init__(self):
+        if self.engine == ENGINE_LOCAL and self.local_tagger is None:
+            raise ValueError(f'"{self.name}" needs a local_tagger to use the {ENGINE_LOCAL} engine')
+
+    def get_tagger(self, indexer):
+        """Returns a tagger instance for the domain's engine."""
+        if self.engine == ENGINE_LOCAL:
+            return self.local_tagger(indexer=indexer)
+        return self.tagger(indexer=indexer)
+
+    def get_mention_tagger(self, indexer):
+        """Returns a tagger able to locate the domain's tags in texts, or `None`."""
+        if self.local_tagger is None:
+            return None
+        return self.local_tagger(indexer=indexer)
 
 
 _domains = [
@@ -36,6 +67,8 @@ _domains = [
         query_indexer=SpeciesQueryIndexer,
         taxon_indexer=SpeciesTaxonIndexer,
         tagger=SpeciesTagger,
+        local_tagger=SpeciesLocalTagger,
+        engine=ENGINE_ELASTICSEARCH,
         description='Species listed in the Appendices of CITES and CMS, as well as other CMS Family '
                     'listings and species included in the Annexes to the EU Wildlife Trade Regulations.'
     ),
@@ -44,8 +77,20 @@ _domains = [
         query_indexer=CountryQueryIndexer,
         taxon_indexer=None,
         tagger=CountryTagger,
+        local_tagger=CountryLocalTagger,
+        engine=ENGINE_ELASTICSEARCH,
         description='Countries'
     ),
 ]
 
 TAG_DOMAINS = {d.name: d for d in _domains}
+
+
+def get_registry(client):
+    """Returns a `DomainRegistry` of all the tag domains."""
+    return DomainRegistry(
+        TAG_DOMAINS,
+        client,
+        stats_ttl=settings.DOMAINS_STATS_TTL,
+        warmup_text_path=settings.WARMUP_TEXT_PATH if settings.WARMUP else None,
+    )
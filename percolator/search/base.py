@@ -1,12 +1,76 @@
 import logging
+import os
+import threading
 import csv
-from elasticsearch_dsl import DocType, Search, Index, Q
+import time
+from datetime import datetime
+from itertools import chain, islice
+from elasticsearch_dsl import DocType, Search, MultiSearch, Index, Q
 from elasticsearch_dsl.query import Query
-from elasticsearch.helpers import bulk
+from elasticsearch_dsl.response import Response
+from elasticsearch.exceptions import TransportError
+from elasticsearch.helpers import bulk, parallel_bulk
+
+from percolator.conf import settings
+from ..core.exceptions import IndexBuildError
+from ..core.metrics import STAGE_LATENCY, ES_TOOK, PREFILTER
+from .taxa import TaxonTable
+from .tokens import TokenPrefilter, word_set
 
 log = logging.getLogger('percolator_search')
 
 
+def _last_whitespace(text, start, end):
+    """Returns the position of the last whitespace character in `text[start:end]`, or `None`."""
+    for i in range(end - 1, max(start, 0) - 1, -1):
+        if text[i].isspace():
+            return i
+    return None
+
+
+async def execute_async(client, searches):
+    """
+    Executes `searches` with an `AsyncElasticsearch` client, in a single `_msearch` request.
+
+    Returns:
+        A list of `Response` objects, like `MultiSearch.execute()`.
+    """
+    ms = MultiSearch()
+    for s in searches:
+        ms = ms.add(s)
+    raw = await client.msearch(body=ms.to_dict())
+
+    responses = []
+    for s, r in zip(searches, raw['responses']):
+        if r.get('error', False):
+            raise TransportError('N/A', r['error']['type'], r['error'])
+        responses.append(Response(s, r))
+    return responses
+
+
+async def scan_async(client, search, scroll='5m'):
+    """
+    Async generator consuming the hits of `search` with a scroll, in pages of `Hit` objects,
+    like `Search.scan()` for an `AsyncElasticsearch` client.
+    """
+    params = dict(search._params)
+    preserve_order = params.pop('preserve_order', False)
+    body = search.to_dict()
+    if not preserve_order:
+        body['sort'] = ['_doc']
+
+    response = await client.search(index=search._index, body=body, scroll=scroll, **params)
+    scroll_id = response.get('_scroll_id')
+    try:
+        while response['hits']['hits']:
+            yield Response(search, response).hits
+            response = await client.scroll(scroll_id=scroll_id, scroll=scroll)
+            scroll_id = response.get('_scroll_id')
+    finally:
+        if scroll_id:
+            await client.clear_scroll(body={'scroll_id': [scroll_id]}, ignore=(404,))
+
+
 class PercolateQuery(Query):
     """
     Required to 'register' the `percolate` query name.
@@ -15,15 +79,179 @@ class PercolateQuery(Query):
     name = 'percolate'
 
 
-class BaseQueryIndexer:
+class BaseIndexer:
+    """
+    Versioned index management.
+
+    `index` is the live name used for searching, and is an alias. Each build writes to a new
+    timestamped physical index (a "generation"), which is warmed and verified before the alias
+    is atomically swapped to it. Older generations are then garbage-collected.
+    """
+
+    index = None
+    keep_generations = 2
+
+    def __init__(self, client):
+        self.client = client
+        self._base_search = None
+
+    @property
+    def base_search(self):
+        """
+        The `Search` of the live index, built once. Refining a `Search` returns a copy, so it
+        serves as a template for all the searches of the instance.
+        """
+        if self._base_search is None:
+            self._base_search = Search(using=self.client, index=self.index)
+        return self._base_search
+
+    def count(self):
+        return self.base_search.count()
+
+    @property
+    def generation_pattern(self):
+        return f'{self.index}-*'
+
+    def _new_generation_name(self):
+        return f'{self.index}-{datetime.utcnow():%Y%m%d%H%M%S%f}'
+
+    def _create_generation(self, doc_type, analyzer=None):
+        """
+        Creates a new, empty, physical index for `doc_type`.
+
+        Returns:
+            The name of the created index.
+        """
+        name = self._new_generation_name()
+        index = Index(name)
+        index.doc_type(doc_type)
+        if analyzer is not None:
+            index.analyzer(analyzer)
+
+        log.info(f'Creating index {name}')
+        index.create(using=self.client)
+        return name
+
+    def generations(self):
+        """Lists the physical indices built for `index`, oldest first."""
+        indices = self.client.indices.get(index=self.generation_pattern, ignore=404)
+        if 'status' in indices and 'error' in indices:
+            return []
+        return sorted(indices.keys())
+
+    def _generation_from_aliases(self, aliases):
+        generations = sorted(k for k in aliases.keys() if k.startswith(f'{self.index}-'))
+        return generations[-1] if generations else None
+
+    def current_generation(self):
+        """
+        Returns:
+            The name of the physical index currently behind the `index` alias, or `None`.
+        """
+        aliases = self.client.indices.get_alias(name=self.index, ignore=404)
+        return self._generation_from_aliases(aliases)
+
+    async def current_generation_async(self):
+        """Like `current_generation()`, for an `AsyncElasticsearch` client."""
+        aliases = await self.client.indices.get_alias(name=self.index, ignore=404)
+        return self._generation_from_aliases(aliases)
+
+    async def count_async(self):
+        """Like `count()`, for an `AsyncElasticsearch` client."""
+        response = await self.client.count(index=self.index)
+        return response['count']
+
+    def generation_built_at(self, generation):
+        """Returns the build time of a generation, from its name, or `None`."""
+        try:
+            return datetime.strptime(generation[len(self.index) + 1:], '%Y%m%d%H%M%S%f')
+        except (TypeError, ValueError):
+            return None
+
+    def stats_from_indices(self, indices):
+        """
+        Extracts the statistics of the live index from an index stats response.
+
+        Args:
+            indices: The `indices` of an `_stats` response, with `docs` and `store` metrics.
+
+        Returns:
+            A dict with the `generation`, its build time (`built_at`), its number of documents
+            (`tags_count`) and its size (`size_bytes`), or `None` if it's not in `indices`.
+        """
+        generation = self._generation_from_aliases(indices)
+        if generation is None and self.index in indices:
+            generation = self.index  # An un-versioned index
+        if generation is None:
+            return None
+        primaries = indices[generation]['primaries']
+        return {
+            'generation': generation,
+            'built_at': self.generation_built_at(generation),
+            'tags_count': primaries['docs']['count'],
+            'size_bytes': primaries['store']['size_in_bytes'],
+        }
+
+    def _warm(self, name):
+        """Runs a representative search against the index at `name`, before it goes live."""
+        Search(using=self.client, index=name)[:1].execute()
+
+    def _discard_generation(self, name):
+        log.info(f'Deleting index {name}')
+        self.client.indices.delete(index=name, ignore=404)
+
+    def _publish_generation(self, name, expected_count):
+        """
+        Verifies and warms the index at `name`, then swaps the `index` alias to point to it.
+        On verification failure the new index is discarded and the live one left untouched.
+        """
+        self.client.indices.refresh(index=name)
+        count = Search(using=self.client, index=name).count()
+        if count != expected_count:
+            self._discard_generation(name)
+            raise IndexBuildError(
+                f'Index {name} has {count} documents, expected {expected_count}'
+            )
+
+        log.info(f'Warming index {name}')
+        self._warm(name)
+
+        actions = [{'add': {'index': name, 'alias': self.index}}]
+        if self.client.indices.exists_alias(name=self.index):
+            actions = [
+                {'remove': {'index': self.generation_pattern, 'alias': self.index}}
+            ] + actions
+        elif self.client.indices.exists(index=self.index):
+            # An un-versioned index from before aliasing was introduced
+            actions = [{'remove_index': {'index': self.index}}] + actions
+
+        log.info(f'Publishing index {name} as {self.index}')
+        self.client.indices.update_aliases(body={'actions': actions})
+        self._collect_generations()
+
+    def _collect_generations(self):
+        """Deletes all but the `keep_generations` most recent generations."""
+        live = self.current_generation()
+        stale = self.generations()[:-self.keep_generations]
+        for name in stale:
+            if name != live:
+                self._discard_generation(name)
+
+
+class BaseQueryIndexer(BaseIndexer):
 
     index = None
     query_doc_type = DocType
     query_type = 'match'
     field_name = 'content'
+    bulk_chunk_size = 500
+    bulk_thread_count = 4
+    progress_every = 5000
 
-    def __init__(self, client):
-        self.client = client
+    def __init__(self, client, chunk_size=None, thread_count=None):
+        super().__init__(client)
+        self.chunk_size = int(chunk_size or self.bulk_chunk_size)
+        self.thread_count = int(thread_count or self.bulk_thread_count)
 
     @staticmethod
     def _read_tags(tags_path, lowercase=True):
@@ -48,16 +276,98 @@ class BaseQueryIndexer:
         """Prepares a query body dict that matches `term`."""
         return {self.query_type: {self.field_name: term}}
 
+    def _query_actions(self, tags, index_name, first_tokens=None):
+        """
+        Generator of bulk index actions, one query document per tag.
+
+        Args:
+            first_tokens: A dict mapping tags to the first tokens of all the texts their query
+                matches, stored for prefiltering (see `BaseTagger.get_prefilter()`). Every tag
+                must have some for the prefilter to be used.
+        """
+        doc_type = self.query_doc_type._doc_type.name
+        for t in tags:
+            source = {'query': self._mk_query_body(t), 'tag': t}
+            if first_tokens is not None and first_tokens.get(t):
+                source['first_tokens'] = sorted(first_tokens[t])
+            yield {'_index': index_name, '_type': doc_type, '_source': source}
+
+    def _register_queries(self, tags, index_name, first_tokens=None):
+        """
+        Bulk-indexes the query documents for `tags` into the index at `index_name`,
+        reporting progress and throughput.
+        The index is refreshed once, after all the queries are registered.
+
+        Returns:
+            The number of registered queries.
+        """
+        log.info(
+            f'Registering {len(tags)} queries '
+            f'(chunk size {self.chunk_size}, {self.thread_count} threads)'
+        )
+        started = time.monotonic()
+        registered = 0
+        failed = 0
+        results = parallel_bulk(
+            self.client,
+            self._query_actions(tags, index_name, first_tokens),
+            chunk_size=self.chunk_size,
+            thread_count=self.thread_count,
+            raise_on_error=False,
+        )
+        for ok, item in results:
+            if ok:
+                registered += 1
+            else:
+                failed += 1
+                log.error(f'Query registration failed: {item}')
+            done = registered + failed
+            if done % self.progress_every == 0:
+                rate = done / max(time.monotonic() - started, 1e-6)
+                log.info(f'Registered {done}/{len(tags)} queries ({rate:.0f}/s)')
+
+        self.client.indices.refresh(index=index_name)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        log.info(
+            f'Registered {registered} queries in {elapsed:.1f}s '
+            f'({registered / elapsed:.0f}/s), {failed} failed'
+        )
+        return registered
+
+    def _build_generation(self, tags, analyzer=None, first_tokens=None):
+        """
+        Builds a new index generation with the `tags` queries and publishes it.
+
+        Returns:
+            The number of registered queries.
+        """
+        name = self._create_generation(self.query_doc_type, analyzer)
+        try:
+            registered = self._register_queries(tags, name, first_tokens)
+        except Exception:
+            self._discard_generation(name)
+            raise
+        self._publish_generation(name, expected_count=len(tags))
+        return registered
+
+    def _warm(self, name):
+        """Percolates a sample of the registered tags, to load the queries."""
+        sample = self._warmup_sample(name)
+        Search(using=self.client, index=name).query(
+            'percolate', field='query', document={self.field_name: sample}
+        ).extra(size=0).execute()
+
+    def _warmup_sample(self, name, size=100):
+        """Builds a text from the first `size` registered tags of the index at `name`."""
+        s = Search(using=self.client, index=name)[:size]
+        return ' '.join(
+            getattr(getattr(hit.query, self.query_type), self.field_name) for hit in s.execute()
+        )
+
     def index_queries(self, tags_path):
         """Saves the tag names as query documents"""
-        log.info('Registering queries')
         tags = self._read_tags(tags_path)
-        for t in tags:
-            query_doc = self.query_doc_type(query=self._mk_query_body(t))
-            query_doc.save()
-
-    def count(self):
-        return Search(using=self.client, index=self.index).count()
+        return self._build_generation(tags)
 
 
 class BaseTagger:
@@ -69,6 +379,24 @@ class BaseTagger:
     """
 
     max_results = 10000  # Don't exceed 10k, this is the ES max window size
+    remote = True  # Percolates in ElasticSearch
+
+    # Texts longer than `window_size` characters are percolated in overlapping windows.
+    # The overlap must exceed the length of the longest tag phrase, whitespace included.
+    window_size = 200000
+    window_overlap = 1000
+
+    scan_size = 1000  # Hits fetched per scroll request, see `iter_tags()`
+    sort_field = 'tag'  # Unique keyword of the query documents, see `get_tags_page()`
+
+    # Keyword of the query documents holding their first tokens, see `get_prefilter()`
+    prefilter_field = 'first_tokens'
+    prefilter_ttl = 30  # How often the live generation is checked, in seconds
+    prefilter_max_tokens = 200000
+    prefilter_max_candidates = 10000  # Percolation isn't narrowed to more first tokens
+
+    _prefilters = {}  # Index name -> (prefilter, generation, monotonic time checked)
+    _prefilters_lock = threading.Lock()
 
     def __init__(self, indexer):
         self.indexer = indexer
@@ -89,22 +417,161 @@ class BaseTagger:
     def query_type(self):
         return self.indexer.query_type
 
-    def _search_query(self, text, constant_score=True):
-        if constant_score:
-            return Search(using=self.client, index=self.index).query(
-                'constant_score',
-                filter=Q('percolate', field='query', document={self.field_name: text}),
+    def generation(self):
+        """Identifies the set of queries the tags come from, i.e. the live index generation."""
+        return self.indexer.current_generation()
+
+    async def generation_async(self):
+        """Like `generation()`, for an `AsyncElasticsearch` client."""
+        return await self.indexer.current_generation_async()
+
+    def _prefilter_search(self, generation):
+        s = Search(using=self.client, index=generation or self.index).extra(size=0)
+        s.aggs.bucket('tokens', 'terms', field=self.prefilter_field, size=self.prefilter_max_tokens)
+        s.aggs.bucket('missing', 'missing', field=self.prefilter_field)
+        return s
+
+    def _prefilter_from_response(self, generation, response):
+        aggs = response['aggregations']
+        if aggs['missing']['doc_count'] == response['hits']['total']:
+            log.info(f'No first tokens in {generation or self.index}, prefiltering is off')
+            return None
+        if aggs['tokens']['sum_other_doc_count']:
+            log.warning(f'Too many first tokens in {generation or self.index}, prefiltering is off')
+            return None
+        prefilter = TokenPrefilter(generation, (b['key'] for b in aggs['tokens']['buckets']))
+        log.info(f'Loaded {len(prefilter)} first tokens from {generation or self.index}')
+        return prefilter
+
+    def _cached_prefilter(self, now, generation=None):
+        """
+        Returns the cached `(prefilter, generation, checked)` tuple if it's of `generation`, or
+        if it's recent enough when `generation` is missing.
+        """
+        cached = self._prefilters.get(self.index)
+        if cached is None:
+            return None
+        if generation is not None:
+            return cached if cached[1] == generation else None
+        return cached if now - cached[2] < self.prefilter_ttl else None
+
+    def get_prefilter(self, generation=None):
+        """
+        Returns the `TokenPrefilter` of an index generation, built at indexing time (see
+        `BaseQueryIndexer._query_actions()`), or `None` if prefiltering is off, or the generation
+        has no first tokens. It's loaded once per generation and process.
+
+        Percolation narrowed by a prefilter targets its generation, see `_percolate_query()`.
+
+        Args:
+            generation: The generation, e.g. the one results are cached for. Defaults to the
+                live generation, checked at most every `prefilter_ttl` seconds.
+        """
+        if not settings.PERCOLATE_PREFILTER:
+            return None
+        now = time.monotonic()
+        cached = self._cached_prefilter(now, generation)
+        if cached is not None:
+            return cached[0]
+
+        with self._prefilters_lock:
+            cached = self._cached_prefilter(now, generation)
+            if cached is not None:
+                return cached[0]
+            previous = self._prefilters.get(self.index)
+            prefilter = None
+            try:
+                if generation is None:
+                    generation = self.generation()
+                if previous is not None and previous[1] == generation:
+                    prefilter = previous[0]
+                else:
+                    s = self._prefilter_search(generation)
+                    response = self.client.search(index=s._index, body=s.to_dict())
+                    prefilter = self._prefilter_from_response(generation, response)
+            except Exception:
+                log.warning(f'Could not load the prefilter of {self.index}', exc_info=True)
+            self._prefilters[self.index] = (prefilter, generation, now)
+            return prefilter
+
+    async def get_prefilter_async(self, generation=None):
+        """Like `get_prefilter()`, for an `AsyncElasticsearch` client."""
+        if not settings.PERCOLATE_PREFILTER:
+            return None
+        now = time.monotonic()
+        cached = self._cached_prefilter(now, generation)
+        if cached is not None:
+            return cached[0]
+
+        previous = self._prefilters.get(self.index)
+        prefilter = None
+        try:
+            if generation is None:
+                generation = await self.generation_async()
+            if previous is not None and previous[1] == generation:
+                prefilter = previous[0]
+            else:
+                s = self._prefilter_search(generation)
+                response = await self.client.search(index=s._index, body=s.to_dict())
+                prefilter = self._prefilter_from_response(generation, response)
+        except Exception:
+            log.warning(f'Could not load the prefilter of {self.index}', exc_info=True)
+        self._prefilters[self.index] = (prefilter, generation, now)
+        return prefilter
+
+    def candidates(self, prefilter, words):
+        """
+        Args:
+            prefilter: A `TokenPrefilter`, or `None`.
+            words: The set of the tokens of a text, see `word_set()`.
+
+        Returns:
+            The first tokens of the queries that may match the text, to narrow percolation to.
+            If empty, no query can match. `None` if all the queries must be percolated.
+        """
+        if prefilter is None:
+            return None
+        candidates = prefilter.candidates(words)
+        if not candidates:
+            PREFILTER.inc(index=self.index, outcome='skipped')
+        elif len(candidates) > self.prefilter_max_candidates:
+            PREFILTER.inc(index=self.index, outcome='full')
+            return None
+        else:
+            PREFILTER.inc(index=self.index, outcome='narrowed')
+        return candidates
+
+    def _search_query(self, text, constant_score=True, candidates=None):
+        return self._percolate_query(constant_score, candidates, document={self.field_name: text})
+
+    def _percolate_query(self, constant_score=True, candidates=None, **percolate):
+        """
+        Returns a search with a `percolate` query, of a `document` or several `documents`,
+        narrowed to the queries with some of the `candidates` first tokens if provided. The
+        search then targets the generation the candidates come from, rather than the live one,
+        which may have changed since.
+        """
+        s = self.indexer.base_search
+        query = Q('percolate', field='query', **percolate)
+        if candidates is not None:
+            query = Q(
+                'bool',
+                must=[query],
+                filter=[Q('terms', **{self.prefilter_field: sorted(candidates)})],
             )
+            generation = getattr(candidates, 'generation', None)
+            if generation is not None:
+                s = s.index().index(generation)
+        if constant_score:
+            return s.query('constant_score', filter=query)
 
-        return Search(using=self.client, index=self.index).query(
-            'percolate', field='query', document={self.field_name: text}
-        )
+        return s.query(query)
 
-    def _percolate(
-        self, text, min_score=None, constant_score=True, offset=None, limit=None
+    def _prepare_search(
+        self, text, min_score=None, constant_score=True, offset=None, limit=None, candidates=None
     ):
         """
-        Percolates the provided text, with score filtering and paging.
+        Prepares the percolating search for the provided text, with score filtering and paging.
 
         Args:
             text: The text to percolate.
@@ -115,14 +582,14 @@ class BaseTagger:
             offset (int): The paging offset - if missing ElasticSearch's `from` defaults to 0.
             limit (int): The paging limit - if missing ElasticSearch's `size` defaults to 10.
             Note that `size` acts as `offset + limit`.
+            candidates: The first tokens to narrow percolation to, see `candidates()`.
 
-        Returns: the search response object.
+        Returns: the `Search` object.
         """
 
         limit = int(limit or self.max_results)
 
-        log.info('Fetching tags ...')
-        s = self._search_query(text, constant_score)
+        s = self._search_query(text, constant_score, candidates)
 
         if min_score is not None and not constant_score:
             s = s.extra(min_score=min_score)
@@ -133,32 +600,549 @@ class BaseTagger:
         else:
             s = s[:limit]
 
-        return s.execute()
+        return s
+
+    def windows(self, text):
+        """
+        Splits `text` into windows of at most `window_size` characters, overlapping by
+        `window_overlap` characters. Window boundaries are moved to whitespace when possible,
+        so that words are not cut.
+
+        Returns:
+            A list of `(start, end)` character offsets.
+        """
+        if len(text) <= self.window_size:
+            return [(0, len(text))]
+
+        step = self.window_size - self.window_overlap
+        slack = self.window_overlap // 4
+        windows = []
+        start = 0
+        while True:
+            end = start + self.window_size
+            if end >= len(text):
+                windows.append((start, len(text)))
+                return windows
+
+            boundary = _last_whitespace(text, end - slack, end)
+            if boundary is not None:
+                end = boundary
+            windows.append((start, end))
+
+            next_start = start + step
+            boundary = _last_whitespace(text, next_start - slack, next_start)
+            start = boundary + 1 if boundary is not None else next_start
+
+    def _prepare_searches(
+        self, text, min_score=None, constant_score=True, offset=None, limit=None, candidates=None
+    ):
+        """
+        Prepares the percolating searches for the provided text: a single one, with paging,
+        if the text fits in a window, otherwise one for each window, returning enough hits for
+        the page to be cut from their merged results.
+
+        Args: see `_prepare_search()`
+
+        Returns: a list of `Search` objects.
+        """
+        windows = self.windows(text)
+        if len(windows) == 1:
+            return [
+                self._prepare_search(text, min_score, constant_score, offset, limit, candidates)
+            ]
+
+        size = int(offset or 0) + int(limit or self.max_results)
+        return [
+            self._prepare_search(
+                text[start:end], min_score, constant_score, limit=size, candidates=candidates
+            )
+            for start, end in windows
+        ]
+
+    def _percolate(
+        self, text, min_score=None, constant_score=True, offset=None, limit=None
+    ):
+        """
+        Percolates the provided text, with score filtering and paging.
+
+        Args: see `_prepare_search()`
+
+        Returns: the search response object.
+        """
+        log.info('Fetching tags ...')
+        return self._prepare_search(text, min_score, constant_score, offset, limit).execute()
+
+    def format_tags(self, tags):
+        """Hook for adjusting the tag names before they are returned."""
+        return tags
+
+    def _tag_from_hit(self, hit):
+        return getattr(getattr(hit.query, self.query_type), self.field_name)
+
+    def _tags_from_response(self, response):
+        """Extracts the matches and their scores from the hits of a search `response`."""
+        tags = {self._tag_from_hit(hit): hit.meta.score for hit in response}
+        return self.format_tags(tags)
+
+    def _observe_took(self, responses):
+        for response in responses:
+            ES_TOOK.observe(response.took / 1000, index=self.index)
+
+    def _tags_from_responses(self, responses, offset=None, limit=None, windows=None):
+        """
+        Merges the tags found in the responses of the searches made by `_prepare_searches()`,
+        keeping the best score of each tag, and cuts the requested page.
+
+        Args:
+            windows: The windows the searches were made for, see `windows()`. When provided,
+                the windows each tag was found in are returned too.
+
+        Returns:
+            A dict of tags and their scores, or a `(tags, tag_windows)` tuple if `windows` is
+            provided, with `tag_windows` mapping tags to lists of `(start, end)` offsets.
+        """
+        self._observe_took(responses)
+        if len(responses) == 1 and windows is None:
+            return self._tags_from_response(responses[0])
+
+        tags = {}
+        tag_windows = {}
+        for i, response in enumerate(responses):
+            for tag, score in self._tags_from_response(response).items():
+                tags[tag] = max(score, tags.get(tag, score))
+                if windows is not None:
+                    tag_windows.setdefault(tag, []).append(windows[i])
+
+        if len(responses) > 1:
+            offset = int(offset or 0)
+            limit = int(limit or self.max_results)
+            ranked = sorted(tags.items(), key=lambda item: item[1], reverse=True)
+            tags = dict(ranked[offset:offset + limit])
+
+        if windows is None:
+            return tags
+        return tags, {tag: tag_windows[tag] for tag in tags}
+
+    def _execute(self, searches):
+        """Executes `searches`, in a single `_msearch` request if there are several."""
+        with STAGE_LATENCY.time(stage='percolate'):
+            if len(searches) == 1:
+                return [searches[0].execute()]
+
+            ms = MultiSearch(using=self.client)
+            for s in searches:
+                ms = ms.add(s)
+            return ms.execute()
 
     def get_tags(
         self, text, min_score=None, constant_score=True, offset=None, limit=None
     ):
         """
         Percolates the provided text, with score filtering and paging.
+        Long texts are percolated in windows, see `windows()`.
 
-        Args: see `_percolate()`
+        Args: see `_prepare_search()`
 
         Returns:
             A dict of tags and their scores. Note that the score is always `1` if `constant_score` is on.
         """
+        log.info('Fetching tags ...')
+        prefilter = self.get_prefilter()
+        candidates = self.candidates(prefilter, word_set(text)) if prefilter is not None else None
+        if candidates is not None and not candidates:
+            return self.format_tags({})
+        searches = self._prepare_searches(
+            text, min_score, constant_score, offset, limit, candidates
+        )
+        return self._tags_from_responses(self._execute(searches), offset, limit)
 
-        response = self._percolate(text, min_score, constant_score, offset, limit)
+    def _scan_searches(self, text, min_score=None, constant_score=True):
+        """
+        Prepares a search for each window of the text (see `windows()`), to be consumed with
+        a scroll. Hits are sorted by score unless `constant_score` is on.
+        """
+        searches = []
+        for start, end in self.windows(text):
+            s = self._search_query(text[start:end], constant_score)
+            if min_score is not None and not constant_score:
+                s = s.extra(min_score=min_score)
+            searches.append(s.params(size=self.scan_size, preserve_order=not constant_score))
+        return searches
+
+    def _iter_hits_tags(self, hits, seen):
+        """Generator of the formatted `(tag, score)` of hits, skipping the tags in `seen`."""
+        for hit in hits:
+            tag = self._tag_from_hit(hit)
+            if tag in seen:
+                continue
+            seen.add(tag)
+            score = hit.meta.score if hit.meta.score is not None else 1.0
+            yield from self.format_tags({tag: score}).items()
 
-        # Only return the matches and scores in hits
+    def iter_tags(self, text, min_score=None, constant_score=True, offset=None, limit=None):
+        """
+        Like `get_tags()`, but generates `(tag, score)` tuples while the hits are consumed with
+        a scroll, so results are neither held in memory nor bounded by `max_results`.
+        Tags are ordered by score, if scoring is on, within each window of a long text, and
+        are only reported for the first window they are found in.
+        No limit is applied when `limit` is missing.
+        """
+        offset = int(offset or 0)
+        stop = offset + int(limit) if limit else None
+        seen = set()
+        tags = chain.from_iterable(
+            self._iter_hits_tags(s.scan(), seen)
+            for s in self._scan_searches(text, min_score, constant_score)
+        )
+        yield from islice(tags, offset, stop)
+
+    async def iter_tags_async(
+        self, text, min_score=None, constant_score=True, offset=None, limit=None
+    ):
+        """Like `iter_tags()`, for an `AsyncElasticsearch` client."""
+        offset = int(offset or 0)
+        stop = offset + int(limit) if limit else None
+        seen = set()
+        count = 0
+        for s in self._scan_searches(text, min_score, constant_score):
+            async for hits in scan_async(self.client, s):
+                for tag, score in self._iter_hits_tags(hits, seen):
+                    count += 1
+                    if count <= offset:
+                        continue
+                    yield tag, score
+                    if stop is not None and count >= stop:
+                        return
+
+    def _page_search(
+        self, text, min_score=None, constant_score=True, limit=None, after=None, candidates=None
+    ):
+        """
+        Prepares the search for a page of tags, following the `after` sort values of the
+        previous page, if any. Hits are sorted by score (unless `constant_score` is on), then
+        by tag. The windows of a long text are percolated together, so each tag is found once.
+        """
+        windows = self.windows(text)
+        if len(windows) == 1:
+            s = self._search_query(text, constant_score, candidates)
+        else:
+            documents = [{self.field_name: text[start:end]} for start, end in windows]
+            s = self._percolate_query(constant_score, candidates, documents=documents)
+
+        if min_score is not None and not constant_score:
+            s = s.extra(min_score=min_score)
+
+        sort = [] if constant_score else [{'_score': 'desc'}]
+        sort.append({self.sort_field: {'order': 'asc', 'unmapped_type': 'keyword'}})
+        s = s.sort(*sort).extra(size=int(limit or self.max_results))
+        if after:
+            s = s.extra(search_after=after)
+        return s
+
+    def _page_from_response(self, response, limit=None):
+        """
+        Returns:
+            A `(tags, after)` tuple, `after` being the sort values of the last hit, or `None`
+            for the last page.
+        """
+        self._observe_took([response])
+        tags = {}
+        for hit in response:
+            tags[self._tag_from_hit(hit)] = hit.meta.score if hit.meta.score is not None else 1.0
+        after = None
+        if len(response.hits) >= int(limit or self.max_results):
+            after = list(response.hits[-1].meta.sort)
+        return self.format_tags(tags), after
+
+    @staticmethod
+    def is_valid_after(after, constant_score=True):
+        """
+        Returns whether `after` can be sort values returned by `get_tags_page()`, e.g. when
+        read from a client's cursor: the score unless `constant_score` is on, and the tag.
+        """
+        if not isinstance(after, list) or len(after) != (1 if constant_score else 2):
+            return False
+        *scores, tag = after
+        return isinstance(tag, str) and all(
+            isinstance(score, (int, float)) and not isinstance(score, bool) for score in scores
+        )
+
+    def get_tags_page(
+        self, text, min_score=None, constant_score=True, limit=None, after=None
+    ):
+        """
+        Percolates the provided text, returning the page of tags following the `after` sort
+        values. Unlike `offset`, deep pages cost the same as the first one, and are not bounded
+        by `max_results`.
+
+        Returns:
+            A `(tags, after)` tuple, with the `after` values of the next page, or `None`.
+        """
+        prefilter = self.get_prefilter()
+        candidates = self.candidates(prefilter, word_set(text)) if prefilter is not None else None
+        if candidates is not None and not candidates:
+            return self.format_tags({}), None
+        s = self._page_search(text, min_score, constant_score, limit, after, candidates)
+        with STAGE_LATENCY.time(stage='percolate'):
+            response = s.execute()
+        return self._page_from_response(response, limit)
+
+    def get_tag_windows(
+        self, text, min_score=None, constant_score=True, offset=None, limit=None
+    ):
+        """
+        Like `get_tags()`, also returning the windows (see `windows()`) each tag was found in.
+
+        Returns:
+            A `(tags, tag_windows)` tuple, with `tag_windows` mapping tags to lists of
+            `(start, end)` character offsets.
+        """
+        searches = self._prepare_searches(text, min_score, constant_score, offset, limit)
+        return self._tags_from_responses(
+            self._execute(searches), offset, limit, windows=self.windows(text)
+        )
+
+
+class MultiTagger:
+    """
+    Percolates texts against several domains at once, with a single `_msearch` request.
+    Taggers that are not `remote` are run in-process instead. Texts are prefiltered with the
+    first tokens of the queries of each domain, see `BaseTagger.get_prefilter()`: no search is
+    made for a text containing none of them.
+
+    Args:
+        taggers: A dict mapping domain names to `BaseTagger`-based instances sharing the same client.
+    """
+
+    def __init__(self, taggers):
+        self.taggers = taggers
+
+    @property
+    def client(self):
+        return next(iter(self.taggers.values())).client
+
+    def _remote_domains(self, domains):
+        return [d for d in dict.fromkeys(domains) if self.taggers[d].remote]
+
+    def get_prefilters(self, domains, generations=None):
+        """
+        Returns a dict mapping the remote `domains` to their prefilters, or `None`.
+
+        Args:
+            generations: A dict mapping domains to the generation to prefilter with, see
+                `BaseTagger.get_prefilter()`. The live generations by default.
+        """
+        generations = generations or {}
         return {
-            getattr(
-                getattr(hit.query, self.query_type), self.field_name
-            ): hit.meta.score
-            for hit in response
+            d: self.taggers[d].get_prefilter(generations.get(d))
+            for d in self._remote_domains(domains)
         }
 
+    async def get_prefilters_async(self, domains, generations=None):
+        """Like `get_prefilters()`, for taggers with an `AsyncElasticsearch` client."""
+        generations = generations or {}
+        return {
+            d: await self.taggers[d].get_prefilter_async(generations.get(d))
+            for d in self._remote_domains(domains)
+        }
+
+    def _candidates(self, prefilters, domain, text, words):
+        """
+        Returns the candidates of `BaseTagger.candidates()`, with `words` caching the set of
+        the tokens of each text, by identity.
+        """
+        prefilter = prefilters.get(domain)
+        if prefilter is None:
+            return None
+        text_words = words.get(id(text))
+        if text_words is None:
+            text_words = words[id(text)] = word_set(text)
+        return self.taggers[domain].candidates(prefilter, text_words)
+
+    def percolate(
+        self, jobs, min_score=None, constant_score=True, offset=None, limit=None, generations=None
+    ):
+        """
+        Percolates texts in domains, with score filtering and paging.
+        Paging and scoring apply to each job separately. Long texts are percolated in windows,
+        which ElasticSearch runs concurrently.
+
+        Args:
+            jobs: A list of `(domain, text)` tuples.
+            generations: The generations to prefilter with, see `get_prefilters()`.
+            For the other arguments see `BaseTagger._prepare_search()`
+
+        Returns:
+            A list of dicts of tags and their scores, one for each job.
+        """
+        prefilters = self.get_prefilters((domain for domain, _ in jobs), generations)
+        results, searches, remote_jobs = self._prepare(
+            jobs, min_score, constant_score, offset, limit, prefilters
+        )
+        if remote_jobs:
+            log.info(f'Fetching tags for {len(searches)} searches ...')
+            ms = MultiSearch(using=self.client)
+            for s in searches:
+                ms = ms.add(s)
+            domain = self._search_domain(jobs, (i for i, _ in remote_jobs))
+            with STAGE_LATENCY.time(stage='percolate', domain=domain):
+                responses = ms.execute()
+            self._collect(jobs, results, remote_jobs, responses, offset, limit)
+        return results
+
+    async def percolate_async(
+        self, jobs, min_score=None, constant_score=True, offset=None, limit=None, generations=None
+    ):
+        """Like `percolate()`, for taggers with an `AsyncElasticsearch` client."""
+        prefilters = await self.get_prefilters_async((domain for domain, _ in jobs), generations)
+        results, searches, remote_jobs = self._prepare(
+            jobs, min_score, constant_score, offset, limit, prefilters
+        )
+        if remote_jobs:
+            log.info(f'Fetching tags for {len(searches)} searches ...')
+            domain = self._search_domain(jobs, (i for i, _ in remote_jobs))
+            with STAGE_LATENCY.time(stage='percolate', domain=domain):
+                responses = await execute_async(self.client, searches)
+            self._collect(jobs, results, remote_jobs, responses, offset, limit)
+        return results
+
+    @staticmethod
+    def _search_domain(jobs, indexes):
+        """
+        Returns the domain of the jobs at `indexes` if they all have the same one, so that the
+        latency of their `_msearch` request can be labelled with it, or `''` if they have several,
+        in which case the time spent in each domain is only known from ElasticSearch `took`.
+        """
+        domains = {jobs[i][0] for i in indexes}
+        return domains.pop() if len(domains) == 1 else ''
+
+    def _prepare(self, jobs, min_score, constant_score, offset, limit, prefilters):
+        """
+        Runs the jobs of local taggers, and prepares the searches of the others, unless their
+        text has no candidates.
+
+        Returns:
+            A `(results, searches, remote_jobs)` tuple, with `remote_jobs` listing the index of
+            each remote job and the number of searches made for it.
+        """
+        results = [None] * len(jobs)
+        searches = []
+        remote_jobs = []
+        words = {}
+        for i, (domain, text) in enumerate(jobs):
+            tagger = self.taggers[domain]
+            if tagger.remote:
+                candidates = self._candidates(prefilters, domain, text, words)
+                if candidates is not None and not candidates:
+                    results[i] = tagger.format_tags({})
+                    continue
+                job_searches = tagger._prepare_searches(
+                    text, min_score, constant_score, offset, limit, candidates
+                )
+                searches.extend(job_searches)
+                remote_jobs.append((i, len(job_searches)))
+            else:
+                with STAGE_LATENCY.time(stage='local_tagging', domain=domain):
+                    results[i] = tagger.get_tags(text, min_score, constant_score, offset, limit)
+        return results, searches, remote_jobs
 
-class BaseTaxonIndexer:
+    def _collect(self, jobs, results, remote_jobs, responses, offset, limit):
+        """Fills in `results` with the tags of the remote jobs, from the search `responses`."""
+        responses = iter(responses)
+        for i, count in remote_jobs:
+            job_responses = [next(responses) for _ in range(count)]
+            results[i] = self.taggers[jobs[i][0]]._tags_from_responses(
+                job_responses, offset, limit
+            )
+
+    def percolate_pages(self, jobs, min_score=None, constant_score=True, limit=None):
+        """
+        Fetches pages of tags, see `BaseTagger.get_tags_page()`, with a single `_msearch`
+        request. Taggers that are not `remote` are run in-process.
+
+        Args:
+            jobs: A list of `(domain, text, after)` tuples.
+
+        Returns:
+            A list of `(tags, after)` tuples, one for each job.
+        """
+        prefilters = self.get_prefilters(domain for domain, _, _ in jobs)
+        results, searches = self._prepare_pages(jobs, min_score, constant_score, limit, prefilters)
+        if searches:
+            ms = MultiSearch(using=self.client)
+            for _, s in searches:
+                ms = ms.add(s)
+            domain = self._search_domain(jobs, (i for i, _ in searches))
+            with STAGE_LATENCY.time(stage='percolate', domain=domain):
+                responses = ms.execute()
+            self._collect_pages(jobs, results, searches, responses, limit)
+        return results
+
+    async def percolate_pages_async(self, jobs, min_score=None, constant_score=True, limit=None):
+        """Like `percolate_pages()`, for taggers with an `AsyncElasticsearch` client."""
+        prefilters = await self.get_prefilters_async(domain for domain, _, _ in jobs)
+        results, searches = self._prepare_pages(jobs, min_score, constant_score, limit, prefilters)
+        if searches:
+            domain = self._search_domain(jobs, (i for i, _ in searches))
+            with STAGE_LATENCY.time(stage='percolate', domain=domain):
+                responses = await execute_async(self.client, [s for _, s in searches])
+            self._collect_pages(jobs, results, searches, responses, limit)
+        return results
+
+    def _prepare_pages(self, jobs, min_score, constant_score, limit, prefilters):
+        results = [None] * len(jobs)
+        searches = []
+        words = {}
+        for i, (domain, text, after) in enumerate(jobs):
+            tagger = self.taggers[domain]
+            if tagger.remote:
+                candidates = self._candidates(prefilters, domain, text, words)
+                if candidates is not None and not candidates:
+                    results[i] = (tagger.format_tags({}), None)
+                    continue
+                s = tagger._page_search(text, min_score, constant_score, limit, after, candidates)
+                searches.append((i, s))
+            else:
+                with STAGE_LATENCY.time(stage='local_tagging', domain=domain):
+                    results[i] = tagger.get_tags_page(
+                        text, min_score, constant_score, limit, after
+                    )
+        return results, searches
+
+    def _collect_pages(self, jobs, results, searches, responses, limit):
+        for (i, _), response in zip(searches, responses):
+            results[i] = self.taggers[jobs[i][0]]._page_from_response(response, limit)
+
+    def get_tags_batch(
+        self, texts, min_score=None, constant_score=True, offset=None, limit=None
+    ):
+        """
+        Percolates the provided texts in all domains, see `percolate()`.
+
+        Returns:
+            A list of dicts mapping domain names to dicts of tags and their scores, one for each text.
+        """
+        jobs = [(domain, text) for text in texts for domain in self.taggers]
+        results = iter(self.percolate(jobs, min_score, constant_score, offset, limit))
+        return [{domain: next(results) for domain in self.taggers} for _ in texts]
+
+    def get_tags(
+        self, text, min_score=None, constant_score=True, offset=None, limit=None
+    ):
+        """
+        Percolates the provided text in all domains, see `percolate()`.
+
+        Returns:
+            A dict mapping domain names to dicts of tags and their scores.
+        """
+        return self.get_tags_batch([text], min_score, constant_score, offset, limit)[0]
+
+
+class BaseTaxonIndexer(BaseIndexer):
+    """
+    Indexes and searches taxa. When `taxa_path` is set, searches are made in an in-memory
+    `TaxonTable` loaded from that file instead, shared by all instances of the class.
+    """
 
     index = None
     doc_type = DocType
@@ -166,9 +1150,12 @@ class BaseTaxonIndexer:
     field_names = []
     normalize_field_names = []
     autophrase_field_names = []
+    tag_field_name = None  # The field matching the tags of the domain, for `get_taxa()`
+    taxa_path = None
+    snapshot_dir = None
 
-    def __init__(self, client):
-        self.client = client
+    _tables = {}
+    _tables_lock = threading.Lock()
 
     @staticmethod
     def _normalize(term):
@@ -189,6 +1176,8 @@ class BaseTaxonIndexer:
                 csv_file, fieldnames=self.field_names, delimiter=delimiter
             )
             for row in reader:
+                if list(row.values()) == list(self.field_names):  # Header row
+                    continue
                 taxon = {}
                 for field_name, value in row.items():
                     if field_name in self.autophrase_field_names:
@@ -199,27 +1188,60 @@ class BaseTaxonIndexer:
                 yield taxon
 
     def index_taxa(self, taxa_path):
-        """Bulk-indexes the taxa"""
-        index = Index(self.index)
-        index.doc_type(self.doc_type)
-
-        log.info('(Re)Creating index')
-        index.delete(ignore=404)
-        index.create()
+        """Bulk-indexes the taxa into a new index generation, and publishes it."""
+        name = self._create_generation(self.doc_type)
 
         actions = (
-            {'_index': self.index, '_type': self.doc_type._doc_type.name, '_source': t}
+            {'_index': name, '_type': self.doc_type._doc_type.name, '_source': t}
             for t in self._read_taxa(taxa_path)
         )
 
         log.info('Indexing taxa')
-        bulk(self.client, actions)
+        try:
+            indexed, _ = bulk(self.client, actions)
+        except Exception:
+            self._discard_generation(name)
+            raise
+
+        self._publish_generation(name, expected_count=indexed)
         log.info(f'Indexed {self.count()} taxa')
 
-    def count(self):
-        return Search(using=self.client, index=self.index).count()
+    @property
+    def table(self):
+        """The in-memory `TaxonTable`, loaded on first use, or `None` if `taxa_path` is not set."""
+        if not self.taxa_path:
+            return None
+        key = (type(self), self.taxa_path)
+        table = self._tables.get(key)
+        if table is None:
+            with self._tables_lock:
+                table = self._tables.get(key)
+                if table is None:
+                    table = self._tables[key] = self._load_table()
+        return table
 
-    def _search_query(self, **terms):
+    def _snapshot_path(self):
+        if not self.snapshot_dir:
+            return None
+        return os.path.join(self.snapshot_dir, f'{type(self).__name__}.pickle')
+
+    def _load_table(self):
+        """
+        Loads the taxa from the snapshot in `snapshot_dir`, if it's up to date. Otherwise
+        reads them from `taxa_path`, and writes a new snapshot.
+        """
+        started = time.monotonic()
+        signature = TaxonTable.source_signature(self.taxa_path)
+        snapshot_path = self._snapshot_path()
+        table = TaxonTable.load(snapshot_path, signature) if snapshot_path else None
+        if table is None:
+            table = TaxonTable.from_taxa(self.field_names, self._read_taxa(self.taxa_path))
+            if snapshot_path:
+                table.dump(snapshot_path, signature)
+        log.info(f'Loaded {len(table)} taxa in {time.monotonic() - started:.2f}s')
+        return table
+
+    def _search_terms(self, **terms):
         search_terms = {}
         for field_name, value in terms.items():
             if field_name in self.autophrase_field_names:
@@ -227,18 +1249,91 @@ class BaseTaxonIndexer:
             elif field_name in self.normalize_field_names:
                 value = self._normalize(value)
             search_terms[field_name] = value
-        return Search(using=self.client, index=self.index).query(
-            self.query_type, **search_terms
-        )
+        return search_terms
+
+    def _search_query(self, **terms):
+        return self.base_search.query(self.query_type, **self._search_terms(**terms))
 
     def search(self, **terms):
+        if self.table is not None:
+            return self.table.search(**self._search_terms(**terms))
+
         query = self._search_query(**terms)
         results = query.execute()
         return [hit.to_dict() for hit in results]
 
     def first(self, **terms):
+        if self.table is not None:
+            return self.table.first(**self._search_terms(**terms))
+
         matches = self.search(**terms)
         if not matches:
             return None
 
         return matches[0]
+
+    async def search_async(self, **terms):
+        """Like `search()`, for an `AsyncElasticsearch` client."""
+        if self.table is not None:
+            return self.search(**terms)
+
+        query = self._search_query(**terms)
+        raw = await self.client.search(index=self.index, body=query.to_dict())
+        return [hit.to_dict() for hit in Response(query, raw)]
+
+    async def first_async(self, **terms):
+        """Like `first()`, for an `AsyncElasticsearch` client."""
+        if self.table is not None:
+            return self.first(**terms)
+
+        matches = await self.search_async(**terms)
+        return matches[0] if matches else None
+
+    def _first_searches(self, queries):
+        return [self._search_query(**terms)[:1] for terms in queries]
+
+    @staticmethod
+    def _first_from_responses(responses):
+        return [response.hits[0].to_dict() if response.hits else None for response in responses]
+
+    def first_many(self, queries):
+        """
+        Looks up the first taxon matching each of several term dicts, in memory or with
+        a single `_msearch` request.
+
+        Returns:
+            A list of taxa, or `None` for queries matching nothing, in order.
+        """
+        queries = list(queries)
+        if self.table is not None or not queries:
+            return [self.first(**terms) for terms in queries]
+
+        ms = MultiSearch(using=self.client)
+        for s in self._first_searches(queries):
+            ms = ms.add(s)
+        return self._first_from_responses(ms.execute())
+
+    async def first_many_async(self, queries):
+        """Like `first_many()`, for an `AsyncElasticsearch` client."""
+        queries = list(queries)
+        if self.table is not None or not queries:
+            return self.first_many(queries)
+
+        responses = await execute_async(self.client, self._first_searches(queries))
+        return self._first_from_responses(responses)
+
+    def get_taxa(self, tags):
+        """
+        Looks up the taxa of several tags, see `first_many()`.
+
+        Returns:
+            A dict mapping the tags to their taxon, or `None`.
+        """
+        tags = list(tags)
+        return dict(zip(tags, self.first_many({self.tag_field_name: tag} for tag in tags)))
+
+    async def get_taxa_async(self, tags):
+        """Like `get_taxa()`, for an `AsyncElasticsearch` client."""
+        tags = list(tags)
+        taxa = await self.first_many_async({self.tag_field_name: tag} for tag in tags)
+        return dict(zip(tags, taxa))
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from ..core.cache import MemoryCache, DiskCache, TieredCache
+
+log = logging.getLogger('percolator_search')
+
+
+class TagCache:
+    """
+    Cache of per-domain tagging results.
+
+    Entries are keyed on the text's digest, the domain, the scoring and paging parameters, and
+    the domain's index generation, so an index rebuild invalidates them. Generations are
+    looked up at most once every `generation_ttl` seconds per domain.
+
+    Args:
+        max_entries (int): The size of the in-memory LRU tier.
+        path: The directory of the on-disk tier; no disk tier is used if missing.
+        max_bytes (int): The maximum size of the on-disk tier.
+        generation_ttl (float): How long index generations are cached for, in seconds.
+    """
+
+    def __init__(self, max_entries, path=None, max_bytes=None, generation_ttl=10):
+        disk = DiskCache(path, max_bytes) if path else None
+        self.cache = TieredCache(
+            MemoryCache(max_entries),
+            disk,
+            dumps=lambda tags: json.dumps(tags).encode('utf-8'),
+            loads=lambda data: json.loads(data.decode('utf-8')),
+        )
+        self.generation_ttl = generation_ttl
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def generation(self, domain, tagger):
+        now = time.monotonic()
+        cached = self._generations.get(domain)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+        generation = tagger.generation()
+        with self._lock:
+            self._generations[domain] = (generation, now + self.generation_ttl)
+        return generation
+
+    async def generation_async(self, domain, tagger):
+        """Like `generation()`, for taggers with an `AsyncElasticsearch` client."""
+        now = time.monotonic()
+        cached = self._generations.get(domain)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+        generation = await tagger.generation_async()
+        with self._lock:
+            self._generations[domain] = (generation, now + self.generation_ttl)
+        return generation
+
+    def invalidate_generations(self):
+        """Forces the index generations to be looked up again."""
+        with self._lock:
+            self._generations.clear()
+
+    @staticmethod
+    def key(domain, generation, digest, **params):
+        """
+        Returns the key of the tags of a text, found in the `generation` of a domain, see
+        `generation()`. The tags must then be searched for in that same generation.
+        """
+        parts = [domain, str(generation), digest]
+        parts += [f'{k}={params[k]}' for k in sorted(params)]
+        return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, tags):
+        self.cache.set(key, tags)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class IndexStatsCache:
+    """
+    In-process cache of the statistics of several indices (see `BaseIndexer.stats_from_indices()`),
+    fetched with a single `_stats` request.
+
+    Reads never wait for ElasticSearch: once the statistics are older than `ttl` seconds, a
+    refresh is started in the background and the current ones are returned meanwhile, flagged
+    as `stale`. At most one refresh runs at a time, and failed ones are retried after `ttl`.
+    An index rebuild shows up at the next refresh, with its new generation.
+
+    Args:
+        client: An ElasticSearch client, synchronous or asynchronous.
+        indexers: A dict mapping names to `BaseIndexer`-based instances.
+        ttl (float): How long statistics are fresh for, in seconds.
+    """
+
+    def __init__(self, client, indexers, ttl=60):
+        self.client = client
+        self.indexers = indexers
+        self.ttl = ttl
+        self._stats = {}
+        self._updated = None  # Monotonic time of the last successful refresh
+        self._updated_at = None
+        self._attempted = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _claim_refresh(self, force=False):
+        """
+        Returns whether a refresh is due, or `force`d, marking it as started if so. Refreshes
+        are never started while another one is running.
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = force or self._attempted is None or now - self._attempted >= self.ttl
+            if self._refreshing or not due:
+                return False
+            self._refreshing = True
+            self._attempted = now
+            return True
+
+    def _stats_params(self):
+        indices = ','.join(indexer.index for indexer in self.indexers.values())
+        return dict(index=indices, metric='docs,store', ignore=404)
+
+    def _update(self, response):
+        indices = response.get('indices', {})
+        stats = {
+            name: indexer.stats_from_indices(indices) for name, indexer in self.indexers.items()
+        }
+        with self._lock:
+            self._stats = stats
+            self._updated = time.monotonic()
+            self._updated_at = datetime.utcnow()
+
+    def refresh(self):
+        """
+        Fetches the statistics right away, keeping the current ones on failure, unless a
+        refresh is already running.
+
+        Returns:
+            Whether the statistics were refreshed, or at least attempted to.
+        """
+        if not self._claim_refresh(force=True):
+            return False
+        self._refresh()
+        return True
+
+    async def refresh_async(self):
+        """Like `refresh()`, for an `AsyncElasticsearch` client."""
+        if not self._claim_refresh(force=True):
+            return False
+        await self._refresh_async()
+        return True
+
+    def _refresh(self):
+        """Fetches the statistics, once the refresh is claimed, see `_claim_refresh()`."""
+        try:
+            self._update(self.client.indices.stats(**self._stats_params()))
+        except Exception:
+            log.warning('Could not refresh the index statistics', exc_info=True)
+        finally:
+            self._refreshing = False
+
+    async def _refresh_async(self):
+        """Like `_refresh()`, for an `AsyncElasticsearch` client."""
+        try:
+            self._update(await self.client.indices.stats(**self._stats_params()))
+        except Exception:
+            log.warning('Could not refresh the index statistics', exc_info=True)
+        finally:
+            self._refreshing = False
+
+    def invalidate(self):
+        """Makes the next read start a refresh."""
+        with self._lock:
+            self._attempted = None
+
+    def _snapshot(self):
+        with self._lock:
+            stale = self._updated is None or time.monotonic() - self._updated >= self.ttl
+            return {
+                name: {
+                    **(self._stats.get(name) or {}),
+                    'updated_at': self._updated_at,
+                    'stale': stale,
+                }
+                for name in self.indexers
+            }
+
+    def get(self):
+        """
+        Returns:
+            A dict mapping names to the statistics of their index, with the time they were
+            fetched (`updated_at`, `None` before the first refresh) and whether they are `stale`.
+        """
+        if self._claim_refresh():
+            threading.Thread(target=self._refresh, name='index-stats-refresh', daemon=True).start()
+        return self._snapshot()
+
+    def get_async(self):
+        """Like `get()`, refreshing with a task of the running event loop."""
+        if self._claim_refresh():
+            asyncio.ensure_future(self._refresh_async())
+        return self._snapshot()
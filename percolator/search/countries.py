@@ -1,7 +1,10 @@
 import logging
-from elasticsearch_dsl import (Index, DocType, Text, Percolator, token_filter, analyzer)
+from elasticsearch_dsl import (DocType, Text, Keyword, Percolator, token_filter, analyzer)
 
+from percolator.conf import settings
 from .base import BaseQueryIndexer, BaseTagger
+from .local import BaseLocalTagger, PhraseMatcher
+from .tokens import tokenize, tokenize_words
 
 log = logging.getLogger('percolator_search')
 
@@ -9,12 +12,56 @@ log = logging.getLogger('percolator_search')
 class CountryQueryDoc(DocType):
     """Document type for percolating queries storage"""
     query = Percolator()
+    tag = Keyword()
+    first_tokens = Keyword()
     content = Text(analyzer='country_analyzer')
 
     class Meta:
         doc_type = '_doc'
 
 
+def parse_synonyms(lines):
+    """
+    Parses `a, b, c => x` synonym rules.
+
+    Returns:
+        A dict mapping first tokens to `(tokens, replacement tokens)` rules, longest first.
+    """
+    rules = {}
+    for line in lines:
+        sources, _, target = line.partition('=>')
+        target = tokenize_words(target)
+        for source in sources.split(','):
+            source = tokenize_words(source)
+            if source:
+                rules.setdefault(source[0], []).append((source, target))
+
+    for first_token_rules in rules.values():
+        first_token_rules.sort(key=lambda rule: len(rule[0]), reverse=True)
+    return rules
+
+
+def apply_synonyms(spans, rules):
+    """
+    Applies synonym rules (see `parse_synonyms()`) to `(token, start, end)` spans, longest match
+    first, like ElasticSearch's synonym filter. Replacement tokens span the whole replaced phrase.
+    """
+    tokens = tuple(t for t, _, _ in spans)
+    analyzed = []
+    i = 0
+    while i < len(tokens):
+        for source, target in rules.get(tokens[i], ()):
+            if tokens[i:i + len(source)] == source:
+                start, end = spans[i][1], spans[i + len(source) - 1][2]
+                analyzed.extend((t, start, end) for t in target)
+                i += len(source)
+                break
+        else:
+            analyzed.append(spans[i])
+            i += 1
+    return analyzed
+
+
 class CountryQueryIndexer(BaseQueryIndexer):
 
     index = 'country_percolator'
@@ -37,31 +84,75 @@ class CountryQueryIndexer(BaseQueryIndexer):
             ],
         )
 
+    @staticmethod
+    def _first_tokens(countries, synonyms):
+        """
+        Returns:
+            A dict mapping countries to the first tokens of the texts matching them: the first
+            token of their analyzed name, and those of the synonyms replaced with that token.
+        """
+        rules = parse_synonyms(synonyms)
+        sources = {}
+        for first, first_token_rules in rules.items():
+            for _, target in first_token_rules:
+                for token in target:
+                    sources.setdefault(token, set()).add(first)
+
+        first_tokens = {}
+        for c in countries:
+            analyzed = apply_synonyms(tokenize(c), rules)
+            if analyzed:
+                first = analyzed[0][0]
+                first_tokens[c] = {first} | sources.get(first, set())
+            else:
+                first_tokens[c] = set()
+        return first_tokens
+
     def index_queries(self, countries_path, synonyms_path):
         """
-        (Re)Creates the index with synonyms, and saves the country query documents.
+        Builds a new index generation with synonyms, and saves the country query documents.
         """
         countries = self._read_tags(countries_path)
         synonyms = self._read_tags(synonyms_path)
 
-        index = Index(self.index)
-        index.doc_type(self.query_doc_type)
-
         log.info('Building analyzer')
-        index.analyzer(self._analyzer(synonyms))
+        index_analyzer = self._analyzer(synonyms)
 
-        log.info('(Re)Creating index')
-        index.delete(ignore=404)
-        index.create()
-
-        log.info('Registering queries')
-        for c in countries:
-            query_doc = self.query_doc_type(query=self._mk_query_body(c))
-            query_doc.save()
+        return self._build_generation(
+            countries, index_analyzer, self._first_tokens(countries, synonyms)
+        )
 
 
 class CountryTagger(BaseTagger):
-    def get_tags(self, *args, **kwargs):
-        tags = super().get_tags(*args, **kwargs)
-        tags = {' '.join(w.capitalize() or ' ' for w in k.split()): v for k, v in tags.items()}
-        return tags
+    def format_tags(self, tags):
+        return {' '.join(w.capitalize() or ' ' for w in k.split()): v for k, v in tags.items()}
+
+
+class CountryLocalTagger(BaseLocalTagger):
+    """
+    In-process country tagger, mirroring the `country_analyzer`: synonyms are replaced with the
+    country name before matching phrases of lowercase tokens.
+    """
+
+    format_tags = CountryTagger.format_tags
+
+    @property
+    def synonyms(self):
+        return self._get_shared('synonyms', self._build_synonyms)
+
+    def _build_synonyms(self):
+        return parse_synonyms(self.indexer._read_tags(settings.COUNTRIES_SYNONYMS_PATH))
+
+    def _analyze_spans(self, text):
+        """Applies the synonym rules to the tokens of `text`, see `apply_synonyms()`."""
+        return apply_synonyms(tokenize(text), self.synonyms)
+
+    def tag_paths(self):
+        return [settings.COUNTRIES_TAGS_PATH, settings.COUNTRIES_SYNONYMS_PATH]
+
+    def _build_matcher(self):
+        matcher = PhraseMatcher()
+        for c in self.indexer._read_tags(settings.COUNTRIES_TAGS_PATH):
+            matcher.add(self._analyze(c), (c,))
+        matcher.build()
+        return matcher
@@ -0,0 +1,288 @@
+import hashlib
+import logging
+import threading
+from collections import deque
+
+from .base import BaseTagger
+from .tokens import tokenize
+
+log = logging.getLogger('percolator_search')
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over token sequences.
+    Finds all occurrences of the added phrases in a token list in a single pass, or only the
+    longest ones, see `find_longest()`.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._built = False
+
+    def __len__(self):
+        return len(self._goto)
+
+    def add(self, tokens, value):
+        """Adds the phrase made of `tokens`, reported with `value` when found."""
+        if not tokens:
+            return
+        node = 0
+        for t in tokens:
+            nxt = self._goto[node].get(t)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][t] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(tokens), value))
+        self._built = False
+
+    def build(self):
+        """Computes the failure links. Must be called after the last `add()`."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for t, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and t not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(t, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        self._built = True
+
+    def find(self, tokens):
+        """
+        Generator of `(start, end, value)` for every phrase occurring in `tokens`, where
+        `start` and `end` are token indices (`end` is exclusive).
+        """
+        assert self._built, 'build() must be called before find()'
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, t in enumerate(tokens):
+            while node and t not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(t, 0)
+            for length, value in out[node]:
+                yield i + 1 - length, i + 1, value
+
+    def find_longest(self, tokens):
+        """
+        Like `find()`, matching phrases left to right, longest first, each consuming its tokens
+        like ElasticSearch's synonym filter does: phrases nested in, or overlapping, a phrase
+        matched earlier aren't reported. All the values of a matched phrase are.
+        """
+        goto, out = self._goto, self._out
+        i = 0
+        while i < len(tokens):
+            node, longest = 0, None
+            for j in range(i, len(tokens)):
+                node = goto[node].get(tokens[j])
+                if node is None:
+                    break
+                if any(length == j + 1 - i for length, _ in out[node]):
+                    longest = j + 1, node
+            if longest is None:
+                i += 1
+                continue
+
+            end, node = longest
+            for length, value in out[node]:
+                if length == end - i:
+                    yield i, end, value
+            i = end
+
+
+class BaseLocalTagger(BaseTagger):
+    """
+    In-process alternative to percolation, for domains whose queries are `match_phrase`
+    queries over a fixed list of tags.
+
+    The matching automaton is built once per process, from the same tag files used for
+    indexing, and shared by all instances. Its generation is a digest of these files, so that
+    the tags cached for a domain change with them. Scores are always `1`, and results are
+    ordered by their occurrence in the text.
+
+    Args:
+        indexer: A `BaseQueryIndexer`-based instance, providing the tag analysis rules.
+    """
+
+    remote = False
+
+    # Whether phrases are matched like autophrasing synonyms, longest first and consuming their
+    # tokens (see `PhraseMatcher.find_longest()`), rather than wherever they occur
+    autophrase = False
+
+    _shared = {}
+    _shared_lock = threading.RLock()
+
+    def _get_shared(self, name, build):
+        """Returns the `name` structure shared by all instances of the class, built on first use."""
+        key = (type(self), name)
+        value = self._shared.get(key)
+        if value is None:
+            with self._shared_lock:
+                value = self._shared.get(key)
+                if value is None:
+                    log.info(f'Building {type(self).__name__} {name}')
+                    value = build()
+                    self._shared[key] = value
+        return value
+
+    def generation(self):
+        """Returns the generation of the tag files the matcher was built from."""
+        return self._get_shared('matcher', self._build_generation_matcher)[0]
+
+    async def generation_async(self):
+        return self.generation()
+
+    @property
+    def matcher(self):
+        return self._get_shared('matcher', self._build_generation_matcher)[1]
+
+    def _build_generation_matcher(self):
+        """Returns the generation of the tag files, digested first, and the matcher."""
+        digest = hashlib.sha256()
+        for path in self.tag_paths():
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        return f'local-{digest.hexdigest()[:16]}', self._build_matcher()
+
+    def tag_paths(self):
+        """Returns the paths of the files the matcher is built from."""
+        raise NotImplementedError
+
+    def _build_matcher(self):
+        """
+        Returns:
+            A built `PhraseMatcher`, reporting tuples of tags (as stored in the query documents).
+        """
+        raise NotImplementedError
+
+    def _find(self, tokens):
+        """Generator of the `(start, end, tags)` matches in `tokens`, see `autophrase`."""
+        if self.autophrase:
+            return self.matcher.find_longest(tokens)
+        return self.matcher.find(tokens)
+
+    def _analyze_spans(self, text):
+        """
+        Returns the tokens of `text`, as the domain's ElasticSearch analyzer would, as
+        `(token, start, end)` tuples with character offsets into `text`.
+        """
+        return tokenize(text)
+
+    def _analyze(self, text):
+        """Returns only the tokens of `text`, see `_analyze_spans()`."""
+        return tuple(t for t, _, _ in self._analyze_spans(text))
+
+    def _match(self, text):
+        """
+        Returns:
+            The matching tags, in order of occurrence.
+        """
+        matches = {}
+        for _, _, tags in self._find(self._analyze(text)):
+            for tag in tags:
+                matches.setdefault(tag, None)
+        return list(matches)
+
+    def get_tags(
+        self, text, min_score=None, constant_score=True, offset=None, limit=None
+    ):
+        """
+        Matches the provided text, with paging. Takes the same arguments as `BaseTagger.get_tags()`;
+        `min_score` and `constant_score` have no effect, as all scores are `1`.
+
+        Returns:
+            A dict of tags and their scores.
+        """
+        limit = int(limit or self.max_results)
+        offset = int(offset or 0)
+        matches = self._match(text)[offset:offset + limit]
+        return self.format_tags({tag: 1.0 for tag in matches})
+
+    @staticmethod
+    def is_valid_after(after, constant_score=True):
+        """Like `BaseTagger.is_valid_after()`, for `after` holding the number of preceding tags."""
+        return (
+            isinstance(after, list)
+            and len(after) == 1
+            and isinstance(after[0], int)
+            and not isinstance(after[0], bool)
+            and after[0] >= 0
+        )
+
+    def get_tags_page(
+        self, text, min_score=None, constant_score=True, limit=None, after=None
+    ):
+        """Like `BaseTagger.get_tags_page()`, `after` holding the number of preceding tags."""
+        start = after[0] if after else 0
+        limit = int(limit or self.max_results)
+        matches = self._match(text)
+        tags = self.format_tags({tag: 1.0 for tag in matches[start:start + limit]})
+        return tags, [start + limit] if start + limit < len(matches) else None
+
+    def iter_tags(self, text, min_score=None, constant_score=True, offset=None, limit=None):
+        """Like `get_tags()`, generating `(tag, score)` tuples. No limit applies if `limit` is missing."""
+        offset = int(offset or 0)
+        stop = offset + int(limit) if limit else None
+        for tag in self._match(text)[offset:stop]:
+            yield from self.format_tags({tag: 1.0}).items()
+
+    async def iter_tags_async(
+        self, text, min_score=None, constant_score=True, offset=None, limit=None
+    ):
+        for item in self.iter_tags(text, min_score, constant_score, offset, limit):
+            yield item
+
+    def get_mentions(self, text, tags=None):
+        """
+        Finds where tags occur in `text`, in a single pass. Like tags, mentions of a name nested
+        in a longer one aren't reported when the domain is `autophrase`d: each mention is the
+        span ElasticSearch matched.
+
+        Args:
+            tags: Only report these tags (as returned by `get_tags()`). All the tags found
+                are reported when missing.
+
+        Returns:
+            A dict mapping tags to ordered lists of `(start, end)` character offsets, or to
+            `None` for the requested `tags` that aren't found in `text` (e.g. tags of an index
+            built from other tag files).
+        """
+        spans = self._analyze_spans(text)
+        mentions = {}
+        for start, end, found in self._find([t for t, _, _ in spans]):
+            offsets = (spans[start][1], spans[end - 1][2])
+            for tag in found:
+                mentions.setdefault(tag, []).append(offsets)
+
+        mentions = {tag: sorted(offsets) for tag, offsets in self.format_tags(mentions).items()}
+        if tags is not None:
+            mentions = {tag: mentions.get(tag) for tag in tags}
+        return mentions
+
+
+def tags_with_mentions(tags, mentions):
+    """
+    Combines tags and their scores with their mentions, see `BaseLocalTagger.get_mentions()`.
+
+    Returns:
+        A dict mapping tags to dicts with their `score`, mentions `count` and `offsets`, both
+        `None` for tags whose mentions aren't found.
+    """
+    return {
+        tag: {
+            'score': score,
+            'count': len(mentions[tag]) if mentions[tag] is not None else None,
+            'offsets': mentions[tag],
+        }
+        for tag, score in tags.items()
+    }
@@ -0,0 +1,42 @@
+from .cache import IndexStatsCache
+from .warmup import Warmup
+
+
+class DomainRegistry:
+    """
+    Long-lived indexer and tagger instances of the tag domains, sharing a client.
+    They hold no per-request state, so a single registry serves all the requests of a process.
+
+    Args:
+        domains: A dict mapping domain names to `Domain` instances.
+        client: An ElasticSearch client, synchronous or asynchronous.
+        stats_ttl (float): How long the statistics of the query indices are cached for, in
+            seconds, see `IndexStatsCache`.
+        warmup_text_path: The file of the text the registry is warmed up with, see `Warmup`.
+            Warmup is disabled if missing.
+    """
+
+    def __init__(self, domains, client, stats_ttl=60, warmup_text_path=None):
+        self.domains = domains
+        self.client = client
+        self.query_indexers = {}
+        self.taggers = {}
+        self.mention_taggers = {}
+        self.taxon_indexers = {}
+        for name, domain in domains.items():
+            indexer = domain.query_indexer(client=client)
+            self.query_indexers[name] = indexer
+            self.taggers[name] = domain.get_tagger(indexer=indexer)
+            self.mention_taggers[name] = domain.get_mention_tagger(indexer)
+            if domain.taxon_indexer is not None:
+                self.taxon_indexers[name] = domain.taxon_indexer(client=client)
+        self.stats = IndexStatsCache(client, self.query_indexers, ttl=stats_ttl)
+        self.warmup = Warmup(self, warmup_text_path)
+
+    def get_taggers(self, domains):
+        """Returns a dict of the taggers of the `domains`, by name."""
+        return {domain: self.taggers[domain] for domain in domains}
+
+    def get_taxon_indexer(self, domain):
+        """Returns the taxon indexer of a domain, or `None` if it has none."""
+        return self.taxon_indexers.get(domain)
@@ -1,11 +1,14 @@
 import logging
-from elasticsearch_dsl import (Index, DocType, Text, Percolator, token_filter, analyzer)
+from elasticsearch_dsl import (DocType, Text, Keyword, Percolator, token_filter, analyzer)
 
+from percolator.conf import settings
 from .base import (
     BaseQueryIndexer,
     BaseTagger,
     BaseTaxonIndexer,
 )
+from .local import BaseLocalTagger, PhraseMatcher
+from .tokens import tokenize_words
 
 log = logging.getLogger('percolator_search')
 
@@ -13,6 +16,8 @@ log = logging.getLogger('percolator_search')
 class SpeciesQueryDoc(DocType):
     """Document type for percolating queries storage"""
     query = Percolator()
+    tag = Keyword()
+    first_tokens = Keyword()
     content = Text(analyzer='species_analyzer')
 
     class Meta:
@@ -97,33 +102,74 @@ class SpeciesQueryIndexer(BaseQueryIndexer):
             ],
         )
 
+    def _first_tokens(self, species):
+        """
+        Returns:
+            A dict mapping species to the first tokens of the names matching them: their own,
+            their abbreviation's, and those of the species sharing their abbreviation.
+        """
+        abbreviations = {}
+        for s in species:
+            abbr = self.abbr_species(s)
+            if abbr is not None:
+                abbreviations.setdefault(abbr, []).append(s)
+
+        first_tokens = {}
+        for s in species:
+            abbr = self.abbr_species(s)
+            names = [s, abbr] + abbreviations[abbr] if abbr is not None else [s]
+            first_tokens[s] = {tokens[0] for tokens in map(tokenize_words, names) if tokens}
+        return first_tokens
+
     def index_queries(self, tags_path):
         """
-        (Re)Creates the index with synonyms, and saves the species names as query documents.
+        Builds a new index generation with synonyms, and saves the species names as query documents.
         """
         species = self._read_tags(tags_path)
 
-        index = Index(self.index)
-        index.doc_type(self.query_doc_type)
-
         log.info('Building analyzer')
-        index.analyzer(self._analyzer(species))
-
-        log.info('(Re)Creating index')
-        index.delete(ignore=404)
-        index.create()
+        index_analyzer = self._analyzer(species)
 
-        log.info('Registering queries')
-        for s in species:
-            query_doc = self.query_doc_type(query=self._mk_query_body(s))
-            query_doc.save()
+        return self._build_generation(species, index_analyzer, self._first_tokens(species))
 
 
 class SpeciesTagger(BaseTagger):
-    def get_tags(self, *args, **kwargs):
-        tags = super().get_tags(*args, **kwargs)
-        tags = {k.capitalize(): v for k, v in tags.items()}
-        return tags
+    def format_tags(self, tags):
+        return {k.capitalize(): v for k, v in tags.items()}
+
+
+class SpeciesLocalTagger(BaseLocalTagger):
+    """
+    In-process species tagger, mirroring the `species_analyzer`: species names and their
+    abbreviations are autophrased, the longest first, then the phrases are synonymous with
+    their abbreviations. Like in ElasticSearch, species sharing an abbreviation match each other,
+    and names nested in a longer one (e.g. `Panthera leo` in `Panthera leo persica`) don't.
+    """
+
+    format_tags = SpeciesTagger.format_tags
+    autophrase = True
+
+    def tag_paths(self):
+        return [settings.SPECIES_TAGS_PATH]
+
+    def _build_matcher(self):
+        species = self.indexer._read_tags(settings.SPECIES_TAGS_PATH)
+
+        abbreviations = {}
+        for s in species:
+            abbr = self.indexer.abbr_species(s)
+            if abbr is not None:
+                abbreviations.setdefault(tokenize_words(abbr), []).append(s)
+
+        matcher = PhraseMatcher()
+        for s in species:
+            abbr = self.indexer.abbr_species(s)
+            synonymous = abbreviations[tokenize_words(abbr)] if abbr is not None else []
+            matcher.add(tokenize_words(s), tuple({s: None, **dict.fromkeys(synonymous)}))
+        for abbr, names in abbreviations.items():
+            matcher.add(abbr, tuple(names))
+        matcher.build()
+        return matcher
 
 
 class SpeciesTaxonDoc(DocType):
@@ -171,3 +217,12 @@ class SpeciesTaxonIndexer(BaseTaxonIndexer):
         'subspecies',
     )
     autophrase_field_names = ('scientific_name',)
+    tag_field_name = 'scientific_name'
+
+    @property
+    def taxa_path(self):
+        return settings.SPECIES_TAXA_PATH if settings.TAXA_IN_MEMORY else None
+
+    @property
+    def snapshot_dir(self):
+        return settings.TAXA_SNAPSHOT_DIR
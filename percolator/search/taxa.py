@@ -0,0 +1,134 @@
+import logging
+import os
+import pickle
+import re
+import sys
+import tempfile
+
+log = logging.getLogger('percolator_search')
+
+SNAPSHOT_VERSION = 2
+
+# Words, kept whole across inner apostrophes and periods, roughly like ElasticSearch's
+# standard tokenizer
+_TOKEN_RE = re.compile(r"\w+(?:['\u2019.]\w+)*")
+
+
+def analyze(value):
+    """Returns the lowercased tokens of a value, as the `standard` analyzer of `Text` fields."""
+    return _TOKEN_RE.findall(value.lower())
+
+
+class TaxonTable:
+    """
+    Compact, read-only in-memory table of taxa, indexed on every column.
+
+    Rows are tuples of interned strings, in `field_names` order, so repeated values (kingdoms,
+    families, authors...) are stored once. Each index maps the tokens of the values (see
+    `analyze()`) to the numbers of the rows holding them, so terms match like ElasticSearch's
+    `term` queries on `Text` fields: a term matches a value having it as a token, e.g.
+    `linnaeus` matches the `Linnaeus, 1758` author, but neither `Linnaeus` nor the whole value.
+
+    Args:
+        field_names: The column names.
+        rows: A list of tuples, in `field_names` order.
+        indexes: The prebuilt indexes, e.g. from a snapshot. Built from the rows if missing.
+    """
+
+    def __init__(self, field_names, rows, indexes=None):
+        self.field_names = tuple(field_names)
+        self.rows = rows
+        self.indexes = indexes if indexes is not None else self._build_indexes()
+
+    def _build_indexes(self):
+        indexes = {f: {} for f in self.field_names}
+        for i, row in enumerate(self.rows):
+            for field_name, value in zip(self.field_names, row):
+                index = indexes[field_name]
+                for token in analyze(value):
+                    row_numbers = index.setdefault(sys.intern(token), [])
+                    if not row_numbers or row_numbers[-1] != i:
+                        row_numbers.append(i)
+        for index in indexes.values():
+            for token, row_numbers in index.items():
+                index[token] = tuple(row_numbers)
+        return indexes
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def from_taxa(cls, field_names, taxa):
+        """Builds a table from an iterable of taxon dicts."""
+        rows = [tuple(sys.intern(t.get(f) or '') for f in field_names) for t in taxa]
+        return cls(field_names, rows)
+
+    def _to_dict(self, row):
+        return dict(zip(self.field_names, row))
+
+    def _row_numbers(self, field_name, value):
+        """Returns the numbers of the rows matching a term, none for unknown fields."""
+        index = self.indexes.get(field_name)
+        return index.get(value, ()) if index is not None else ()
+
+    def search(self, **terms):
+        """
+        Returns:
+            The taxa (as dicts) matching all the terms, in the order they were loaded.
+        """
+        matches = None
+        for field_name, value in terms.items():
+            row_numbers = self._row_numbers(field_name, value)
+            matches = set(row_numbers) if matches is None else matches & set(row_numbers)
+            if not matches:
+                return []
+        if matches is None:
+            return []
+        return [self._to_dict(self.rows[i]) for i in sorted(matches)]
+
+    def first(self, **terms):
+        if len(terms) == 1:
+            (field_name, value), = terms.items()
+            row_numbers = self._row_numbers(field_name, value)
+            return self._to_dict(self.rows[row_numbers[0]]) if row_numbers else None
+
+        matches = self.search(**terms)
+        return matches[0] if matches else None
+
+    @staticmethod
+    def source_signature(path):
+        """Identifies a version of the source file, to detect stale snapshots."""
+        st = os.stat(path)
+        return (SNAPSHOT_VERSION, os.path.realpath(path), st.st_size, st.st_mtime_ns)
+
+    def dump(self, path, signature):
+        """Writes a snapshot of the table, atomically."""
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                snapshot = (signature, self.field_names, self.rows, self.indexes)
+                pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            log.exception(f'Could not write taxa snapshot {path}')
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    @classmethod
+    def load(cls, path, signature):
+        """
+        Returns:
+            The table from the snapshot at `path`, or `None` if it's missing or stale.
+        """
+        try:
+            with open(path, 'rb') as f:
+                snapshot_signature, field_names, rows, indexes = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        if snapshot_signature != signature:
+            return None
+        return cls(field_names, rows, indexes)
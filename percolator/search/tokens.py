@@ -0,0 +1,74 @@
+import re
+import sys
+
+_WORD_RE = re.compile(r'[^\W\d_]+')
+
+
+def tokenize(text):
+    """
+    Splits `text` the way ElasticSearch's `lowercase` tokenizer does: tokens are runs of
+    letters, lowercased.
+
+    Returns:
+        A list of `(token, start, end)` tuples, with character offsets into `text`.
+    """
+    tokens = []
+    start = None
+    for i, c in enumerate(text):
+        if c.isalpha():
+            if start is None:
+                start = i
+        elif start is not None:
+            tokens.append((sys.intern(text[start:i].lower()), start, i))
+            start = None
+    if start is not None:
+        tokens.append((sys.intern(text[start:].lower()), start, len(text)))
+    return tokens
+
+
+def tokenize_words(text):
+    """Returns only the tokens of `text`, see `tokenize()`."""
+    return tuple(t for t, _, _ in tokenize(text))
+
+
+def word_set(text):
+    """
+    Returns the set of the tokens of `text`, see `tokenize()`. Faster than `tokenize()` on
+    long texts, as the text is scanned with a regular expression.
+    """
+    words = set(_WORD_RE.findall(text.lower()))
+    # Word characters also include combining marks, which aren't letters
+    for word in [w for w in words if not w.isalpha()]:
+        words.discard(word)
+        words.update(tokenize_words(word))
+    return words
+
+
+class Candidates(frozenset):
+    """First tokens of the queries that may match a text, from the `generation` of a prefilter."""
+
+    generation = None
+
+
+class TokenPrefilter:
+    """
+    The first tokens of the queries of an index generation. A query can only match a text
+    containing one of its first tokens, see `BaseQueryIndexer._query_actions()`.
+
+    Args:
+        generation: The index generation the tokens were read from.
+        tokens: An iterable of tokens.
+    """
+
+    def __init__(self, generation, tokens):
+        self.generation = generation
+        self.tokens = frozenset(tokens)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def candidates(self, words):
+        """Returns the first tokens among `words`, the set of the tokens of a text."""
+        candidates = Candidates(self.tokens.intersection(words))
+        candidates.generation = self.generation
+        return candidates
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import threading
+import time
+
+from .base import MultiTagger
+
+log = logging.getLogger('percolator_search')
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+DISABLED = 'disabled'
+
+
+class Warmup:
+    """
+    Warms a worker up before it's routed requests: percolates a representative text in every
+    domain, which also loads their prefilters and local matchers, locates its tags, looks up
+    their taxa and fetches the index statistics. ElasticSearch's caches and connections are
+    warmed along the way.
+
+    Warmup runs once per process, in the background. A failed warmup is logged, and run again
+    by the first `start()` after `retry_delay`.
+
+    Args:
+        registry: The `DomainRegistry` to warm up.
+        text_path: The file of the text to tag. Warmup is disabled if missing.
+        max_taxa (int): The maximum number of tags whose taxa are looked up, per domain.
+        retry_delay (float): How long to wait before retrying a failed warmup, in seconds.
+    """
+
+    def __init__(self, registry, text_path=None, max_taxa=100, retry_delay=10):
+        self.registry = registry
+        self.text_path = text_path
+        self.max_taxa = max_taxa
+        self.retry_delay = retry_delay
+        self.state = PENDING if text_path else DISABLED
+        self.error = None
+        self._failed = None  # Monotonic time of the last failure
+        self.timings = {}  # Seconds taken by each domain, and the statistics
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        """Whether the worker is warm, or warmup is disabled."""
+        return self.state in (DONE, DISABLED)
+
+    def status(self):
+        return {
+            'state': self.state,
+            'seconds': {name: round(seconds, 4) for name, seconds in self.timings.items()},
+            'error': self.error,
+        }
+
+    def _claim(self):
+        """Returns whether a warmup is due, marking it as running if so."""
+        with self._lock:
+            if self.state == FAILED:
+                if time.monotonic() - self._failed < self.retry_delay:
+                    return False
+            elif self.state != PENDING:
+                return False
+            self.state = RUNNING
+            return True
+
+    def _read_text(self):
+        with open(self.text_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def _finish(self, started, error=None):
+        if error is None:
+            log.info(f'Warmup done in {time.perf_counter() - started:.2f}s')
+            self.error = None
+            self.state = DONE
+        else:
+            log.warning('Warmup failed', exc_info=error)
+            self.error = str(error) or type(error).__name__
+            self._failed = time.monotonic()
+            self.state = FAILED
+
+    def run(self):
+        """Warms the registry up, see the class documentation."""
+        started = time.perf_counter()
+        try:
+            text = self._read_text()
+            for domain, tagger in self.registry.taggers.items():
+                start = time.perf_counter()
+                tags, = MultiTagger({domain: tagger}).percolate([(domain, text)])
+                mention_tagger = self.registry.mention_taggers.get(domain)
+                if mention_tagger is not None:
+                    mention_tagger.get_mentions(text, tags)
+                taxon_indexer = self.registry.get_taxon_indexer(domain)
+                if taxon_indexer is not None:
+                    taxon_indexer.get_taxa(list(tags)[:self.max_taxa])
+                    for tag in list(tags)[:1]:
+                        taxon_indexer.first(**{taxon_indexer.tag_field_name: tag})
+                self.timings[domain] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            if self.registry.stats.refresh():  # Unless a refresh is already running
+                self.timings['stats'] = time.perf_counter() - start
+        except Exception as exc:
+            self._finish(started, exc)
+        else:
+            self._finish(started)
+
+    async def run_async(self):
+        """Like `run()`, for a registry with an `AsyncElasticsearch` client."""
+        started = time.perf_counter()
+        try:
+            text = self._read_text()
+            for domain, tagger in self.registry.taggers.items():
+                start = time.perf_counter()
+                tags, = await MultiTagger({domain: tagger}).percolate_async([(domain, text)])
+                mention_tagger = self.registry.mention_taggers.get(domain)
+                if mention_tagger is not None:
+                    mention_tagger.get_mentions(text, tags)
+                taxon_indexer = self.registry.get_taxon_indexer(domain)
+                if taxon_indexer is not None:
+                    await taxon_indexer.get_taxa_async(list(tags)[:self.max_taxa])
+                    for tag in list(tags)[:1]:
+                        await taxon_indexer.first_async(**{taxon_indexer.tag_field_name: tag})
+                self.timings[domain] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            if await self.registry.stats.refresh_async():  # Unless a refresh is already running
+                self.timings['stats'] = time.perf_counter() - start
+        except Exception as exc:
+            self._finish(started, exc)
+        else:
+            self._finish(started)
+
+    def start(self):
+        """Starts warming up in a background thread, unless done or already running."""
+        if self._claim():
+            log.info('Warming up ...')
+            threading.Thread(target=self.run, name='warmup', daemon=True).start()
+
+    def start_async(self):
+        """Like `start()`, with a task of the running event loop."""
+        if self._claim():
+            log.info('Warming up ...')
+            asyncio.ensure_future(self.run_async())
@@ -39,9 +39,9 @@ def get_float_env_var(var_name, default=None):
         )
 
 
-def split_env_var(var_name, sep=','):
-    var = get_env_var(var_name)
-    return [e.strip() for e in var.split(sep)]
+def split_env_var(var_name, sep=',', default=None):
+    var = get_env_var(var_name, default)
+    return [e.strip() for e in var.split(sep) if e.strip()]
 
 
 DEBUG = False
@@ -57,3 +57,85 @@ TIKA_HOST = get_env_var('TIKA_HOST')
 TIKA_PORT = get_int_env_var('TIKA_PORT', 9998)
 TIKA_URL = f'http://{TIKA_HOST}:{TIKA_PORT}'
 TIKA_TIMEOUT = get_float_env_var('TIKA_TIMEOUT', 10)
+TIKA_CONNECT_TIMEOUT = get_float_env_var('TIKA_CONNECT_TIMEOUT', 3.05)
+TIKA_READ_TIMEOUT = get_float_env_var('TIKA_READ_TIMEOUT', TIKA_TIMEOUT)
+
+# Pooled HTTP client, for Tika and URL fetches
+HTTP_POOL_SIZE = get_int_env_var('HTTP_POOL_SIZE', 10)
+HTTP_RETRIES = get_int_env_var('HTTP_RETRIES', 2)
+HTTP_BACKOFF_FACTOR = get_float_env_var('HTTP_BACKOFF_FACTOR', 0.2)
+HTTP_KEEP_ALIVE = get_bool_env_var('HTTP_KEEP_ALIVE', 'yes')
+
+# Bulk indexing of percolator queries
+INDEXING_CHUNK_SIZE = get_int_env_var('INDEXING_CHUNK_SIZE', 500)
+INDEXING_THREAD_COUNT = get_int_env_var('INDEXING_THREAD_COUNT', 4)
+
+# Tag files, used by the in-process tagging engine
+DATA_DIR = ROOT_DIR / 'data'
+SPECIES_TAGS_PATH = get_env_var(
+    'SPECIES_TAGS_PATH', (DATA_DIR / 'speciesplus' / 'species.txt').as_posix()
+)
+COUNTRIES_TAGS_PATH = get_env_var(
+    'COUNTRIES_TAGS_PATH', (DATA_DIR / 'countries' / 'countries.txt').as_posix()
+)
+COUNTRIES_SYNONYMS_PATH = get_env_var(
+    'COUNTRIES_SYNONYMS_PATH', (DATA_DIR / 'countries' / 'countries_synonyms.txt').as_posix()
+)
+
+# Taxa are looked up in memory, unless TAXA_IN_MEMORY is off. Snapshots of the parsed taxa are
+# kept in TAXA_SNAPSHOT_DIR, for faster startup.
+TAXA_IN_MEMORY = get_bool_env_var('TAXA_IN_MEMORY', 'yes')
+SPECIES_TAXA_PATH = get_env_var(
+    'SPECIES_TAXA_PATH', (DATA_DIR / 'speciesplus' / 'taxa.csv').as_posix()
+)
+TAXA_SNAPSHOT_DIR = get_env_var('TAXA_SNAPSHOT_DIR', '') or None
+
+# Tagging results cache. The on-disk tier is disabled when TAG_CACHE_DIR is empty.
+TAG_CACHE_SIZE = get_int_env_var('TAG_CACHE_SIZE', 1024)
+TAG_CACHE_DIR = get_env_var('TAG_CACHE_DIR', '') or None
+TAG_CACHE_DIR_MAX_BYTES = get_int_env_var('TAG_CACHE_DIR_MAX_BYTES', 256 * 1024 * 1024)
+TAG_CACHE_GENERATION_TTL = get_float_env_var('TAG_CACHE_GENERATION_TTL', 10)
+
+# Percolation is skipped, or narrowed, for texts containing none or few of the first tokens of
+# the queries. Requires query indices built with the first tokens.
+PERCOLATE_PREFILTER = get_bool_env_var('PERCOLATE_PREFILTER', 'yes')
+
+# Tika extraction cache. Disabled when TIKA_CACHE_DIR is empty.
+TIKA_CACHE_DIR = get_env_var('TIKA_CACHE_DIR', '') or None
+TIKA_CACHE_MAX_BYTES = get_int_env_var('TIKA_CACHE_MAX_BYTES', 1024 * 1024 * 1024)
+
+# Documents fetched from URLs are streamed to Tika, unless URL_STREAMING is off
+URL_STREAMING = get_bool_env_var('URL_STREAMING', 'yes')
+URL_MAX_BYTES = get_int_env_var('URL_MAX_BYTES', 50 * 1024 * 1024)
+
+# How long /domains statistics are cached for, in seconds. They are then refreshed in the
+# background, the cached ones being served meanwhile.
+DOMAINS_STATS_TTL = get_float_env_var('DOMAINS_STATS_TTL', 60)
+
+# Workers percolate a sample text in every domain and look up its taxa at startup, and only
+# report ready once done, unless WARMUP is off
+WARMUP = get_bool_env_var('WARMUP', 'yes')
+WARMUP_TEXT_PATH = get_env_var(
+    'WARMUP_TEXT_PATH', (DATA_DIR / 'samples' / 'sample_species_doc.txt').as_posix()
+)
+# Latency budgets of the ElasticSearch and Tika checks of /ready, in seconds
+READY_ES_BUDGET = get_float_env_var('READY_ES_BUDGET', 0.5)
+READY_TIKA_BUDGET = get_float_env_var('READY_TIKA_BUDGET', 0.5)
+
+# Steps compacting the texts extracted by Tika before tagging (see percolator.core.compaction),
+# none if empty
+TEXT_COMPACTION = split_env_var(
+    'TEXT_COMPACTION', default='hyphenation,repeated_lines,non_linguistic,whitespace'
+)
+
+# Files uploaded to /tag/form are streamed to Tika while they're received, unless FORM_STREAMING
+# is off
+FORM_STREAMING = get_bool_env_var('FORM_STREAMING', 'yes')
+
+# Maximum size of /tag request bodies, once decompressed
+REQUEST_MAX_BYTES = get_int_env_var('REQUEST_MAX_BYTES', 64 * 1024 * 1024)
+# Responses are gzip-compressed for clients accepting it, from this size
+GZIP_MIN_BYTES = get_int_env_var('GZIP_MIN_BYTES', 1024)
+
+# Number of URLs fetched concurrently by /tag/batch
+BATCH_EXTRACTION_WORKERS = get_int_env_var('BATCH_EXTRACTION_WORKERS', 4)
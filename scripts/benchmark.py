@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks the tagging API and the tag and taxa file processing.
+
+    benchmark.py load [--url http://localhost:5000] [--tika http://localhost:9998] ...
+        Drives /tag (JSON, and gzipped plain text), /tag/url, /tag/form and /taxa at the given
+        concurrency, reporting latency percentiles and documents per second. The API must run
+        against ElasticSearch and a fake Tika server (scripts/fake_tika.py), which also serves
+        the documents for /tag/url.
+
+    benchmark.py micro [--repeat 5]
+        Times the parsing of the tag and taxa files.
+
+    benchmark.py compare OLD.json NEW.json [--threshold 0.1]
+        Compares two results files, exiting with status 1 on regressions above the threshold.
+
+The corpus is built from the files in data/samples, each repeated to the `--scales` sizes.
+Results are saved as JSON with `--output`, along with the commit they were measured on.
+"""
+import argparse
+import gzip
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import cycle, islice
+
+import requests
+
+from fake_tika import repeat_document
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES_DIR = os.path.join(ROOT_DIR, 'data', 'samples')
+TAXA_PATH = os.path.join(ROOT_DIR, 'data', 'speciesplus', 'taxa.csv')
+SPECIES_PATH = os.path.join(ROOT_DIR, 'data', 'speciesplus', 'species.txt')
+
+ENDPOINTS = ('tag', 'tag_plain', 'tag_url', 'tag_form', 'taxa')
+
+
+def build_corpus(samples_dir, scales):
+    """
+    Returns:
+        A list of `(name, repeat, data)` tuples, for each sample file and scale, in a stable
+        order. `data` is the sample repeated `repeat` times, as served by the fake Tika server.
+    """
+    corpus = []
+    for name in sorted(os.listdir(samples_dir)):
+        with open(os.path.join(samples_dir, name), 'rb') as f:
+            data = f.read()
+        for repeat in scales:
+            corpus.append((name, repeat, repeat_document(data, repeat)))
+    return corpus
+
+
+def taxa_names(taxa_path, count):
+    """Returns the scientific names of the first `count` taxa."""
+    names = []
+    with open(taxa_path, 'r') as f:
+        next(f)  # Header row
+        for line in islice(f, count):
+            names.append(line.split(';')[8])
+    return names
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an ordered list."""
+    if not ordered:
+        return None
+    rank = max(1, int(round(p / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'docs_per_second': len(latencies) / elapsed if elapsed else None,
+        'mean': statistics.mean(ordered) if ordered else None,
+        'p50': percentile(ordered, 50),
+        'p95': percentile(ordered, 95),
+        'p99': percentile(ordered, 99),
+    }
+
+
+def make_requests(endpoint, args, corpus, names):
+    """
+    Returns:
+        An endless iterator of functions each making a request to `endpoint` with the session
+        they're passed, and returning the response.
+    """
+    api = args.url.rstrip('/')
+    params = {'domains': args.domains} if args.domains else {}
+    if endpoint == 'tag':
+        payloads = [
+            dict(params, text=data.decode('utf-8', errors='replace')) for _, _, data in corpus
+        ]
+        return (
+            lambda session, p=p: session.post(f'{api}/tag', json=p) for p in cycle(payloads)
+        )
+    if endpoint == 'tag_plain':
+        bodies = [
+            gzip.compress(data.decode('utf-8', errors='replace').encode('utf-8'))
+            for _, _, data in corpus
+        ]
+        headers = {'Content-Type': 'text/plain; charset=utf-8', 'Content-Encoding': 'gzip'}
+        return (
+            lambda session, b=b: session.post(f'{api}/tag', params=params, data=b, headers=headers)
+            for b in cycle(bodies)
+        )
+    if endpoint == 'tag_url':
+        tika = args.tika.rstrip('/')
+        payloads = [
+            dict(params, url=f'{tika}/documents/{name}?repeat={repeat}')
+            for name, repeat, _ in corpus
+        ]
+        return (
+            lambda session, p=p: session.post(f'{api}/tag/url', json=p) for p in cycle(payloads)
+        )
+    if endpoint == 'tag_form':
+        fields = {'source': 'file'}
+        if args.domains:
+            fields['domains'] = args.domains
+        return (
+            lambda session, name=name, data=data: session.post(
+                f'{api}/tag/form', data=fields, files={'file': (name, data)}
+            )
+            for name, _, data in cycle(corpus)
+        )
+    return (
+        lambda session, name=name: session.get(
+            f'{api}/taxa', params={'domain': 'speciesplus', 'scientific_name': name}
+        )
+        for name in cycle(names)
+    )
+
+
+def run_load(endpoint, args, corpus, names):
+    """Makes `args.requests` requests to `endpoint`, from `args.concurrency` threads."""
+    local = threading.local()
+
+    def send(make_request):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = make_request(session)
+            ok = response.status_code < 400 or (endpoint == 'taxa' and response.status_code == 404)
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    calls = make_requests(endpoint, args, corpus, names)
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(send, islice(calls, args.warmup)))
+
+        start = time.perf_counter()
+        results = list(executor.map(send, islice(calls, args.requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, ok in results if ok]
+    return summarize(latencies, len(results) - len(latencies), elapsed)
+
+
+def time_calls(func, repeat):
+    """Calls `func` `repeat` times, returning timing statistics in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        'repeat': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'max': max(timings),
+    }
+
+
+def run_micro(args):
+    from percolator.search import SpeciesQueryIndexer, SpeciesTaxonIndexer
+
+    query_indexer = SpeciesQueryIndexer(client=None)
+    taxon_indexer = SpeciesTaxonIndexer(client=None)
+    species = query_indexer._read_tags(SPECIES_PATH)
+    return {
+        'read_tags': time_calls(lambda: query_indexer._read_tags(SPECIES_PATH), args.repeat),
+        'species_synonyms': time_calls(lambda: query_indexer._synonyms(species), args.repeat),
+        'read_taxa': time_calls(lambda: list(taxon_indexer._read_taxa(TAXA_PATH)), args.repeat),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(path, args, kind, results):
+    data = {
+        'kind': kind,
+        'commit': git_commit(),
+        'date': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': platform.python_version(),
+        'options': {k: v for k, v in vars(args).items() if k not in ('func', 'output')},
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def print_results(results):
+    for name, stats in results.items():
+        cells = [f'{k}={v:.4f}' if isinstance(v, float) else f'{k}={v}' for k, v in stats.items()]
+        print(f'{name:20} ' + ' '.join(cells))
+
+
+def load(args):
+    endpoints = args.endpoints.split(',')
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit(f'Unknown endpoints: {", ".join(sorted(unknown))}')
+
+    corpus = build_corpus(args.samples, [int(s) for s in args.scales.split(',')])
+    names = taxa_names(TAXA_PATH, 1000)
+    results = {}
+    for endpoint in endpoints:
+        results[endpoint] = run_load(endpoint, args, corpus, names)
+        print_results({endpoint: results[endpoint]})
+    return results
+
+
+def micro(args):
+    results = run_micro(args)
+    print_results(results)
+    return results
+
+
+# Lower is better for these statistics, higher for `docs_per_second`
+COMPARED_STATS = {'load': ('p50', 'p95', 'p99', 'docs_per_second'), 'micro': ('median',)}
+
+
+def compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if old['kind'] != new['kind']:
+        raise SystemExit('Results of different kinds can\'t be compared')
+
+    regressions = 0
+    print(f'{old["commit"]} -> {new["commit"]}')
+    for name in sorted(set(old['results']) & set(new['results'])):
+        for stat in COMPARED_STATS[new['kind']]:
+            before, after = old['results'][name][stat], new['results'][name][stat]
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            regressed = -change if stat == 'docs_per_second' else change
+            flag = ''
+            if regressed > args.threshold:
+                regressions += 1
+                flag = '  REGRESSION'
+            print(f'{name:20} {stat:16} {before:12.4f} {after:12.4f} {change:+8.1%}{flag}')
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    subparsers = parser.add_subparsers()
+
+    load_parser = subparsers.add_parser('load', help='Load-test the API')
+    load_parser.add_argument('--url', default='http://localhost:5000', help='The API URL')
+    load_parser.add_argument(
+        '--tika', default='http://localhost:9998', help='The fake Tika URL, serving documents'
+    )
+    load_parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    load_parser.add_argument('--domains', default='', help='Comma-separated domains to tag')
+    load_parser.add_argument('--concurrency', type=int, default=8)
+    load_parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    load_parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests first')
+    load_parser.add_argument('--samples', default=SAMPLES_DIR, help='The corpus samples directory')
+    load_parser.add_argument(
+        '--scales', default='1,10,100', help='Comma-separated repetitions of each sample'
+    )
+    load_parser.add_argument('--output', help='Save the results to this JSON file')
+    load_parser.set_defaults(func=load)
+
+    micro_parser = subparsers.add_parser('micro', help='Time the tag and taxa file processing')
+    micro_parser.add_argument('--repeat', type=int, default=5)
+    micro_parser.add_argument('--output', help='Save the results to this JSON file')
+    micro_parser.set_defaults(func=micro)
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two results files')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument(
+        '--threshold', type=float, default=0.1, help='Tolerated relative change'
+    )
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    if not hasattr(args, 'func'):
+        parser.error('A command is required')
+    results = args.func(args)
+    if getattr(args, 'output', None):
+        save_results(args.output, args, args.func.__name__, results)
+        print(f'Results saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+Local stand-in for Tika, for benchmarks: `PUT /rmeta/text` answers like Tika, with the request
+body decoded as UTF-8 text. It also serves the benchmark documents, for `/tag/url`:
+`GET /documents/NAME?repeat=N` returns the file NAME of the documents directory, N times over.
+`GET /tika` answers the API's readiness checks.
+
+Usage: fake_tika.py [--port 9998] [--delay SECONDS] [--documents data/samples]
+
+Point the API at it with TIKA_HOST=localhost and TIKA_PORT.
+"""
+import argparse
+import json
+import os
+import socketserver
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+
+def repeat_document(data, repeat):
+    """Returns the content of a benchmark document, see `benchmark.build_corpus()`."""
+    return b'\n'.join([data] * repeat)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeTikaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like Tika
+    delay = 0
+    documents_dir = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b''.join(chunks)
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        body = self._read_body()
+        if urlsplit(self.path).path != '/rmeta/text':
+            return self._send(404, b'Not found', 'text/plain')
+
+        if self.delay:
+            time.sleep(self.delay)
+        content = body.decode('utf-8', errors='replace')
+        metadata = [{'Content-Type': 'text/plain', 'X-TIKA:content': content}]
+        self._send(200, json.dumps(metadata).encode('utf-8'), 'application/json')
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/tika':
+            return self._send(200, b'This is a fake Tika Server.', 'text/plain')
+        name = os.path.basename(unquote(url.path[len('/documents/'):]))
+        if not url.path.startswith('/documents/') or self.documents_dir is None or not name:
+            return self._send(404, b'Not found', 'text/plain')
+
+        try:
+            with open(os.path.join(self.documents_dir, name), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return self._send(404, b'Not found', 'text/plain')
+        repeat = int(parse_qs(url.query).get('repeat', ['1'])[0])
+        self._send(200, repeat_document(data, repeat), 'text/plain; charset=utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9998)
+    parser.add_argument('--delay', type=float, default=0, help='Extraction delay, in seconds')
+    parser.add_argument('--documents', default='data/samples', help='The documents directory')
+    args = parser.parse_args()
+
+    FakeTikaHandler.delay = args.delay
+    FakeTikaHandler.documents_dir = args.documents
+    server = ThreadingHTTPServer((args.host, args.port), FakeTikaHandler)
+    print(f'Fake Tika listening on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+"""
+Compares the tags found by the in-process engine with those found by ElasticSearch percolation,
+for every domain with a local tagger. Exits with status 1 if any document's tags differ.
+
+Usage: local_parity.py FILE [FILE ...]
+"""
+import sys
+import logging
+from elasticsearch_dsl.connections import connections
+from percolator.conf import settings
+from percolator.search import TAG_DOMAINS
+
+logging.basicConfig()
+log = logging.getLogger('percolator_search')
+log.setLevel(logging.WARNING)
+
+client = connections.create_connection(hosts=settings.ELASTICSEARCH_HOSTS, timeout=20)
+domains = [d for d in TAG_DOMAINS.values() if d.local_tagger is not None]
+
+mismatches = 0
+for path in sys.argv[1:]:
+    with open(path, 'r') as f:
+        text = f.read()
+
+    for domain in domains:
+        indexer = domain.query_indexer(client=client)
+        es_tags = set(domain.tagger(indexer=indexer).get_tags(text=text))
+        local_tags = set(domain.local_tagger(indexer=indexer).get_tags(text=text))
+
+        if es_tags == local_tags:
+            print(f'{path:40} {domain.name:15} OK ({len(es_tags)} tags)')
+            continue
+
+        mismatches += 1
+        print(f'{path:40} {domain.name:15} MISMATCH')
+        for tag in sorted(es_tags - local_tags):
+            print(f'    only in ElasticSearch: {tag}')
+        for tag in sorted(local_tags - es_tags):
+            print(f'    only in local engine:  {tag}')
+
+sys.exit(1 if mismatches else 0)
@@ -11,6 +11,10 @@ log = logging.getLogger('percolator_search')
 log.setLevel(logging.INFO)
 
 client = connections.create_connection(hosts=settings.ELASTICSEARCH_HOSTS, timeout=20)
-indexer = CountryQueryIndexer(client=client)
+indexer = CountryQueryIndexer(
+    client=client,
+    chunk_size=settings.INDEXING_CHUNK_SIZE,
+    thread_count=settings.INDEXING_THREAD_COUNT,
+)
 if len(sys.argv) > 2:
     indexer.index_queries(countries_path=sys.argv[1], synonyms_path=sys.argv[2])
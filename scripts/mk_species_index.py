@@ -11,6 +11,10 @@ log = logging.getLogger('percolator_search')
 log.setLevel(logging.INFO)
 
 client = connections.create_connection(hosts=settings.ELASTICSEARCH_HOSTS, timeout=20)
-indexer = SpeciesQueryIndexer(client=client)
+indexer = SpeciesQueryIndexer(
+    client=client,
+    chunk_size=settings.INDEXING_CHUNK_SIZE,
+    thread_count=settings.INDEXING_THREAD_COUNT,
+)
 if len(sys.argv) > 1:
     indexer.index_queries(tags_path=sys.argv[1])
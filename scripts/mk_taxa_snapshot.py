@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+
+import logging
+from percolator.conf import settings
+from percolator.search.species import SpeciesTaxonIndexer
+
+logging.basicConfig()
+log = logging.getLogger('percolator_search')
+log.setLevel(logging.INFO)
+
+if not settings.TAXA_SNAPSHOT_DIR:
+    raise SystemExit('Set the TAXA_SNAPSHOT_DIR environment variable')
+
+SpeciesTaxonIndexer(client=None).table
@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+os.environ.setdefault('PERCOLATOR_SETTINGS_MODULE', 'percolator.settings.base')
+os.environ.setdefault('ELASTICSEARCH_HOSTS', 'localhost')
+os.environ.setdefault('TIKA_HOST', 'localhost')
+os.environ.setdefault('WARMUP', 'no')
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """A test client of the WSGI app, tagging all the domains with their local taggers."""
+    from apistar import test
+    from percolator.api import app, components
+    from percolator.api.components import DomainRegistryComponent
+
+    registry = next(c for c in components if isinstance(c, DomainRegistryComponent)).registry
+    monkeypatch.setattr(registry, 'taggers', dict(registry.mention_taggers))
+    return test.TestClient(app)
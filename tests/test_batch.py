@@ -0,0 +1,33 @@
+"""Tests of `/tag/batch`, tagging with the local taggers."""
+
+
+def test_unreachable_url(client):
+    documents = [
+        {'text': 'Lions (Panthera leo)'},
+        {'url': 'http://127.0.0.1:1/document.pdf'},
+        {'url': 'not a url'},
+    ]
+    response = client.post('/tag/batch', json={'documents': documents, 'domains': ['speciesplus']})
+    assert response.status_code == 200
+    tags, unreachable, invalid = response.json()
+    assert 'Panthera leo' in tags['speciesplus']
+    assert unreachable == {'error': 'Document could not be fetched'}
+    assert invalid == {'error': 'Document could not be fetched'}
+
+
+def test_unreachable_url_alone(client):
+    response = client.post('/tag/url', json={'url': 'http://127.0.0.1:1/document.pdf'})
+    assert response.status_code == 500
+    assert response.text == 'Document could not be fetched'
+
+
+def test_local_tagging_latency_by_domain(client):
+    response = client.post('/tag/batch', json={
+        'documents': [{'text': 'Lions (Panthera leo)'}], 'domains': ['speciesplus']
+    })
+    assert response.status_code == 200
+    metrics = client.get('/metrics').text
+    assert (
+        'percolator_stage_duration_seconds_count{stage="local_tagging",domain="speciesplus"}'
+        in metrics
+    )
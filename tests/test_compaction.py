@@ -0,0 +1,58 @@
+"""Tests of the compaction of extracted texts."""
+from percolator.api import views
+from percolator.core.compaction import PAGE_LINES, compact_text, drop_repeated_lines
+
+
+WORDS = 'lions tigers bears wolves foxes owls'.split()
+
+
+def body(number):
+    """Paragraphs of a page, differing from page to page."""
+    return [f'Paragraph {chr(ord("a") + number)} about {word}' for word in WORDS]
+
+
+def page(number, lines=None):
+    return '\n'.join(['CITES Review', *(lines or body(number)), f'Page {number}'])
+
+
+def test_page_edge_lines():
+    pages = [page(i, body(i)[:3] + ['CITES Review'] + body(i)[3:]) for i in range(1, 5)]
+    compacted = drop_repeated_lines('\f'.join(pages)).split('\f')
+    assert compacted[0] == pages[0]
+    assert compacted[1] == '\n'.join(body(2)[:3] + ['CITES Review'] + body(2)[3:])
+
+
+def test_page_count_threshold():
+    pages = [page(i) for i in range(1, 4)] + ['\n'.join(body(i)) for i in range(4, 9)]
+    text = '\f'.join(pages)
+    assert drop_repeated_lines(text) == text  # Headers and footers on 3 pages of 8
+
+
+def test_table_cells_are_kept():
+    rows = ['Panthera leo', 'Endangered', 'Loxodonta africana', 'Endangered'] * 5
+    text = '\n'.join(rows)
+    assert drop_repeated_lines(text) == text
+
+
+def test_spread_lines():
+    lines = []
+    for number in range(1, 4):
+        lines += ['Annual Report', *[f'Line {i} of the page text' for i in range(PAGE_LINES)]]
+    text = '\n'.join(lines)
+    assert drop_repeated_lines(text).count('Annual Report') == 1
+
+
+def test_compact_text():
+    text = 'Lions are conser-\nvation   priorities.\n\n42 %\nEnd'
+    assert compact_text(text) == 'Lions are conservation priorities.\nEnd'
+
+
+def test_mentions_of_the_document(client, monkeypatch):
+    document = '\f'.join(page(i, ['  Panthera leo\tprides', *body(i)]) for i in range(1, 4))
+    monkeypatch.setattr(views, 'extract_text_from_url', lambda *args, **kwargs: document)
+    params = {'url': 'http://example.com', 'domains': ['speciesplus'], 'mentions': True}
+    response = client.post('/tag/url', json=params)
+    assert response.status_code == 200
+    mentions = response.json()['speciesplus']['Panthera leo']
+    assert mentions['count'] == 3
+    assert {document[start:end] for start, end in mentions['offsets']} == {'Panthera leo'}
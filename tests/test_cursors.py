@@ -0,0 +1,55 @@
+"""Tests of `/tag` paging with cursors, which are read back from clients."""
+import base64
+import json
+
+import pytest
+
+from percolator.api.cursors import CURSOR_VERSION, encode_cursor, params_digest, text_digest
+
+TEXT = 'Afghanistan, Albania, Algeria, Andorra, Angola and Argentina.'
+PARAMS = dict(min_score=None, constant_score=True, limit=2)
+
+
+def tag_page(client, cursor='', **params):
+    body = dict(text=TEXT, domains=['countries'], cursor=cursor, limit=2, **params)
+    return client.post('/tag', json=body)
+
+
+def forge_cursor(positions, text=TEXT, params=PARAMS):
+    state = {
+        'v': CURSOR_VERSION, 'd': text_digest(text), 'q': params_digest(params), 'p': positions
+    }
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode().rstrip('=')
+
+
+def test_pages(client):
+    tags, cursor = [], ''
+    while cursor is not None:
+        response = tag_page(client, cursor)
+        assert response.status_code == 200
+        tags += response.json()['tags']['countries']
+        cursor = response.json()['cursor']
+    assert len(tags) == 6
+
+
+@pytest.mark.parametrize('after', [None, 2, '2', [], ['2'], [True], [-1], [2, 'x'], {'0': 2}])
+def test_malformed_positions(client, after):
+    response = tag_page(client, forge_cursor({'countries': after}))
+    assert response.status_code == 400
+    assert response.json() == {'cursor': 'Malformed cursor'}
+
+
+def test_other_params(client):
+    cursor = tag_page(client).json()['cursor']
+    for params in [dict(constant_score=False), dict(min_score=1.0), dict(limit=3)]:
+        body = dict(text=TEXT, domains=['countries'], cursor=cursor, limit=2)
+        response = client.post('/tag', json=dict(body, **params))
+        assert response.status_code == 400
+        assert 'other scoring or paging parameters' in response.json()['cursor']
+
+
+def test_other_text(client):
+    cursor = encode_cursor('Another text', {'countries': [2]}, PARAMS)
+    response = tag_page(client, cursor)
+    assert response.status_code == 400
+    assert response.json() == {'cursor': 'The cursor was made for another text'}
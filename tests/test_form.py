@@ -0,0 +1,82 @@
+"""
+Tests of `/tag/form` with streamed forms (`FORM_STREAMING`). ElasticSearch and Tika are left
+out: domains are tagged with their local taggers, and uploaded files are "extracted" as is.
+"""
+import pytest
+
+from percolator.api import components, views
+from percolator.api.components import MultiPartParserComponent
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    parser = next(c for c in components if isinstance(c, MultiPartParserComponent))
+    monkeypatch.setattr(parser, 'streaming', True)
+    monkeypatch.setattr(
+        views, 'extract_text', lambda source, cache, http_client: source.read().decode('utf-8')
+    )
+    return client
+
+
+def multipart(*parts, boundary='percolator-boundary'):
+    """Encodes `(name, value)` fields, and `(name, filename, data)` files, in order."""
+    body = b''
+    for name, *rest in parts:
+        body += f'--{boundary}\r\n'.encode()
+        if len(rest) == 1:
+            body += f'Content-Disposition: form-data; name="{name}"\r\n\r\n'.encode()
+            body += rest[0].encode() + b'\r\n'
+        else:
+            filename, data = rest
+            body += (
+                f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'
+            ).encode()
+            body += data + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode()
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+DOCUMENT = b'Lions (Panthera leo) are found in Afghanistan, and in Albania.'
+
+
+def test_file_before_fields(client):
+    body, headers = multipart(
+        ('file', 'document.txt', DOCUMENT), ('source', 'file'), ('domains', 'speciesplus')
+    )
+    response = client.post('/tag/form', data=body, headers=headers)
+    assert response.status_code == 200
+    assert list(response.json()) == ['speciesplus']
+    assert 'Panthera leo' in response.json()['speciesplus']
+
+
+def test_fields_before_file(client):
+    body, headers = multipart(
+        ('source', 'file'), ('domains', 'countries'), ('file', 'document.txt', DOCUMENT)
+    )
+    response = client.post('/tag/form', data=body, headers=headers)
+    assert response.status_code == 200
+    assert set(response.json()['countries']) == {'Afghanistan', 'Albania'}
+
+
+def test_text_source(client):
+    body, headers = multipart(
+        ('source', 'text'), ('text', DOCUMENT.decode()), ('domains', 'speciesplus')
+    )
+    response = client.post('/tag/form', data=body, headers=headers)
+    assert response.status_code == 200
+    assert 'Panthera leo' in response.json()['speciesplus']
+
+
+def test_missing_file(client):
+    body, headers = multipart(('source', 'file'))
+    response = client.post('/tag/form', data=body, headers=headers)
+    assert response.status_code == 400
+    assert 'file' in response.json()
+
+
+@pytest.mark.parametrize('boundary', ['', 'x' * 300])
+def test_invalid_boundary(client, boundary):
+    headers = {'Content-Type': f'multipart/form-data; boundary="{boundary}"'}
+    response = client.post('/tag/form', data=b'--x--\r\n', headers=headers)
+    assert response.status_code == 400
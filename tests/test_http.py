@@ -0,0 +1,154 @@
+"""Tests of the retries of the HTTP clients, against a local server."""
+import asyncio
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import aiohttp
+import pytest
+import requests
+from urllib3.connection import HTTPConnection
+
+from percolator.core.aio import AsyncHTTPClient
+from percolator.core.http import HTTPClient
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        time.sleep(0.5)
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def slow_url():
+    SlowHandler.requests = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def closed_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}/'
+
+
+@pytest.fixture
+def reset_url():
+    """A server resetting the connections once it has read the request, counting them."""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(5)
+    resets = []
+
+    def serve():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            connection.recv(65536)
+            resets.append(connection.getpeername())
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            connection.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f'http://127.0.0.1:{server.getsockname()[1]}/', resets
+    server.close()
+
+
+def test_read_timeouts_arent_retried(slow_url):
+    client = HTTPClient(read_timeout=0.1, retries=2, backoff_factor=0)
+    with pytest.raises(requests.ReadTimeout):
+        client.get(slow_url)
+    assert SlowHandler.requests == 1
+
+
+def test_connection_errors_are_retried(closed_url, monkeypatch):
+    client = HTTPClient(retries=2, backoff_factor=0)
+    attempts = []
+    new_conn = HTTPConnection._new_conn
+
+    def counted_new_conn(self):
+        attempts.append(self)
+        return new_conn(self)
+
+    monkeypatch.setattr(HTTPConnection, '_new_conn', counted_new_conn)
+    with pytest.raises(requests.ConnectionError):
+        client.get(closed_url)
+    assert len(attempts) == 3
+
+
+def test_resets_are_retried(reset_url):
+    url, resets = reset_url
+    client = HTTPClient(retries=2, backoff_factor=0)
+    with pytest.raises(requests.ConnectionError):
+        client.put(url, data=b'document')
+    assert len(resets) == 3
+
+
+def test_async_read_timeouts_arent_retried(slow_url):
+    async def get():
+        client = AsyncHTTPClient(read_timeout=0.1, retries=2, backoff_factor=0)
+        try:
+            await client.get(slow_url)
+        finally:
+            await client.session.close()
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.get_event_loop().run_until_complete(get())
+    assert SlowHandler.requests == 1
+
+
+def test_async_connection_errors_are_retried(closed_url, monkeypatch):
+    client = AsyncHTTPClient(retries=2, backoff_factor=0)
+    attempts = []
+    request = aiohttp.ClientSession.request
+
+    def counted_request(self, *args, **kwargs):
+        attempts.append(args)
+        return request(self, *args, **kwargs)
+
+    async def get():
+        try:
+            await client.get(closed_url)
+        finally:
+            await client.session.close()
+
+    monkeypatch.setattr(aiohttp.ClientSession, 'request', counted_request)
+    with pytest.raises(aiohttp.ClientConnectorError):
+        asyncio.get_event_loop().run_until_complete(get())
+    assert len(attempts) == 3
+
+
+def test_async_resets_are_retried(reset_url):
+    url, resets = reset_url
+
+    async def put():
+        client = AsyncHTTPClient(retries=2, backoff_factor=0)
+        try:
+            await client.put(url, data=b'document')
+        finally:
+            await client.session.close()
+
+    with pytest.raises(aiohttp.ClientError):
+        asyncio.get_event_loop().run_until_complete(put())
+    assert len(resets) == 3
@@ -0,0 +1,117 @@
+"""
+Tests of the in-process taggers, whose results must be those of ElasticSearch percolation.
+The expected tags are what the domains' analyzers and `match_phrase` queries match.
+"""
+import pytest
+
+from percolator.conf import settings
+from percolator.search import (
+    CountryLocalTagger,
+    CountryQueryIndexer,
+    SpeciesLocalTagger,
+    SpeciesQueryIndexer,
+)
+from percolator.search.local import BaseLocalTagger, PhraseMatcher, tags_with_mentions
+
+
+@pytest.fixture(scope='module')
+def matcher():
+    matcher = PhraseMatcher()
+    for phrase in ['a b', 'a b c', 'b c d', 'c', 'x']:
+        matcher.add(tuple(phrase.split()), phrase)
+    matcher.add(('x',), 'another x')
+    matcher.build()
+    return matcher
+
+
+def test_find(matcher):
+    assert sorted(matcher.find('a b c d'.split())) == [
+        (0, 2, 'a b'), (0, 3, 'a b c'), (1, 4, 'b c d'), (2, 3, 'c')
+    ]
+
+
+def test_find_longest(matcher):
+    assert list(matcher.find_longest('a b c d'.split())) == [(0, 3, 'a b c')]
+    assert list(matcher.find_longest('b c d a b'.split())) == [(0, 3, 'b c d'), (3, 5, 'a b')]
+    assert list(matcher.find_longest('a x c'.split())) == [
+        (1, 2, 'x'), (1, 2, 'another x'), (2, 3, 'c')
+    ]
+
+
+@pytest.fixture(scope='module')
+def species_tagger():
+    return SpeciesLocalTagger(indexer=SpeciesQueryIndexer(client=None))
+
+
+@pytest.mark.parametrize('text, tags', [
+    # Species sharing the `p leo` abbreviation match each other
+    ('Lions (Panthera leo)', {'Panthera leo', 'Pterichis leo'}),
+    ('P. leo', {'Panthera leo', 'Pterichis leo'}),
+    # Nested names are consumed by the longest one
+    ('Panthera leo persica', {'Panthera leo persica'}),
+    ('P. leo persica', {'Panthera leo persica'}),
+    # So are overlapping names, by the leftmost one
+    ('Tayassu pecari tajacu', {'Tayassu pecari'}),
+    ('Pecari tajacu', {'Pecari tajacu'}),
+])
+def test_species_tags(species_tagger, text, tags):
+    assert set(species_tagger.get_tags(text)) == tags
+
+
+def test_species_mentions(species_tagger):
+    text = 'Lions (Panthera leo persica), or P. leo'
+    tags = species_tagger.get_tags(text)
+    assert species_tagger.get_mentions(text, tags) == {
+        'Panthera leo persica': [(7, 27)],  # Not `Panthera leo`, nor `P. leo` at (7, 19)
+        'Panthera leo': [(33, 39)],
+        'Pterichis leo': [(33, 39)],
+    }
+
+
+def test_tags_with_mentions(species_tagger):
+    text = 'Panthera leo persica'
+    tags = {'Panthera leo persica': 1.0, 'Panthera onca': 1.0}
+    assert tags_with_mentions(tags, species_tagger.get_mentions(text, tags)) == {
+        'Panthera leo persica': {'score': 1.0, 'count': 1, 'offsets': [(0, 20)]},
+        'Panthera onca': {'score': 1.0, 'count': None, 'offsets': None},
+    }
+
+
+@pytest.fixture(scope='module')
+def country_tagger():
+    return CountryLocalTagger(indexer=CountryQueryIndexer(client=None))
+
+
+@pytest.mark.parametrize('text, tags', [
+    # Country names aren't autophrased: `match_phrase` queries match nested names too
+    ('Papua New Guinea', {'Papua New Guinea', 'Guinea'}),
+    ('Niger and Nigeria', {'Niger', 'Nigeria'}),
+    # Synonyms are replaced with the country name
+    ('Guinée équatoriale', {'Equatorial Guinea', 'Guinea'}),
+])
+def test_country_tags(country_tagger, text, tags):
+    assert set(country_tagger.get_tags(text)) == tags
+
+
+def test_country_mentions(country_tagger):
+    text = 'Papua New Guinea'
+    assert country_tagger.get_mentions(text) == {
+        'Papua New Guinea': [(0, 16)],
+        'Guinea': [(0, 16)],  # Synonym replacements span the whole replaced phrase
+    }
+
+
+def test_generation_follows_the_tag_files(tmp_path, monkeypatch):
+    path = tmp_path / 'species.txt'
+    monkeypatch.setattr(settings, 'SPECIES_TAGS_PATH', str(path))
+    generations = []
+    for species in ['Panthera leo\n', 'Panthera leo\nPanthera onca\n', 'Panthera leo\n']:
+        path.write_text(species)
+        monkeypatch.setattr(BaseLocalTagger, '_shared', {})  # A new process
+        tagger = SpeciesLocalTagger(indexer=SpeciesQueryIndexer(client=None))
+        generations.append(tagger.generation())
+        assert tagger.generation() == generations[-1]
+        assert bool(tagger.get_tags('Panthera onca')) == ('onca' in species)
+
+    assert generations[0] != generations[1]
+    assert generations[0] == generations[2]
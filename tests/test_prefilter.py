@@ -0,0 +1,66 @@
+"""Tests of percolation prefiltering, with a stand-in ElasticSearch client."""
+import pytest
+
+from percolator.search import SpeciesQueryIndexer, SpeciesTagger
+from percolator.search.base import BaseTagger
+
+
+class FakeIndices:
+    def __init__(self, live):
+        self.live = live
+
+    def get_alias(self, name, ignore=None):
+        return {self.live: {'aliases': {name: {}}}}
+
+
+class FakeClient:
+    """Answers the alias and first tokens lookups, with the tokens of each generation."""
+
+    def __init__(self, live, tokens):
+        self.indices = FakeIndices(live)
+        self.tokens = tokens
+        self.searched = []
+
+    def search(self, index, body):
+        index, = index
+        self.searched.append(index)
+        buckets = [{'key': token, 'doc_count': 1} for token in self.tokens[index]]
+        return {
+            'hits': {'total': len(buckets)},
+            'aggregations': {
+                'tokens': {'buckets': buckets, 'sum_other_doc_count': 0},
+                'missing': {'doc_count': 0},
+            },
+        }
+
+
+@pytest.fixture
+def tagger(monkeypatch):
+    monkeypatch.setattr(BaseTagger, '_prefilters', {})
+    client = FakeClient(
+        'species_percolator-2',
+        {'species_percolator-1': ['panthera'], 'species_percolator-2': ['loxodonta']},
+    )
+    return SpeciesTagger(indexer=SpeciesQueryIndexer(client=client))
+
+
+def test_live_generation(tagger):
+    prefilter = tagger.get_prefilter()
+    assert prefilter.generation == 'species_percolator-2'
+    assert tagger.get_prefilter() is prefilter
+    assert tagger.client.searched == ['species_percolator-2']
+
+
+def test_given_generation(tagger):
+    tagger.get_prefilter()
+    prefilter = tagger.get_prefilter('species_percolator-1')
+    assert prefilter.generation == 'species_percolator-1'
+    assert prefilter.candidates({'panthera', 'leo'}) == {'panthera'}
+    assert tagger.client.searched == ['species_percolator-2', 'species_percolator-1']
+
+
+def test_percolates_the_prefilter_generation(tagger):
+    candidates = tagger.get_prefilter('species_percolator-1').candidates({'panthera', 'leo'})
+    s = tagger._search_query('Panthera leo', candidates=candidates)
+    assert s._index == ['species_percolator-1']
+    assert tagger._search_query('Panthera leo')._index == [tagger.index]
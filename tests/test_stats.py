@@ -0,0 +1,39 @@
+"""Tests of the index statistics cache, whose refreshes must never overlap."""
+import threading
+
+from percolator.search.cache import IndexStatsCache
+
+
+class BlockingIndices:
+    """Answers `_stats` requests once `release` is set."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def stats(self, **params):
+        self.calls += 1
+        assert self.release.wait(5)
+        return {'indices': {}}
+
+
+class FakeClient:
+    def __init__(self):
+        self.indices = BlockingIndices()
+
+
+def test_forced_refresh_waits_its_turn():
+    client = FakeClient()
+    stats = IndexStatsCache(client, {}, ttl=60)
+    stats.get()  # Starts a background refresh
+    assert stats.refresh() is False
+    assert client.indices.calls <= 1
+
+    client.indices.release.set()
+    for thread in threading.enumerate():
+        if thread.name == 'index-stats-refresh':
+            thread.join()
+    assert client.indices.calls == 1
+    assert stats.refresh() is True  # Not due, but forced
+    assert client.indices.calls == 2
+    assert stats.get() == {}
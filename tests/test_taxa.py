@@ -0,0 +1,43 @@
+"""Tests of the in-memory taxa lookups, which must answer like ElasticSearch `term` queries."""
+from percolator.search.taxa import TaxonTable, analyze
+
+FIELD_NAMES = ('genus', 'scientific_name', 'author')
+TAXA = [
+    {'genus': 'panthera', 'scientific_name': 'panthera_leo', 'author': '(Linnaeus, 1758)'},
+    {'genus': 'panthera', 'scientific_name': 'panthera_onca', 'author': "(L'Héritier, 1758)"},
+]
+
+
+def test_analyze():
+    assert analyze("(L'Héritier, 1758)") == ["l'héritier", '1758']
+    assert analyze('panthera_leo') == ['panthera_leo']
+
+
+def test_table_lookups():
+    table = TaxonTable.from_taxa(FIELD_NAMES, TAXA)
+    assert table.first(scientific_name='panthera_leo') == TAXA[0]
+    assert table.first(author='linnaeus') == TAXA[0]
+    assert table.first(author='Linnaeus') is None  # Terms aren't analyzed
+    assert table.first(author='(Linnaeus, 1758)') is None
+    assert table.search(genus='panthera', author='1758') == TAXA
+    assert table.first(unknown='panthera') is None
+    assert table.search(genus='panthera', unknown='panthera') == []
+
+
+def test_taxa_endpoint(client):
+    params = {'domain': 'speciesplus', 'scientific_name': 'Panthera leo'}
+    response = client.get('/taxa', params=params)
+    assert response.status_code == 200
+    assert response.json()['author'] == '(Linnaeus, 1758)'
+
+    response = client.get('/taxa', params={'domain': 'speciesplus', 'foo': 'bar'})
+    assert response.status_code == 404
+
+
+def test_taxa_batch_unknown_field(client):
+    queries = ['Panthera leo', {'foo': 'bar'}]
+    response = client.post('/taxa/batch', json={'domain': 'speciesplus', 'queries': queries})
+    assert response.status_code == 200
+    results = response.json()
+    assert results['Panthera leo']['scientific_name'] == 'panthera_leo'
+    assert results['foo=bar'] == {'error': 'Unknown fields: foo'}